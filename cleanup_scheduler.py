@@ -16,7 +16,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fetchVideoProject.settings')
 import django
 django.setup()
 
-from fetchVideoApp.session_manager import SessionTempManager, VideoCacheManager
+from fetchVideoApp.reaper import CleanupReaper
 
 logging.basicConfig(
     level=logging.INFO,
@@ -31,22 +31,21 @@ logger = logging.getLogger(__name__)
 class CleanupScheduler:
     """Standalone cleanup scheduler that runs independently of Django server"""
 
-    def __init__(self, interval_minutes=30):
+    def __init__(self, interval_minutes=30, time_budget=None, batch_size=None):
         self.interval_seconds = interval_minutes * 60
         self.running = True
+        self.reaper = CleanupReaper(time_budget=time_budget, batch_size=batch_size)
 
     def cleanup_cycle(self):
-        """Perform one complete cleanup cycle"""
+        """Perform one cleanup cycle (bounded by the reaper's time budget)"""
         try:
             logger.info("Starting cleanup cycle...")
 
-            # Clean expired sessions
-            SessionTempManager.cleanup_expired_sessions()
+            # Clean expired cache and sessions in batches
+            stats = self.reaper.run_cycle()
 
-            # Clean expired cache
-            VideoCacheManager.cleanup_expired_cache()
-
-            logger.info("Cleanup cycle completed successfully")
+            if stats is not None:
+                logger.info("Cleanup cycle completed successfully")
 
         except Exception as e:
             logger.error(f"Cleanup cycle failed: {str(e)}")
@@ -82,10 +81,14 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='FetchVideo Cleanup Scheduler')
     parser.add_argument('--once', action='store_true', help='Run cleanup once and exit')
     parser.add_argument('--interval', type=int, default=30, help='Cleanup interval in minutes (default: 30)')
+    parser.add_argument('--time-budget', type=int, help='Maximum seconds per cleanup cycle')
+    parser.add_argument('--batch-size', type=int, help='Sessions or cache entries handled per batch')
 
     args = parser.parse_args()
 
-    scheduler = CleanupScheduler(interval_minutes=args.interval)
+    scheduler = CleanupScheduler(
+        interval_minutes=args.interval, time_budget=args.time_budget, batch_size=args.batch_size
+    )
 
     if args.once:
         scheduler.run_once()
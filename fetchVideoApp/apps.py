@@ -6,5 +6,12 @@ class FetchvideoappConfig(AppConfig):
     name = 'fetchVideoApp'
 
     def ready(self):
-        """Import signals when the app is ready"""
-        import fetchVideoApp.signals  # noqa
+        from django.conf import settings
+        from .http_client import install_pytubefix_transport
+        from .player_cache import install_decipher_cache, warm_in_background
+
+        if getattr(settings, 'HTTP_POOL_PYTUBEFIX', True):
+            install_pytubefix_transport()
+        install_decipher_cache()
+        if getattr(settings, 'PLAYER_CACHE_WARM', True):
+            warm_in_background()
@@ -0,0 +1,254 @@
+"""
+Content-addressed store for merged videos, shared by all sessions
+
+A merged file is identified by the video id, the itags of the video and audio
+streams it was built from and its container, so the same download is stored
+once no matter how many sessions ask for it. Sessions get a hardlink to the
+stored artifact in their own temp directory, which keeps the file alive for
+the session even if the store evicts it later.
+
+The store has a disk budget (settings.ARTIFACT_STORE_MAX_BYTES), enforced by
+the cleanup reaper rather than on every put: it evicts the least recently
+used artifacts. Using an artifact touches a "<artifact>.used" sidecar file,
+which is what the LRU order is based on; the artifact itself (and every
+session's hardlink to it) keeps its modification time, so ETag and
+Last-Modified of downloads don't change. The reaper also removes scratch
+directories in .work/ left behind by builds whose process died.
+"""
+import os
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_evict_lock = threading.Lock()
+
+
+class ArtifactStore:
+    """Shared, content-addressed storage of merged video files"""
+
+    WORK_DIR_NAME = '.work'
+    USED_SUFFIX = '.used'
+
+    @staticmethod
+    def root():
+        return getattr(settings, 'ARTIFACT_STORE_ROOT', os.path.join(settings.MEDIA_ROOT, 'store'))
+
+    @staticmethod
+    def max_bytes():
+        return getattr(settings, 'ARTIFACT_STORE_MAX_BYTES', 10 * 1024 ** 3)
+
+    @staticmethod
+    def work_root():
+        return os.path.join(ArtifactStore.root(), ArtifactStore.WORK_DIR_NAME)
+
+    @staticmethod
+    def artifact_key(video_id, video_itag, audio_itag, container):
+        """Content address of a merged file"""
+        key_string = f"{video_id}:{video_itag}:{audio_itag}:{container}"
+        return hashlib.sha256(key_string.encode()).hexdigest()
+
+    @staticmethod
+    def artifact_path(key, container):
+        return os.path.join(ArtifactStore.root(), key[:2], f"{key}.{container}")
+
+    @staticmethod
+    def contains(file_path):
+        """Check whether a path points inside the store"""
+        root = os.path.abspath(ArtifactStore.root())
+        return os.path.abspath(file_path).startswith(root + os.sep)
+
+    @staticmethod
+    def content_key(artifact_path):
+        """Content address of a stored artifact, or None for files outside the store"""
+        if not ArtifactStore.contains(artifact_path):
+            return None
+        return os.path.splitext(os.path.basename(artifact_path))[0]
+
+    @staticmethod
+    def get(key, container):
+        """Return the artifact path if it is stored, marking it as recently used"""
+        path = ArtifactStore.artifact_path(key, container)
+        if not os.path.isfile(path):
+            return None
+        ArtifactStore.mark_used(path)
+        return path
+
+    @staticmethod
+    def mark_used(artifact_path):
+        """Record a use of an artifact for the LRU order (in its sidecar file)"""
+        used_path = artifact_path + ArtifactStore.USED_SUFFIX
+        try:
+            os.utime(used_path)
+        except FileNotFoundError:
+            try:
+                open(used_path, 'a').close()
+            except OSError as e:
+                logger.warning(f"Could not mark artifact as used: {str(e)}")
+
+    @staticmethod
+    def create_work_dir():
+        """Create a private scratch directory for building an artifact"""
+        work_root = ArtifactStore.work_root()
+        os.makedirs(work_root, exist_ok=True)
+        return tempfile.mkdtemp(dir=work_root)
+
+    @staticmethod
+    def put(src_path, key, container):
+        """Move a finished file into the store and return its artifact path"""
+        path = ArtifactStore.artifact_path(key, container)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(src_path, path)
+        logger.info(f"Stored artifact {key}.{container} ({os.path.getsize(path)} bytes)")
+        # Most recently used: evicted last while the new artifact is linked into sessions
+        ArtifactStore.mark_used(path)
+        return path
+
+    @staticmethod
+    def link_into_session(artifact_path, session_dir, filename):
+        """Expose an artifact in a session directory under a friendly file name"""
+        link_path = os.path.join(session_dir, filename)
+        if os.path.exists(link_path):
+            if os.path.samefile(link_path, artifact_path):
+                return link_path
+            os.remove(link_path)
+        try:
+            os.link(artifact_path, link_path)
+        except OSError as e:
+            # Filesystems without hardlink support get a private copy instead
+            logger.warning(f"Hardlink failed ({str(e)}), copying artifact into session")
+            shutil.copy2(artifact_path, link_path)
+        return link_path
+
+    @staticmethod
+    def remove(artifact_path):
+        try:
+            os.remove(artifact_path + ArtifactStore.USED_SUFFIX)
+        except FileNotFoundError:
+            pass
+        try:
+            os.remove(artifact_path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def _iter_files():
+        """Artifacts and their sidecar files"""
+        root = ArtifactStore.root()
+        if not os.path.isdir(root):
+            return
+        for shard in os.scandir(root):
+            if not shard.is_dir() or shard.name == ArtifactStore.WORK_DIR_NAME:
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.is_file():
+                    yield entry
+
+    @staticmethod
+    def enforce_budget(limit=None):
+        """Evict least recently used artifacts until the store fits its disk budget
+
+        At most limit artifacts are evicted per call. Returns the number of
+        artifacts evicted and the bytes they freed.
+        """
+        with _evict_lock:
+            files = {}
+            used = {}
+            for entry in ArtifactStore._iter_files():
+                stat = entry.stat()
+                if entry.name.endswith(ArtifactStore.USED_SUFFIX):
+                    used[entry.path[:-len(ArtifactStore.USED_SUFFIX)]] = stat.st_mtime
+                else:
+                    files[entry.path] = stat
+
+            artifacts = []
+            total_size = 0
+            for path, stat in files.items():
+                # Artifacts never used since they were stored count from their creation
+                artifacts.append((used.get(path, stat.st_mtime), stat.st_size, path))
+                total_size += stat.st_size
+            for path in used.keys() - files.keys():
+                ArtifactStore.remove(path)  # Sidecar of an artifact removed elsewhere
+
+            budget = ArtifactStore.max_bytes()
+            if total_size <= budget:
+                return 0, 0
+
+            evicted = 0
+            freed = 0
+            for _, size, path in sorted(artifacts):
+                if total_size <= budget or (limit and evicted >= limit):
+                    break
+                if ArtifactStore.remove(path):
+                    total_size -= size
+                    freed += size
+                    evicted += 1
+
+            logger.info(f"Evicted {evicted} artifacts, store now uses {total_size} bytes")
+            return evicted, freed
+
+    @staticmethod
+    def _newest_mtime(directory):
+        """Latest modification time of a directory and everything in it, plus its size"""
+        newest = os.stat(directory).st_mtime
+        size = 0
+        for dirpath, _, filenames in os.walk(directory):
+            newest = max(newest, os.stat(dirpath).st_mtime)
+            for name in filenames:
+                try:
+                    stat = os.stat(os.path.join(dirpath, name))
+                except FileNotFoundError:
+                    continue
+                newest = max(newest, stat.st_mtime)
+                size += stat.st_size
+        return newest, size
+
+    @staticmethod
+    def sweep_work_dirs(max_age=None, limit=None):
+        """Remove scratch directories nothing has written to for max_age seconds
+
+        Builds write to their scratch directory while they run and remove it
+        when they finish, so an old one belongs to a build whose process died.
+        Returns the number of directories removed and the bytes they held.
+        """
+        if max_age is None:
+            max_age = getattr(settings, 'ARTIFACT_WORK_DIR_MAX_AGE', 3600)
+        work_root = ArtifactStore.work_root()
+        if not os.path.isdir(work_root):
+            return 0, 0
+
+        cutoff = time.time() - max_age
+        removed = 0
+        freed = 0
+        for entry in os.scandir(work_root):
+            if limit and removed >= limit:
+                break
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    newest, size = ArtifactStore._newest_mtime(entry.path)
+                    if newest >= cutoff:
+                        continue
+                    shutil.rmtree(entry.path)
+                else:
+                    stat = entry.stat(follow_symlinks=False)
+                    if stat.st_mtime >= cutoff:
+                        continue
+                    size = stat.st_size
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                continue  # The build finished and cleaned up meanwhile
+            except OSError as e:
+                logger.warning(f"Could not remove scratch directory {entry.path}: {str(e)}")
+                continue
+            removed += 1
+            freed += size
+
+        if removed:
+            logger.info(f"Removed {removed} abandoned scratch directories ({freed} bytes)")
+        return removed, freed
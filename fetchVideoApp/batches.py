@@ -0,0 +1,212 @@
+"""
+Batch downloads for FetchVideo
+
+A batch is a list of (video_id, quality) items submitted in one request.
+Repeated items are collapsed, the metadata of all videos is fetched
+concurrently in the background, and every available video is handed to the
+regular download job queue (which bounds how many downloads run at once).
+The batch record only keeps the job id of each item; progress is aggregated
+from the jobs whenever it is requested.
+
+Finished batches can be fetched as one ZIP archive that is streamed while it
+is built, without a temporary file.
+"""
+import os
+import time
+import uuid
+import logging
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from django.conf import settings
+from django.core.cache import cache
+from .jobs import DownloadJobManager, JobQueueFull
+
+logger = logging.getLogger(__name__)
+
+_batch_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='fetchvideo-batch')
+
+
+class BatchManager:
+    """Creates batches, starts their jobs and aggregates their progress"""
+
+    BATCH_KEY_PREFIX = "download_batch_"
+
+    @staticmethod
+    def _batch_key(batch_id):
+        return f"{BatchManager.BATCH_KEY_PREFIX}{batch_id}"
+
+    @staticmethod
+    def _save(batch):
+        cache.set(BatchManager._batch_key(batch['batch_id']), batch, getattr(settings, 'DOWNLOAD_JOB_TIMEOUT', 3600))
+
+    @staticmethod
+    def get_batch(batch_id):
+        return cache.get(BatchManager._batch_key(batch_id))
+
+    @staticmethod
+    def create_batch(items, session_key):
+        """Store a new batch of (video_id, quality) items, dropping repeats"""
+        unique_items = []
+        seen = set()
+        for video_id, quality in items:
+            if (video_id, quality) not in seen:
+                seen.add((video_id, quality))
+                unique_items.append({
+                    'video_id': video_id,
+                    'video_quality': quality,
+                    'title': None,
+                    'job_id': None,
+                    'status': 'pending',
+                    'message': 'Fetching video details...',
+                })
+
+        batch = {
+            'batch_id': uuid.uuid4().hex,
+            'session_key': session_key,
+            'status': 'preparing',
+            'items': unique_items,
+            'created_at': datetime.now().isoformat(),
+        }
+        BatchManager._save(batch)
+        return batch
+
+    @staticmethod
+    def submit(items, session_key):
+        """Create a batch and start preparing it in the background"""
+        batch = BatchManager.create_batch(items, session_key)
+        _batch_executor.submit(BatchManager.prepare, batch['batch_id'])
+        logger.info(f"Created batch {batch['batch_id']} with {len(batch['items'])} videos")
+        return batch
+
+    @staticmethod
+    def prepare(batch_id):
+        """Fetch metadata for all videos concurrently and queue a job per available video"""
+        from .views import fetch_video_details_many
+
+        batch = BatchManager.get_batch(batch_id)
+        if not batch:
+            return
+
+        try:
+            videos = fetch_video_details_many(
+                [item['video_id'] for item in batch['items']],
+                workers=getattr(settings, 'BATCH_METADATA_WORKERS', 4)
+            )
+
+            for item in batch['items']:
+                video = videos.get(item['video_id'])
+                if not video:
+                    item.update(status='failed', message='Unable to fetch video details')
+                    continue
+                item['title'] = video.title
+                try:
+                    job = DownloadJobManager.enqueue(item['video_id'], item['video_quality'], batch['session_key'])
+                except JobQueueFull:
+                    item.update(status='failed', message='Server is busy, please try again shortly')
+                    continue
+                item.update(job_id=job['job_id'], status='queued', message=job['message'])
+
+            batch['status'] = 'running'
+        except Exception as e:
+            logger.error(f"Failed to prepare batch {batch_id}: {str(e)}")
+            batch['status'] = 'failed'
+        BatchManager._save(batch)
+
+    @staticmethod
+    def status_snapshot(batch):
+        """Status of every item plus the aggregated progress of the batch"""
+        items = []
+        for item in batch['items']:
+            job = DownloadJobManager.get_job(item['job_id']) if item['job_id'] else None
+            if job:
+                snapshot = DownloadJobManager.status_snapshot(job)
+                done = snapshot['status'] in DownloadJobManager.TERMINAL_STATUSES
+                item = dict(item, status=snapshot['status'], message=snapshot['message'],
+                            progress=100 if done else snapshot['progress'],
+                            video_name=job['video_name'], temp_dir=job['temp_dir'])
+            else:
+                item = dict(item, progress=100 if item['status'] == 'failed' else 0)
+            items.append(item)
+
+        status = batch['status']
+        if status == 'running' and all(i['status'] in DownloadJobManager.TERMINAL_STATUSES for i in items):
+            status = 'completed' if any(i['status'] == 'completed' for i in items) else 'failed'
+
+        counts = {}
+        for item in items:
+            counts[item['status']] = counts.get(item['status'], 0) + 1
+
+        return {
+            'batch_id': batch['batch_id'],
+            'status': status,
+            'progress': round(sum(i['progress'] for i in items) / len(items)) if items else 100,
+            'counts': counts,
+            'items': [{key: value for key, value in item.items() if key != 'temp_dir'} for item in items],
+            'created_at': batch['created_at'],
+        }
+
+    @staticmethod
+    def completed_files(batch):
+        """(absolute path, archive name) of every finished video in the batch"""
+        media_root = os.path.abspath(settings.MEDIA_ROOT)
+        files = []
+        names = set()
+        for item in batch['items']:
+            job = DownloadJobManager.get_job(item['job_id']) if item['job_id'] else None
+            if not job or job['status'] != 'completed':
+                continue
+            path = os.path.abspath(os.path.join(media_root, job['temp_dir'], job['video_name']))
+            if not path.startswith(media_root + os.sep) or not os.path.isfile(path):
+                continue
+            name = job['video_name']
+            if name in names:
+                base, ext = os.path.splitext(name)
+                name = f"{base}_{item['video_quality']}{ext}"
+            names.add(name)
+            files.append((path, name))
+        return files
+
+
+class _ZipStream:
+    """Write-only, non-seekable file object collecting what zipfile writes"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(files, chunk_size=None):
+    """Yield a ZIP archive of files ((path, arcname) pairs) as it is written
+
+    Videos are already compressed, so entries are stored rather than
+    deflated. zipfile writes data descriptors because the output can't seek.
+    """
+    chunk_size = chunk_size or getattr(settings, 'DOWNLOAD_CHUNK_SIZE', 256 * 1024)
+    output = _ZipStream()
+    with zipfile.ZipFile(output, mode='w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for path, arcname in files:
+            info = zipfile.ZipInfo(arcname, time.localtime(os.path.getmtime(path))[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            with open(path, 'rb') as source, archive.open(info, mode='w', force_zip64=True) as target:
+                while True:
+                    chunk = source.read(chunk_size)
+                    if not chunk:
+                        break
+                    target.write(chunk)
+                    data = output.pop()
+                    if data:
+                        yield data
+    # Closing the archive writes the central directory
+    yield output.pop()
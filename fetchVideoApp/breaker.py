@@ -0,0 +1,173 @@
+"""
+Failure handling for YouTube extractions
+
+Failed extractions are remembered per video for a short time (negative
+caching), so refreshing a page for a private or removed video, or retrying
+while YouTube is throttling us, doesn't trigger a new extraction every time.
+How long a failure is remembered depends on its class:
+
+- 'unavailable': the video itself can't be fetched (private, removed,
+  members only, ...). YouTube is fine, so this doesn't affect the breaker.
+- 'throttled': YouTube is rate limiting or asking for bot checks.
+- 'error': anything else (network errors, parse failures).
+
+Throttling and errors also count towards a circuit breaker shared by all
+processes through the cache. After YOUTUBE_BREAKER_FAILURE_THRESHOLD
+consecutive failures it opens and extractions fail fast; after a backoff
+that doubles with every trip (up to YOUTUBE_BREAKER_MAX_BACKOFF) a single
+probe extraction is let through, and its result closes or reopens it.
+"""
+import time
+import logging
+from contextlib import contextmanager
+from urllib.error import HTTPError
+from django.conf import settings
+from django.core.cache import cache
+from pytubefix.exceptions import VideoUnavailable, BotDetection, PoTokenRequired, MaxRetriesExceeded
+
+logger = logging.getLogger(__name__)
+
+NEGATIVE_KEY_PREFIX = 'extraction_failed_'
+DEFAULT_NEGATIVE_TTLS = {'unavailable': 600, 'throttled': 60, 'error': 30}
+
+
+class ExtractionFailed(Exception):
+    """An extraction failed recently and is not retried yet"""
+
+    def __init__(self, message, error_class='error'):
+        super().__init__(message)
+        self.error_class = error_class
+
+
+class CircuitOpen(ExtractionFailed):
+    """The breaker is open, extractions fail fast"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"YouTube is unavailable or rate limiting, retrying in {int(retry_after) + 1}s", 'throttled')
+        self.retry_after = retry_after
+
+
+def classify_error(error):
+    """'unavailable', 'throttled' or 'error'"""
+    if isinstance(error, (BotDetection, PoTokenRequired, MaxRetriesExceeded)):
+        return 'throttled'
+    if isinstance(error, HTTPError) and error.code in (403, 429):
+        return 'throttled'
+    if isinstance(error, VideoUnavailable):
+        return 'unavailable'
+    return 'error'
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with exponential backoff, state kept in the shared cache"""
+
+    def __init__(self, name, failure_threshold=None, base_backoff=None, max_backoff=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or getattr(settings, 'YOUTUBE_BREAKER_FAILURE_THRESHOLD', 5)
+        self.base_backoff = base_backoff or getattr(settings, 'YOUTUBE_BREAKER_BASE_BACKOFF', 30)
+        self.max_backoff = max_backoff or getattr(settings, 'YOUTUBE_BREAKER_MAX_BACKOFF', 900)
+        self.state_key = f"{name}_breaker"
+        self.probe_key = f"{name}_breaker_probe"
+
+    def _get(self):
+        return cache.get(self.state_key) or {'failures': 0, 'trips': 0, 'open_until': 0}
+
+    def _set(self, state):
+        cache.set(self.state_key, state, None)
+
+    def state(self):
+        """Current state for monitoring: 'closed', 'open' or 'half_open', with details"""
+        state = self._get()
+        if not state['open_until']:
+            name = 'closed'
+        elif state['open_until'] > time.time():
+            name = 'open'
+        else:
+            name = 'half_open'
+        return dict(state, state=name)
+
+    def before_call(self):
+        """Raise CircuitOpen unless a call may go through; returns True for the half-open probe"""
+        state = self._get()
+        if not state['open_until']:
+            return False
+        now = time.time()
+        if state['open_until'] > now:
+            raise CircuitOpen(state['open_until'] - now)
+        # Half open: one probe at a time, everyone else keeps failing fast
+        if not cache.add(self.probe_key, True, self.base_backoff):
+            raise CircuitOpen(self.base_backoff)
+        return True
+
+    def record_success(self):
+        state = self._get()
+        if state['failures'] or state['open_until']:
+            if state['open_until']:
+                logger.info(f"Circuit breaker {self.name} closed")
+            self._set({'failures': 0, 'trips': 0, 'open_until': 0})
+            cache.delete(self.probe_key)
+
+    def record_failure(self, probe=False):
+        """Count a failure; probe is what before_call() returned for the failed call"""
+        # Read-modify-write without a lock: concurrent failures may be counted once,
+        # which only delays opening by a call or two
+        state = self._get()
+        if state['open_until'] and not probe and state['open_until'] > time.time():
+            # The call was already in flight when the breaker opened, its failure is part of that trip
+            return
+        state['failures'] += 1
+        if state['open_until'] or state['failures'] >= self.failure_threshold:
+            state['trips'] += 1
+            backoff = min(self.max_backoff, self.base_backoff * 2 ** (state['trips'] - 1))
+            state.update(failures=0, open_until=time.time() + backoff)
+            cache.delete(self.probe_key)
+            logger.warning(f"Circuit breaker {self.name} opened for {backoff}s (trip {state['trips']})")
+        self._set(state)
+
+
+youtube_breaker = CircuitBreaker('youtube')
+
+
+def _negative_key(video_id):
+    return f"{NEGATIVE_KEY_PREFIX}{video_id}"
+
+
+def check_negative_cache(video_id):
+    """Raise ExtractionFailed if extracting this video failed recently"""
+    failure = cache.get(_negative_key(video_id))
+    if failure:
+        from . import metrics
+        metrics.negative_cache_hits.inc(error_class=failure['error_class'])
+        raise ExtractionFailed(f"{failure['message']} (not retried yet)", failure['error_class'])
+
+
+def remember_failure(video_id, error_class, message):
+    ttls = dict(DEFAULT_NEGATIVE_TTLS, **getattr(settings, 'NEGATIVE_CACHE_TTLS', {}))
+    if ttls.get(error_class):
+        cache.set(_negative_key(video_id), {'error_class': error_class, 'message': message[:500]}, ttls[error_class])
+
+
+@contextmanager
+def guarded_extraction(video_id):
+    """Run a YouTube extraction behind the negative cache and the circuit breaker"""
+    from . import metrics
+
+    check_negative_cache(video_id)
+    try:
+        probe = youtube_breaker.before_call()
+    except CircuitOpen:
+        metrics.breaker_rejections.inc()
+        raise
+
+    try:
+        yield
+    except Exception as e:
+        error_class = classify_error(e)
+        metrics.extraction_failures.inc(error_class=error_class)
+        remember_failure(video_id, error_class, str(e))
+        if error_class == 'unavailable':
+            youtube_breaker.record_success()  # YouTube answered
+        else:
+            youtube_breaker.record_failure(probe)
+        raise
+    youtube_breaker.record_success()
@@ -0,0 +1,203 @@
+"""
+Tiered cache backend for FetchVideo
+
+Reads go to a small per-process LRU first and fall through to a shared back
+tier (Redis in production, any other configured cache alias elsewhere), so
+hot keys such as video details and stream manifests are served from memory
+without a network round trip or a file open + unpickle.
+
+The front tier only keeps entries for a few seconds, so a change made by
+another process is visible after at most LOCAL_TIMEOUT seconds. Keys that
+change constantly while being read by other processes (job records and
+progress) bypass the front tier entirely.
+
+Also keeps hit/miss counters per key namespace (see stats()).
+
+Example:
+    CACHES = {
+        'default': {
+            'BACKEND': 'fetchVideoApp.cache_backends.TieredCache',
+            'OPTIONS': {'BACK_ALIAS': 'shared', 'LOCAL_MAX_ENTRIES': 1000, 'LOCAL_TIMEOUT': 5},
+        },
+        'shared': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://...'},
+    }
+"""
+import time
+import pickle
+import threading
+from collections import OrderedDict, defaultdict
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+_MISSING = object()
+
+DEFAULT_NAMESPACES = (
+    'download_job_progress', 'download_job', 'video_processing_status',
+    'video_details', 'stream_manifest', 'video_cache', 'extraction_failed',
+)
+DEFAULT_LOCAL_EXCLUDE = ('download_job', 'video_processing_status', 'youtube_breaker')
+
+
+class TieredCache(BaseCache):
+    """In-process LRU in front of a shared cache"""
+
+    def __init__(self, server, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._back_alias = options.get('BACK_ALIAS', 'shared')
+        self._local_max_entries = int(options.get('LOCAL_MAX_ENTRIES', 1000))
+        self._local_timeout = float(options.get('LOCAL_TIMEOUT', 5))
+        self._local_exclude = tuple(options.get('LOCAL_EXCLUDE', DEFAULT_LOCAL_EXCLUDE))
+        # Longest prefixes first so 'download_job_progress' wins over 'download_job'
+        self._namespaces = sorted(options.get('NAMESPACES', DEFAULT_NAMESPACES), key=len, reverse=True)
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'sets': 0})
+
+    @property
+    def back(self):
+        return caches[self._back_alias]
+
+    # Namespaces and metrics
+
+    def _namespace(self, key):
+        return next((ns for ns in self._namespaces if key.startswith(ns)), 'other')
+
+    def _count(self, key, field):
+        with self._lock:
+            self._stats[self._namespace(key)][field] += 1
+
+    def stats(self):
+        """Hit/miss counters of this process per key namespace"""
+        with self._lock:
+            return {ns: dict(counters) for ns, counters in self._stats.items()}
+
+    # Front tier
+
+    def _use_local(self, key):
+        return self._local_max_entries > 0 and not key.startswith(self._local_exclude)
+
+    def _local_get(self, key, version):
+        local_key = (key, version)
+        with self._lock:
+            entry = self._local.get(local_key)
+            if entry is None:
+                return _MISSING
+            expires_at, pickled = entry
+            if expires_at <= time.monotonic():
+                del self._local[local_key]
+                return _MISSING
+            self._local.move_to_end(local_key)
+        return pickle.loads(pickled)
+
+    def _local_set(self, key, value, version, timeout=DEFAULT_TIMEOUT):
+        if not self._use_local(key):
+            return
+        ttl = self._local_timeout
+        backend_timeout = self.get_backend_timeout(timeout)
+        if backend_timeout is not None:
+            ttl = min(ttl, backend_timeout - time.time())
+        if ttl <= 0:
+            self._local_delete(key, version)
+            return
+        # Pickle so callers mutating a returned value can't change the cached one
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._local[(key, version)] = (time.monotonic() + ttl, pickled)
+            self._local.move_to_end((key, version))
+            while len(self._local) > self._local_max_entries:
+                self._local.popitem(last=False)
+
+    def _local_delete(self, key, version):
+        with self._lock:
+            self._local.pop((key, version), None)
+
+    # Cache API
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.back.add(key, value, timeout, version)
+        if added:
+            self._local_set(key, value, version, timeout)
+        return added
+
+    def get(self, key, default=None, version=None):
+        if self._use_local(key):
+            value = self._local_get(key, version)
+            if value is not _MISSING:
+                self._count(key, 'local_hits')
+                return value
+
+        value = self.back.get(key, _MISSING, version)
+        if value is _MISSING:
+            self._count(key, 'misses')
+            return default
+        self._count(key, 'shared_hits')
+        self._local_set(key, value, version)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.back.set(key, value, timeout, version)
+        self._count(key, 'sets')
+        self._local_set(key, value, version, timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._local_delete(key, version)
+        return self.back.touch(key, timeout, version)
+
+    def delete(self, key, version=None):
+        self._local_delete(key, version)
+        return self.back.delete(key, version)
+
+    def has_key(self, key, version=None):
+        if self._use_local(key) and self._local_get(key, version) is not _MISSING:
+            return True
+        return self.back.has_key(key, version)
+
+    def get_many(self, keys, version=None):
+        found = {}
+        remaining = []
+        for key in keys:
+            value = self._local_get(key, version) if self._use_local(key) else _MISSING
+            if value is _MISSING:
+                remaining.append(key)
+            else:
+                self._count(key, 'local_hits')
+                found[key] = value
+
+        if remaining:
+            fetched = self.back.get_many(remaining, version)
+            for key in remaining:
+                if key in fetched:
+                    self._count(key, 'shared_hits')
+                    self._local_set(key, fetched[key], version)
+                else:
+                    self._count(key, 'misses')
+            found.update(fetched)
+        return found
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.back.set_many(data, timeout, version)
+        for key, value in data.items():
+            if key not in failed:
+                self._count(key, 'sets')
+                self._local_set(key, value, version, timeout)
+        return failed
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        for key in keys:
+            self._local_delete(key, version)
+        self.back.delete_many(keys, version)
+
+    def incr(self, key, delta=1, version=None):
+        self._local_delete(key, version)
+        return self.back.incr(key, delta, version)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        self.back.clear()
+
+    def close(self, **kwargs):
+        self.back.close(**kwargs)
+
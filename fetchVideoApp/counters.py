@@ -0,0 +1,193 @@
+"""
+Buffered video counters for FetchVideo
+
+Page views and downloads are counted in a buffer instead of writing the
+Video row on every request. A background thread flushes the buffer every
+COUNTER_FLUSH_INTERVAL seconds with UPDATE ... SET views = views + n
+statements (one per distinct increment, not one per video), so counts stay
+correct under concurrency and requests never wait for a database write.
+
+Backends (settings.COUNTER_BACKEND):
+- 'memory': per-process buffer, flushed by each process
+- 'redis': shared Redis hashes; a flush atomically takes over the pending
+  counts, so any process may flush them
+"""
+import uuid
+import atexit
+import logging
+import threading
+from collections import defaultdict
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('views', 'download_count')
+
+
+def apply_counts(field, counts):
+    """Add counts ({video_id: n}) to a Video counter field in batched UPDATEs"""
+    from .models import Video
+    from .metadata import VideoMetadataCache
+
+    by_delta = defaultdict(list)
+    for video_id, delta in counts.items():
+        if delta:
+            by_delta[delta].append(video_id)
+
+    extra = {'last_downloaded': timezone.now()} if field == 'download_count' else {}
+    for delta, video_ids in by_delta.items():
+        Video.objects.filter(video_id__in=video_ids).update(**{field: F(field) + delta}, **extra)
+    # Cached records still hold the old counts
+    VideoMetadataCache.delete_many(list(counts))
+
+
+class InMemoryCounters:
+    """Per-process counter buffer"""
+
+    def __init__(self):
+        self._counts = {field: defaultdict(int) for field in FIELDS}
+        self._lock = threading.Lock()
+
+    def increment(self, video_id, field, amount=1):
+        with self._lock:
+            self._counts[field][video_id] += amount
+
+    def pending(self, video_id, field):
+        with self._lock:
+            return self._counts[field].get(video_id, 0)
+
+    def take(self, field):
+        """Remove and return the buffered counts of a field"""
+        with self._lock:
+            counts = self._counts[field]
+            self._counts[field] = defaultdict(int)
+        return dict(counts)
+
+    def restore(self, field, counts):
+        """Put counts back after a failed flush"""
+        for video_id, amount in counts.items():
+            self.increment(video_id, field, amount)
+
+
+class RedisCounters:
+    """Counter buffer in Redis hashes, shared by all processes"""
+
+    KEY_PREFIX = 'fetchvideo:counters:'
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def increment(self, video_id, field, amount=1):
+        self.client.hincrby(f"{self.KEY_PREFIX}{field}", video_id, amount)
+
+    def pending(self, video_id, field):
+        return int(self.client.hget(f"{self.KEY_PREFIX}{field}", video_id) or 0)
+
+    def take(self, field):
+        import redis
+        key = f"{self.KEY_PREFIX}{field}"
+        flushing_key = f"{key}:flushing:{uuid.uuid4().hex}"
+        try:
+            # New increments go to a fresh hash while this one is flushed
+            self.client.rename(key, flushing_key)
+        except redis.ResponseError:
+            return {}  # Nothing buffered
+        counts = self.client.hgetall(flushing_key)
+        self.client.delete(flushing_key)
+        return {video_id.decode(): int(amount) for video_id, amount in counts.items()}
+
+    def restore(self, field, counts):
+        pipe = self.client.pipeline()
+        for video_id, amount in counts.items():
+            pipe.hincrby(f"{self.KEY_PREFIX}{field}", video_id, amount)
+        pipe.execute()
+
+
+class VideoCounters:
+    """Buffers counter increments and flushes them periodically"""
+
+    def __init__(self):
+        self._backend = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    name = getattr(settings, 'COUNTER_BACKEND', 'memory')
+                    if name == 'redis':
+                        self._backend = RedisCounters(settings.COUNTER_REDIS_URL)
+                    elif name == 'memory':
+                        self._backend = InMemoryCounters()
+                    else:
+                        raise ValueError(f"Unknown COUNTER_BACKEND: {name}")
+        return self._backend
+
+    def increment(self, video_id, field, amount=1):
+        """Count an event; it reaches the database with the next flush"""
+        try:
+            self.backend.increment(video_id, field, amount)
+        except Exception as e:
+            logger.warning(f"Failed to count {field} for {video_id}: {str(e)}")
+            return
+        self._schedule_flush()
+
+    def pending(self, video_id, field):
+        """Increments not flushed yet (for display)"""
+        try:
+            return self.backend.pending(video_id, field)
+        except Exception:
+            return 0
+
+    def _schedule_flush(self):
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Timer(getattr(settings, 'COUNTER_FLUSH_INTERVAL', 10), self._timed_flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _timed_flush(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        finally:
+            # The timer thread ends here, don't leave its connection open
+            connection.close()
+
+    def flush(self):
+        """Write all buffered counts to the database; returns how many videos were updated"""
+        updated = 0
+        with self._flush_lock:
+            for field in FIELDS:
+                counts = self.backend.take(field)
+                if not counts:
+                    continue
+                try:
+                    apply_counts(field, counts)
+                    updated += len(counts)
+                except Exception as e:
+                    logger.error(f"Failed to flush {field} counters: {str(e)}")
+                    self.backend.restore(field, counts)
+                    self._schedule_flush()
+        return updated
+
+
+video_counters = VideoCounters()
+
+
+@atexit.register
+def _flush_on_exit():
+    if video_counters._backend is None:
+        return  # Nothing was counted in this process
+    try:
+        video_counters.flush()
+    except Exception as e:
+        logger.error(f"Failed to flush counters on exit: {str(e)}")
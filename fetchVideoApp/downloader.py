@@ -0,0 +1,302 @@
+"""
+Stream downloading for FetchVideo
+
+The video and audio streams of a download are fetched at the same time, so
+the wall-clock time is that of the slower transfer rather than the sum of
+both. Progress of all streams is combined into one overall fraction weighted
+by stream size, and if any stream fails the others are cancelled.
+
+Large streams are fetched by SegmentedDownloader: the file is split into byte
+ranges that several connections download in parallel, because googlevideo
+throttles the throughput of each single connection.
+
+HostLimiter caps how many streams this process fetches from one host at a
+time, so a batch of downloads doesn't open dozens of transfers to the same
+googlevideo edge.
+"""
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+import requests
+from django.conf import settings
+from .http_client import get_http_session
+
+logger = logging.getLogger(__name__)
+
+
+class HostLimiter:
+    """Per-host concurrency limit for stream transfers"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.limit)
+            return self._semaphores[host]
+
+    @contextmanager
+    def slot(self, url, cancel_event=None):
+        """Hold one of the host's transfer slots; gives up if cancel_event is set while waiting"""
+        semaphore = self._semaphore(urlparse(url or '').hostname or '')
+        while not semaphore.acquire(timeout=0.5):
+            if cancel_event is not None and cancel_event.is_set():
+                raise DownloadCancelled()
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+
+host_limiter = HostLimiter(getattr(settings, 'DOWNLOAD_PER_HOST_CONCURRENCY', 8))
+
+
+class DownloadCancelled(Exception):
+    """Raised when a stream download is stopped because a sibling failed"""
+
+
+class StreamDownloadError(Exception):
+    """Raised when one of the streams of a download fails"""
+
+    def __init__(self, name, error):
+        super().__init__(f"Failed to download {name} stream: {str(error)}")
+        self.name = name
+        self.error = error
+
+
+class StreamProgress:
+    """Combines per-stream byte counts into one weighted progress value"""
+
+    def __init__(self, sizes, callback=None):
+        self.sizes = sizes
+        self.done = {name: 0 for name in sizes}
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._last_percent = -1
+
+    @property
+    def total_bytes(self):
+        return sum(self.sizes.values())
+
+    @property
+    def done_bytes(self):
+        return sum(self.done.values())
+
+    def fraction(self):
+        total = self.total_bytes
+        if total:
+            return min(self.done_bytes / total, 1.0)
+        # Unknown sizes: every stream counts the same
+        return sum(1 for name in self.done if self.done[name]) / max(len(self.done), 1)
+
+    def update(self, name, bytes_done):
+        with self._lock:
+            self.done[name] = bytes_done
+            fraction = self.fraction()
+            percent = int(fraction * 100)
+            # Only report whole percent changes to keep status writes cheap
+            if percent == self._last_percent:
+                return
+            self._last_percent = percent
+        if self.callback:
+            self.callback(fraction, self.done_bytes, self.total_bytes)
+
+
+def _raise_first_error(futures, cancel_event):
+    """Wait for futures; on the first failure cancel the rest and raise the root cause"""
+    wait(futures, return_when=FIRST_EXCEPTION)
+    if not any(f.done() and f.exception() is not None for f in futures):
+        return
+    cancel_event.set()
+    wait(futures)
+    errors = [f.exception() for f in futures if f.exception() is not None]
+    # Siblings stopped by the cancel event are a consequence, not the cause
+    raise next((e for e in errors if not isinstance(e, DownloadCancelled)), errors[0])
+
+
+class SegmentError(Exception):
+    """Raised when a byte range could not be downloaded"""
+
+
+class SegmentedDownloader:
+    """Downloads a URL as parallel byte ranges written into a preallocated file"""
+
+    def __init__(self, url, filesize, output_path, segment_size=None, concurrency=None,
+                 max_retries=None, session=None, timeout=None):
+        self.url = url
+        self.filesize = filesize
+        self.output_path = output_path
+        self.segment_size = segment_size or getattr(settings, 'DOWNLOAD_SEGMENT_SIZE', 8 * 1024 * 1024)
+        self.concurrency = concurrency or getattr(settings, 'DOWNLOAD_SEGMENT_CONCURRENCY', 4)
+        self.max_retries = getattr(settings, 'DOWNLOAD_SEGMENT_RETRIES', 3) if max_retries is None else max_retries
+        self.session = session or get_http_session()
+        self.timeout = timeout  # None uses the session's default timeouts
+        self._done = 0
+        self._lock = threading.Lock()
+
+    def segments(self):
+        """Byte ranges (start, end inclusive) covering the whole file"""
+        return [
+            (start, min(start + self.segment_size, self.filesize) - 1)
+            for start in range(0, self.filesize, self.segment_size)
+        ]
+
+    def _add_progress(self, count, on_progress):
+        with self._lock:
+            self._done += count
+            done = self._done
+        if on_progress:
+            on_progress(done)
+
+    def _fetch_segment(self, start, end, on_progress, cancel_event):
+        headers = {'Range': f'bytes={start}-{end}'}
+        written = 0
+        try:
+            with self.session.get(self.url, headers=headers, stream=True, timeout=self.timeout) as response:
+                full_body = response.status_code == 200 and start == 0 and end == self.filesize - 1
+                if response.status_code != 206 and not full_body:
+                    raise SegmentError(f"Unexpected HTTP {response.status_code} for bytes {start}-{end}")
+
+                with open(self.output_path, 'r+b') as f:
+                    f.seek(start)
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        if cancel_event.is_set():
+                            raise DownloadCancelled()
+                        f.write(chunk)
+                        written += len(chunk)
+                        self._add_progress(len(chunk), on_progress)
+
+            if written != end - start + 1:
+                raise SegmentError(f"Got {written} bytes for range {start}-{end}")
+        except Exception:
+            # Forget the partial bytes so a retry doesn't count them twice
+            self._add_progress(-written, on_progress)
+            raise
+
+    def _fetch_segment_with_retries(self, start, end, on_progress, cancel_event):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._fetch_segment(start, end, on_progress, cancel_event)
+            except DownloadCancelled:
+                raise
+            except (requests.RequestException, SegmentError) as e:
+                if attempt == self.max_retries or cancel_event.is_set():
+                    raise SegmentError(f"Range {start}-{end} failed after {attempt + 1} attempts: {str(e)}")
+                logger.warning(f"Retrying range {start}-{end} ({str(e)})")
+                time.sleep(0.5 * 2 ** attempt)
+
+    def download(self, on_progress=None, cancel_event=None):
+        """Download the file; on_progress is called with the number of bytes done"""
+        cancel_event = cancel_event or threading.Event()
+
+        # Preallocate so every worker can write its range at its own offset
+        with open(self.output_path, 'wb') as f:
+            f.truncate(self.filesize)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='fetchvideo-segment') as executor:
+            futures = [
+                executor.submit(self._fetch_segment_with_retries, start, end, on_progress, cancel_event)
+                for start, end in self.segments()
+            ]
+            _raise_first_error(futures, cancel_event)
+
+        # The file is preallocated, so check the bytes actually received as well as its size
+        actual_size = os.path.getsize(self.output_path)
+        if self._done != self.filesize or actual_size != self.filesize:
+            raise SegmentError(f"Downloaded {self._done} bytes into {actual_size}, expected {self.filesize}")
+        return self.output_path
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _can_segment(stream):
+    if not getattr(settings, 'DOWNLOAD_SEGMENTED', True) or getattr(stream, 'is_sabr', False):
+        return False
+    try:
+        return bool(stream.url and stream.filesize)
+    except Exception:
+        return False
+
+
+def _fetch_stream(name, stream, output_path, progress, cancel_event, on_done=None):
+    try:
+        url = stream.url
+    except Exception:
+        url = None
+    with host_limiter.slot(url, cancel_event):
+        started = time.monotonic()
+        _fetch_stream_unlimited(name, stream, output_path, progress, cancel_event)
+    if on_done:
+        on_done(name, time.monotonic() - started, _file_size(output_path))
+
+
+def _fetch_stream_unlimited(name, stream, output_path, progress, cancel_event):
+    if _can_segment(stream):
+        try:
+            SegmentedDownloader(stream.url, stream.filesize, output_path).download(
+                on_progress=lambda bytes_done: progress.update(name, bytes_done),
+                cancel_event=cancel_event
+            )
+        except DownloadCancelled:
+            raise
+        except Exception as e:
+            raise StreamDownloadError(name, e)
+        return
+
+    def interrupt_checker():
+        # Called by pytubefix for every chunk: report progress and stop if cancelled
+        progress.update(name, _file_size(output_path))
+        return cancel_event.is_set()
+
+    try:
+        stream.download(
+            output_path=os.path.dirname(output_path),
+            filename=os.path.basename(output_path),
+            skip_existing=False,
+            interrupt_checker=interrupt_checker
+        )
+    except Exception as e:
+        raise StreamDownloadError(name, e)
+
+    if cancel_event.is_set():
+        raise DownloadCancelled(name)
+    progress.update(name, _file_size(output_path))
+
+
+def download_streams_concurrently(downloads, on_progress=None, on_stream_done=None):
+    """Download several streams in parallel
+
+    downloads is a list of (name, stream, output_path) tuples. on_progress is
+    called with (fraction, bytes_done, bytes_total) as the transfer advances
+    and on_stream_done with (name, seconds, size) when a stream has finished.
+    Raises StreamDownloadError for the first stream that fails, after the
+    remaining streams have been cancelled.
+    """
+    sizes = {name: getattr(stream, 'filesize', 0) or 0 for name, stream, _ in downloads}
+    progress = StreamProgress(sizes, on_progress)
+    cancel_event = threading.Event()
+
+    with ThreadPoolExecutor(max_workers=len(downloads), thread_name_prefix='fetchvideo-stream') as executor:
+        futures = [
+            executor.submit(_fetch_stream, name, stream, output_path, progress, cancel_event, on_stream_done)
+            for name, stream, output_path in downloads
+        ]
+        try:
+            _raise_first_error(futures, cancel_event)
+        except Exception as e:
+            logger.error(str(e))
+            raise
+
+    return [output_path for _, _, output_path in downloads]
@@ -0,0 +1,76 @@
+"""
+FFmpeg helpers for FetchVideo
+
+Video and audio are muxed in a single FFmpeg invocation. Codecs are copied
+whenever the output container can hold them (H264/VP9/AV1 video, AAC/Opus
+audio in MP4) and audio is only transcoded to AAC when it can't.
+"""
+import os
+import subprocess
+import logging
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Audio codecs each container accepts without transcoding
+CONTAINER_AUDIO_CODECS = {
+    'mp4': ('mp4a', 'opus'),
+    'mkv': ('mp4a', 'opus', 'vorbis'),
+    'webm': ('opus', 'vorbis'),
+}
+
+
+class FFmpegError(Exception):
+    """Raised when FFmpeg fails or times out"""
+
+
+def get_ffmpeg_path():
+    return getattr(settings, 'FFMPEG_PATH', None) or 'ffmpeg'
+
+
+def audio_codec_args(audio_codec, container='mp4'):
+    """FFmpeg audio arguments: copy when the container allows it, otherwise AAC"""
+    codec = (audio_codec or '').lower()
+    if any(codec.startswith(name) for name in CONTAINER_AUDIO_CODECS.get(container, ())):
+        args = ['-c:a', 'copy']
+        if container == 'mp4' and codec.startswith('opus'):
+            # Older FFmpeg builds still flag Opus-in-MP4 as experimental
+            args += ['-strict', 'experimental']
+        return args
+    return ['-c:a', 'aac', '-b:a', '192k']
+
+
+def run_ffmpeg(args, timeout):
+    """Run FFmpeg with the given arguments, raising FFmpegError on failure"""
+    cmd = [get_ffmpeg_path(), '-hide_banner', '-loglevel', 'error', '-y'] + args
+    try:
+        result = subprocess.run(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=timeout,
+            creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+        )
+    except subprocess.TimeoutExpired:
+        raise FFmpegError(f"FFmpeg timed out after {timeout} seconds")
+    except OSError as e:
+        raise FFmpegError(f"Could not run FFmpeg: {str(e)}")
+
+    if result.returncode != 0:
+        raise FFmpegError(result.stderr.decode('utf-8', errors='ignore').strip())
+
+
+def merge_streams(video_path, audio_path, output_path, audio_codec=None, container='mp4', timeout=600):
+    """Mux a video-only and an audio-only file into one file in a single pass"""
+    args = [
+        '-i', video_path,
+        '-i', audio_path,
+        '-map', '0:v:0',
+        '-map', '1:a:0',
+        '-c:v', 'copy',
+    ] + audio_codec_args(audio_codec, container) + [
+        '-avoid_negative_ts', 'make_zero',
+        output_path,
+    ]
+    run_ffmpeg(args, timeout)
+    logger.info(f"Merged {os.path.basename(video_path)} and {os.path.basename(audio_path)}")
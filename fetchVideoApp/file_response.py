@@ -0,0 +1,136 @@
+"""
+Streaming file responses with HTTP Range and conditional request support
+
+Files are never read into memory as a whole: full downloads go through
+FileResponse (which uses wsgi.file_wrapper / sendfile where available) and
+partial downloads are streamed in fixed size chunks. When a front-end server
+is configured to serve MEDIA_ROOT (settings.DOWNLOAD_OFFLOAD_HEADER), the
+transfer is handed off to it entirely.
+"""
+import os
+import re
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def file_etag(stat_result, content_key=None):
+    """Strong ETag from the content key and size, or from size and modification time without a key"""
+    if content_key:
+        return f'"{content_key[:32]}-{stat_result.st_size:x}"'
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def parse_range_header(range_header, file_size):
+    """Parse a single byte range into (start, end) inclusive
+
+    Returns None when the header should be ignored (missing, malformed or
+    multiple ranges) and raises ValueError when the range can't be satisfied.
+    """
+    if not range_header:
+        return None
+    match = RANGE_RE.match(range_header.strip())
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+
+    if not start:
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(file_size - length, 0), file_size - 1
+
+    start = int(start)
+    end = int(end) if end else file_size - 1
+    if start >= file_size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, file_size - 1)
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def _iter_file_range(path, start, length, chunk_size):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _offload_response(path, filename):
+    """Let nginx (X-Accel-Redirect) or Apache/lighttpd (X-Sendfile) send the file"""
+    header = settings.DOWNLOAD_OFFLOAD_HEADER
+    response = HttpResponse(content_type='video/mp4')
+    if header == 'X-Accel-Redirect':
+        relative_path = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+        response[header] = settings.DOWNLOAD_OFFLOAD_PREFIX.rstrip('/') + '/' + relative_path
+    else:
+        response[header] = path
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    return response
+
+
+def ranged_file_response(request, path, filename, content_type='video/mp4', content_key=None):
+    """Serve a file as an attachment with Range/If-Range and conditional GET support
+
+    content_key identifies the file's content (e.g. its artifact store key)
+    and makes the ETag independent of the file's modification time.
+    """
+    if getattr(settings, 'DOWNLOAD_OFFLOAD_HEADER', None):
+        return _offload_response(path, filename)
+
+    stat_result = os.stat(path)
+    file_size = stat_result.st_size
+    last_modified = int(stat_result.st_mtime)
+    etag = file_etag(stat_result, content_key)
+
+    # 304 Not Modified / 412 Precondition Failed
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        return conditional
+
+    byte_range = None
+    if _if_range_matches(request, etag, last_modified):
+        try:
+            byte_range = parse_range_header(request.headers.get('Range'), file_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{file_size}'
+            return response
+
+    chunk_size = getattr(settings, 'DOWNLOAD_CHUNK_SIZE', 256 * 1024)
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type, as_attachment=True, filename=filename)
+        response.block_size = chunk_size
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            _iter_file_range(path, start, length, chunk_size), status=206, content_type=content_type
+        )
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{file_size}'
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
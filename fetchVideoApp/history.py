@@ -0,0 +1,173 @@
+"""
+Processing logs and download history for FetchVideo
+
+Pipeline stages record a ProcessingLog (with their duration) and served
+files record a DownloadHistory row. Records are collected in an in-memory
+buffer and written with bulk_create from a background thread, either every
+HISTORY_FLUSH_INTERVAL seconds or as soon as HISTORY_BUFFER_SIZE records are
+waiting, so logging never adds a database round trip to a request.
+"""
+import time
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_BUFFERED = 10000  # Records kept while the database is unavailable
+
+
+class HistoryBuffer:
+    """Collects ProcessingLog and DownloadHistory records and bulk-inserts them"""
+
+    def __init__(self):
+        self._logs = []
+        self._downloads = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+        self._flushing = False  # A background flush thread is running
+
+    def add_log(self, **fields):
+        self._add(self._logs, fields)
+
+    def add_download(self, **fields):
+        self._add(self._downloads, fields)
+
+    def _add(self, records, fields):
+        with self._lock:
+            if len(self._logs) + len(self._downloads) >= MAX_BUFFERED:
+                logger.warning("History buffer full, dropping record")
+                metrics.history_dropped.inc(reason='buffer_full')
+                return
+            records.append(fields)
+            full = len(self._logs) + len(self._downloads) >= getattr(settings, 'HISTORY_BUFFER_SIZE', 200)
+        if full:
+            self._start_flush_thread()
+        else:
+            self._schedule_flush()
+
+    def _start_flush_thread(self):
+        """Flush in a new thread unless one is already running"""
+        with self._lock:
+            if self._flushing:
+                return
+            self._flushing = True
+        threading.Thread(target=self._background_flush, daemon=True).start()
+
+    def _schedule_flush(self):
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Timer(getattr(settings, 'HISTORY_FLUSH_INTERVAL', 10), self._timed_flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _timed_flush(self):
+        with self._lock:
+            self._timer = None
+        self._start_flush_thread()
+
+    def _background_flush(self):
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                self._flushing = False
+            # Flush threads end here, don't leave their connections open
+            connection.close()
+
+    def flush(self):
+        """Write all buffered records; returns how many were written
+
+        Downloads of videos that have no Video row are dropped (and logged),
+        they aren't counted as written.
+        """
+        from .models import ProcessingLog, DownloadHistory, Video
+
+        with self._flush_lock:
+            with self._lock:
+                logs, self._logs = self._logs, []
+                downloads, self._downloads = self._downloads, []
+
+            written = 0
+            try:
+                if logs:
+                    ProcessingLog.objects.bulk_create([ProcessingLog(**fields) for fields in logs])
+                    written += len(logs)
+                    logs = []
+                if downloads:
+                    # One query resolves all video ids to primary keys
+                    video_pks = dict(Video.objects.filter(
+                        video_id__in={fields['video_id'] for fields in downloads}
+                    ).values_list('video_id', 'pk'))
+                    known = [fields for fields in downloads if fields['video_id'] in video_pks]
+                    dropped = len(downloads) - len(known)
+                    if dropped:
+                        metrics.history_dropped.inc(dropped, reason='unknown_video')
+                        unknown = sorted({fields['video_id'] for fields in downloads} - video_pks.keys())
+                        logger.warning(f"Dropped {dropped} download records of unknown videos: {', '.join(unknown)}")
+                    DownloadHistory.objects.bulk_create([
+                        DownloadHistory(video_id=video_pks[fields['video_id']],
+                                        **{k: v for k, v in fields.items() if k != 'video_id'})
+                        for fields in known
+                    ])
+                    written += len(known)
+                    downloads = []
+            except Exception as e:
+                logger.error(f"Failed to write processing history: {str(e)}")
+                with self._lock:
+                    self._logs[:0] = logs
+                    self._downloads[:0] = downloads
+                self._schedule_flush()
+            return written
+
+
+history_buffer = HistoryBuffer()
+
+
+def log_processing(video_id, operation, status, message='', duration=None):
+    """Record a ProcessingLog entry (buffered) and the stage duration metric"""
+    if duration is not None:
+        metrics.stage_duration.observe(duration, stage=operation, status=status)
+    history_buffer.add_log(
+        video_id=video_id, operation=operation, status=status, message=message[:1000],
+        duration=round(duration, 3) if duration is not None else None
+    )
+
+
+@contextmanager
+def timed_stage(video_id, operation, message=''):
+    """Time a pipeline stage and log it as success, or as error if it raises"""
+    started = time.monotonic()
+    try:
+        yield
+    except Exception as e:
+        log_processing(video_id, operation, 'error', str(e), time.monotonic() - started)
+        raise
+    log_processing(video_id, operation, 'success', message, time.monotonic() - started)
+
+
+def record_download(request, video_id, quality, file_size, file_format='mp4'):
+    """Record a served file in DownloadHistory (buffered)"""
+    history_buffer.add_download(
+        video_id=video_id,
+        ip_address=request.META.get('REMOTE_ADDR') or None,
+        user_agent=request.META.get('HTTP_USER_AGENT', '')[:1000],
+        quality=quality[:20],
+        format=file_format[:10],
+        file_size=file_size,
+        download_time=timezone.now(),
+    )
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        history_buffer.flush()
+    except Exception as e:
+        logger.error(f"Failed to flush processing history on exit: {str(e)}")
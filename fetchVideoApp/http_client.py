@@ -0,0 +1,212 @@
+"""
+Pooled outbound HTTP client for FetchVideo
+
+One requests session per process, with keep-alive connection pools sized by
+HTTP_POOL_MAXSIZE and default connect/read timeouts, is used for segment
+downloads, size probes and (through install_pytubefix_transport) every
+request pytubefix makes for watch pages, player JS, InnerTube calls and
+stream downloads. Repeated requests to youtube.com and the googlevideo edges
+reuse open connections instead of paying a TCP and TLS handshake each time.
+
+Requests and newly opened connections are counted per host group, so the
+connection reuse ratio can be read from /metrics.
+
+requests only speaks HTTP/1.1; keep-alive pooling is what removes the
+handshakes here.
+"""
+import io
+import json
+import socket
+import http.client
+import logging
+import threading
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import HTTPError as Urllib3Error
+from django.conf import settings
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = 'Mozilla/5.0'
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def host_group(host):
+    """Coarse host label for metrics (googlevideo edges have one hostname each)"""
+    host = (host or '').lower()
+    for domain in ('googlevideo.com', 'youtube.com', 'ytimg.com'):
+        if host == domain or host.endswith(f'.{domain}'):
+            return domain
+    return 'other'
+
+
+class _CountingPoolMixin:
+    def _new_conn(self):
+        metrics.http_connections.inc(host=host_group(self.host))
+        return super()._new_conn()
+
+
+class CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter with default timeouts that counts requests and new connections"""
+
+    def __init__(self, timeout, **kwargs):
+        self.timeout = timeout
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        metrics.http_requests.inc(host=host_group(urlparse(request.url).hostname))
+        return super().send(request, **kwargs)
+
+
+def default_timeout():
+    """(connect, read) timeout in seconds"""
+    return (getattr(settings, 'HTTP_CONNECT_TIMEOUT', 5), getattr(settings, 'HTTP_READ_TIMEOUT', 30))
+
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """Process-wide pooled requests session"""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                session = requests.Session()
+                session.headers['User-Agent'] = USER_AGENT
+                adapter = PooledHTTPAdapter(
+                    timeout=default_timeout(),
+                    # One pool per host; a download talks to a few googlevideo edges plus youtube.com
+                    pool_connections=getattr(settings, 'HTTP_POOL_HOSTS', 16),
+                    pool_maxsize=getattr(
+                        settings, 'HTTP_POOL_MAXSIZE', getattr(settings, 'DOWNLOAD_SEGMENT_CONCURRENCY', 4) * 4
+                    ),
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _http_session = session
+    return _http_session
+
+
+class _UrllibResponse:
+    """The parts of an http.client response pytubefix uses, backed by a requests response
+
+    Bodies are streamed from the pooled connection, which goes back to the
+    pool once the body has been read. If pytubefix only looks at the headers
+    (info() before any read, as for the size probe in request.stream()), the
+    body is closed right away instead of holding the connection until the
+    response is garbage collected. Read errors are raised as
+    http.client.IncompleteRead carrying the bytes received, which is what
+    pytubefix's partial-chunk recovery expects.
+    """
+
+    def __init__(self, response, body=None):
+        self._response = response
+        self._body = io.BytesIO(body) if body is not None else None
+        self._started = False
+        self._closed = False
+        self.status = response.status_code
+        self.headers = response.headers
+
+    def read(self, amt=None):
+        if self._body is not None:
+            return self._body.read(-1 if amt is None else amt)
+        if self._closed:
+            return b''
+        self._started = True
+        raw = self._response.raw
+        # read1 returns what has arrived, so a dropped connection loses no received bytes
+        read = getattr(raw, 'read1', raw.read)
+        data = bytearray()
+        try:
+            while amt is None or len(data) < amt:
+                size = READ_CHUNK_SIZE if amt is None else min(READ_CHUNK_SIZE, amt - len(data))
+                chunk = read(size, decode_content=True)
+                if not chunk:
+                    self.close()  # Fully read: hands the connection back to the pool
+                    break
+                data += chunk
+        except (Urllib3Error, OSError) as e:
+            self.close()
+            raise http.client.IncompleteRead(bytes(data)) from e
+        return bytes(data)
+
+    def info(self):
+        if self._body is None and not self._started:
+            # Headers only: don't keep the connection busy with a body nobody reads
+            self.close()
+        return self._response.headers
+
+    def getcode(self):
+        return self.status
+
+    def close(self):
+        self._closed = True
+        self._response.close()
+
+
+def pytubefix_execute_request(url, method=None, headers=None, data=None, timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+    """Drop-in replacement for pytubefix.request._execute_request using the pooled session"""
+    if not url.lower().startswith('http'):
+        raise ValueError("Invalid URL")
+    request_headers = {'User-Agent': USER_AGENT, 'accept-language': 'en-US,en'}
+    if headers:
+        request_headers.update(headers)
+    if data and not isinstance(data, bytes):
+        data = json.dumps(data).encode('utf-8')
+    if timeout is socket._GLOBAL_DEFAULT_TIMEOUT or timeout is None:
+        timeout = default_timeout()
+
+    try:
+        response = get_http_session().request(
+            method or ('POST' if data else 'GET'), url,
+            headers=request_headers, data=data, timeout=timeout, stream=True
+        )
+    except requests.RequestException as e:
+        # pytubefix retries on URLErrors caused by OSErrors (RequestException is one)
+        raise URLError(e)
+
+    if response.status_code >= 400:
+        body = response.content
+        response.close()
+        raise HTTPError(url, response.status_code, response.reason, response.headers, io.BytesIO(body))
+    if method == 'HEAD' or 'Content-Length' not in response.headers:
+        # Nothing to stream, or a body that ends with the connection: read it now so the
+        # connection is released (or closed) straight away
+        try:
+            body = response.content
+        except requests.RequestException as e:
+            raise URLError(e)
+        return _UrllibResponse(response, body)
+    return _UrllibResponse(response)
+
+
+def install_pytubefix_transport():
+    """Route pytubefix's HTTP requests through the pooled session"""
+    from pytubefix import request as pytubefix_request
+
+    if pytubefix_request._execute_request is not pytubefix_execute_request:
+        pytubefix_request._execute_request = pytubefix_execute_request
+        logger.info("pytubefix requests use the pooled HTTP session")
@@ -0,0 +1,266 @@
+"""
+Background download jobs for FetchVideo
+
+The download/convert/merge pipeline runs outside the request/response cycle.
+Views enqueue a job and return immediately; a bounded pool of workers picks
+the job up and drives the VideoProcessor status while it runs.
+
+Two backends are available (settings.DOWNLOAD_JOB_BACKEND):
+- 'thread': in-process thread pool, for local development and testing
+- 'celery': Celery workers with the Redis broker, for production
+"""
+import time
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from django.conf import settings
+from django.core.cache import cache
+from .pubsub import publish_job_event
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFull(Exception):
+    """Raised when the job queue cannot accept more work"""
+
+
+class DownloadJobManager:
+    """Creates, stores and dispatches download jobs"""
+
+    JOB_KEY_PREFIX = "download_job_"
+    TERMINAL_STATUSES = ('completed', 'failed')
+    PROGRESS_KEY_PREFIX = "download_job_progress_"
+    HISTORY_LIMIT = 20  # Stage changes kept per job
+
+    @staticmethod
+    def _job_key(job_id):
+        return f"{DownloadJobManager.JOB_KEY_PREFIX}{job_id}"
+
+    @staticmethod
+    def _progress_key(job_id):
+        return f"{DownloadJobManager.PROGRESS_KEY_PREFIX}{job_id}"
+
+    @staticmethod
+    def _job_timeout():
+        return getattr(settings, 'DOWNLOAD_JOB_TIMEOUT', 3600)
+
+    @staticmethod
+    def create_job(video_id, video_quality, session_key):
+        """Create and store a new queued job record"""
+        now = datetime.now().isoformat()
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'video_id': video_id,
+            'video_quality': video_quality,
+            'session_key': session_key,
+            'status': 'queued',
+            'message': 'Waiting for a free worker...',
+            'video_name': None,
+            'temp_dir': None,
+            'content_key': None,
+            'created_at': now,
+            'started_at': None,
+            'finished_at': None,
+            'updated_at': now,
+        }
+        cache.set(DownloadJobManager._job_key(job['job_id']), job, DownloadJobManager._job_timeout())
+        return job
+
+    @staticmethod
+    def get_job(job_id):
+        """Get a job record, or None if it does not exist (or has expired)"""
+        return cache.get(DownloadJobManager._job_key(job_id))
+
+    @staticmethod
+    def update_job(job_id, **fields):
+        """Update fields of a stored job record"""
+        job = DownloadJobManager.get_job(job_id)
+        if not job:
+            logger.warning(f"Tried to update unknown job: {job_id}")
+            return None
+        job.update(fields)
+        job['updated_at'] = datetime.now().isoformat()
+        cache.set(DownloadJobManager._job_key(job_id), job, DownloadJobManager._job_timeout())
+        publish_job_event(job_id, {
+            'job_id': job_id,
+            'status': job['status'],
+            'message': job['message'],
+            'progress': 100 if job['status'] == 'completed' else 0,
+            'updated_at': job['updated_at'],
+        })
+        return job
+
+    @staticmethod
+    def get_progress(job_id):
+        """Progress record of a job (stage, percent, byte counters, history), or None"""
+        return cache.get(DownloadJobManager._progress_key(job_id))
+
+    @staticmethod
+    def record_progress(job_id, stage, progress, message, bytes_done=None, bytes_total=None):
+        """Store the pipeline progress of a job and publish it to the job's channel
+
+        Only the worker running the job writes here, so there is no contention
+        with other jobs, even for the same video.
+        """
+        now = datetime.now().isoformat()
+        record = DownloadJobManager.get_progress(job_id) or {
+            'stage': None,
+            'history': [],
+            'bytes_done': None,
+            'bytes_total': None,
+            'started_at': now,
+        }
+        if record['stage'] != stage:
+            # Keep one history entry per stage change, not per percent
+            record['history'] = (record['history'] + [
+                {'stage': stage, 'progress': progress, 'message': message, 'at': now}
+            ])[-DownloadJobManager.HISTORY_LIMIT:]
+        record.update(stage=stage, progress=progress, message=message, updated_at=now)
+        if bytes_done is not None:
+            record['bytes_done'] = bytes_done
+        if bytes_total is not None:
+            record['bytes_total'] = bytes_total
+        cache.set(DownloadJobManager._progress_key(job_id), record, DownloadJobManager._job_timeout())
+
+        publish_job_event(job_id, {
+            'job_id': job_id,
+            'status': 'running',
+            'stage': stage,
+            'progress': progress,
+            'message': message,
+            'bytes_done': record['bytes_done'],
+            'bytes_total': record['bytes_total'],
+            'updated_at': now,
+        })
+        return record
+
+    @staticmethod
+    def status_snapshot(job):
+        """Current status of a job, merged with its pipeline progress while it runs"""
+        processing = DownloadJobManager.get_progress(job['job_id']) or {}
+        return {
+            'job_id': job['job_id'],
+            'video_id': job['video_id'],
+            'video_quality': job['video_quality'],
+            'status': job['status'],
+            'stage': processing.get('stage'),
+            'message': processing.get('message', job['message']) if job['status'] == 'running' else job['message'],
+            'progress': 100 if job['status'] == 'completed' else processing.get('progress', 0),
+            'bytes_done': processing.get('bytes_done'),
+            'bytes_total': processing.get('bytes_total'),
+            'history': processing.get('history', []),
+            'created_at': job['created_at'],
+            'started_at': job.get('started_at'),
+            'finished_at': job.get('finished_at'),
+            'updated_at': job['updated_at'],
+        }
+
+    @staticmethod
+    def enqueue(video_id, video_quality, session_key):
+        """Create a job and hand it to the configured backend"""
+        job = DownloadJobManager.create_job(video_id, video_quality, session_key)
+        try:
+            get_job_backend().submit(job['job_id'])
+        except JobQueueFull:
+            DownloadJobManager.update_job(job['job_id'], status='failed', message='Server is busy, please try again shortly')
+            raise
+        logger.info(f"Enqueued download job {job['job_id']} for {video_id} at {video_quality}")
+        return job
+
+
+class ThreadPoolJobBackend:
+    """Runs jobs in a bounded in-process thread pool"""
+
+    def __init__(self, max_workers, max_pending):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fetchvideo-job')
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, job_id):
+        if not self._slots.acquire(blocking=False):
+            raise JobQueueFull()
+        metrics.jobs_queued.inc()
+        future = self._executor.submit(self._run, job_id)
+        future.add_done_callback(lambda _: self._slots.release())
+
+    @staticmethod
+    def _run(job_id):
+        metrics.jobs_queued.dec()
+        run_download_job(job_id)
+
+
+class CeleryJobBackend:
+    """Hands jobs to Celery workers"""
+
+    def submit(self, job_id):
+        from .tasks import run_download_job_task
+        run_download_job_task.delay(job_id)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_job_backend():
+    """Return the process-wide job backend, creating it on first use"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend_name = getattr(settings, 'DOWNLOAD_JOB_BACKEND', 'thread')
+                if backend_name == 'celery':
+                    _backend = CeleryJobBackend()
+                elif backend_name == 'thread':
+                    workers = getattr(settings, 'DOWNLOAD_JOB_WORKERS', 4)
+                    _backend = ThreadPoolJobBackend(
+                        max_workers=workers,
+                        max_pending=getattr(settings, 'DOWNLOAD_JOB_MAX_PENDING', workers * 10),
+                    )
+                else:
+                    raise ValueError(f"Unknown DOWNLOAD_JOB_BACKEND: {backend_name}")
+    return _backend
+
+
+def run_download_job(job_id):
+    """Execute a download job (called by the worker, never by a request)"""
+    from .views import VideoProcessor, download_video_with_best_audio
+
+    job = DownloadJobManager.get_job(job_id)
+    if not job:
+        logger.error(f"Download job {job_id} not found")
+        return
+
+    DownloadJobManager.update_job(
+        job_id, status='running', message='Download started', started_at=datetime.now().isoformat()
+    )
+    processor = VideoProcessor(job['video_id'], job_id=job_id)
+    started = time.monotonic()
+    metrics.jobs_active.inc()
+
+    try:
+        video_name, temp_dir, content_key = download_video_with_best_audio(
+            job['session_key'], job['video_id'], job['video_quality'], processor
+        )
+    except Exception as e:
+        logger.error(f"Download job {job_id} crashed: {str(e)}")
+        processor._update_status('error', 0, f'Download failed: {str(e)}')
+        video_name, temp_dir, content_key = None, None, None
+    finally:
+        metrics.jobs_active.dec()
+
+    metrics.job_duration.observe(
+        time.monotonic() - started, status='completed' if video_name and temp_dir else 'failed'
+    )
+
+    if video_name and temp_dir:
+        DownloadJobManager.update_job(
+            job_id, status='completed', message='Download completed successfully',
+            video_name=video_name, temp_dir=temp_dir, content_key=content_key, finished_at=datetime.now().isoformat()
+        )
+    else:
+        DownloadJobManager.update_job(
+            job_id, status='failed', message=processor.get_status().get('message', 'Download failed'),
+            finished_at=datetime.now().isoformat()
+        )
@@ -1,8 +1,11 @@
 """
 Management command to clean up expired sessions and cached videos
 """
+from django.contrib.sessions.models import Session
 from django.core.management.base import BaseCommand
-from fetchVideoApp.session_manager import SessionTempManager, VideoCacheManager
+from django.utils import timezone
+from fetchVideoApp.models import CachedVideoEntry
+from fetchVideoApp.reaper import CleanupReaper
 
 
 class Command(BaseCommand):
@@ -17,13 +20,23 @@ class Command(BaseCommand):
         parser.add_argument(
             '--cache-only',
             action='store_true',
-            help='Only clean up expired cache, not sessions',
+            help='Only clean up expired cache and the artifact store, not sessions',
         )
         parser.add_argument(
             '--sessions-only',
             action='store_true',
             help='Only clean up expired sessions, not cache',
         )
+        parser.add_argument(
+            '--time-budget',
+            type=int,
+            help='Maximum seconds to spend; remaining work is left for the next run',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Sessions or cache entries handled per batch',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
@@ -32,29 +45,37 @@ class Command(BaseCommand):
 
         if dry_run:
             self.stdout.write('DRY RUN - No actual cleanup will be performed\n')
+            if not sessions_only:
+                expired = CachedVideoEntry.objects.filter(expires_at__lte=timezone.now()).count()
+                self.stdout.write(f'{expired} expired cached videos would be cleaned up')
+            if not cache_only:
+                expired = Session.objects.filter(expire_date__lt=timezone.now()).count()
+                self.stdout.write(f'{expired} expired sessions would be cleaned up')
+            return
 
-        if not sessions_only:
-            self.stdout.write('Cleaning up expired video cache...')
-            try:
-                VideoCacheManager.cleanup_expired_cache()
-                self.stdout.write(
-                    self.style.SUCCESS('Successfully cleaned up expired video cache')
-                )
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f'Failed to cleanup video cache: {str(e)}')
-                )
-
-        if not cache_only:
-            self.stdout.write('Cleaning up expired sessions...')
-            try:
-                SessionTempManager.cleanup_expired_sessions()
-                self.stdout.write(
-                    self.style.SUCCESS('Successfully cleaned up expired sessions')
-                )
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(f'Failed to cleanup sessions: {str(e)}')
-                )
-
-        self.stdout.write(self.style.SUCCESS('Cleanup completed!'))
\ No newline at end of file
+        reaper = CleanupReaper(
+            time_budget=options['time_budget'],
+            batch_size=options['batch_size'],
+            sessions=not cache_only,
+            cache_entries=not sessions_only,
+            store=not sessions_only,
+        )
+        try:
+            stats = reaper.run_cycle()
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Cleanup failed: {str(e)}'))
+            return
+
+        if stats is None:
+            self.stdout.write(self.style.WARNING('Another cleanup is already running, nothing done'))
+            return
+
+        self.stdout.write(
+            f"Cleaned up {stats['cache_entries']} cached videos, {stats['sessions']} sessions, "
+            f"{stats['orphan_dirs']} orphaned session directories, {stats['artifacts']} stored artifacts and "
+            f"{stats['work_dirs']} abandoned scratch directories, "
+            f"reclaimed {stats['bytes_reclaimed'] / (1024 * 1024):.1f} MB in {stats['duration']}s"
+        )
+        if stats['budget_exhausted']:
+            self.stdout.write(self.style.WARNING('Time budget exhausted, the rest is left for the next run'))
+        self.stdout.write(self.style.SUCCESS('Cleanup completed!'))
@@ -0,0 +1,297 @@
+"""
+Stream manifest cache for FetchVideo
+
+Building a YouTube() object fetches and parses the watch page and player JS,
+so it is done once per video: the extracted stream list (itag, resolution,
+fps, codecs, mime type, bitrate, size and signed URL) is cached per video_id
+and reused by the detail page, the details fetch and the download pipeline.
+The cache entry expires shortly before the signed stream URLs do.
+
+Manifests can be prefetched in the background (e.g. while the detail page
+shell renders); a video is only queued once while its prefetch is pending,
+and a failed prefetch is remembered briefly so pollers can report it.
+Stream sizes YouTube didn't report are probed with concurrent HEAD requests
+instead of one by one.
+
+Pages that only need a video's title, author, length and thumbnail use
+extract_metadata(), which reads them from the single player API response and
+leaves the streams (player JS, deciphering, HEAD probes) to the prefetch.
+"""
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
+from django.conf import settings
+from django.core.cache import cache
+from .singleflight import SingleFlight
+from .http_client import get_http_session
+from .breaker import guarded_extraction
+from .player_cache import CachedPlayerYouTube
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_KEY_PREFIX = 'stream_manifest_'
+PREFETCH_ERROR_KEY_PREFIX = 'stream_manifest_error_'
+PREFETCH_ERROR_TIMEOUT = 60
+MANIFEST_MAX_TIMEOUT = 6 * 3600  # Signed URLs usually live ~6 hours
+MANIFEST_EXPIRY_MARGIN = 10 * 60  # Leave time to actually download before URLs expire
+FILESIZE_PROBE_WORKERS = 8
+
+# Concurrent requests for the same manifest share one extraction
+_manifest_flight = SingleFlight(lock_timeout=120, poll_interval=0.2)
+_prefetch_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'MANIFEST_PREFETCH_WORKERS', 4), thread_name_prefix='fetchvideo-manifest'
+)
+# Videos queued or being prefetched in this process
+_prefetching = set()
+_prefetching_lock = threading.Lock()
+
+
+def _url_expiry(url):
+    """Unix timestamp at which a signed googlevideo URL expires, if present"""
+    try:
+        return int(parse_qs(urlparse(url).query)['expire'][0])
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+def _resolution_height(resolution):
+    try:
+        return int(str(resolution).split('p')[0])
+    except ValueError:
+        return 0
+
+
+class StreamInfo:
+    """Plain, cacheable description of one stream"""
+
+    FIELDS = ('itag', 'type', 'mime_type', 'subtype', 'resolution', 'fps', 'codecs',
+              'video_codec', 'audio_codec', 'abr', 'filesize', 'url', 'is_sabr')
+
+    def __init__(self, **fields):
+        for name in self.FIELDS:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_pytubefix(cls, stream):
+        # Read the reported contentLength directly; the public filesize property
+        # would send a blocking HEAD request per stream when it is missing
+        filesize = getattr(stream, '_filesize', 0)
+        return cls(
+            itag=stream.itag,
+            type=stream.type,
+            mime_type=stream.mime_type,
+            subtype=stream.subtype,
+            resolution=stream.resolution,
+            fps=getattr(stream, 'fps', None),
+            codecs=list(stream.codecs or []),
+            video_codec=stream.video_codec,
+            audio_codec=stream.audio_codec,
+            abr=stream.abr,
+            filesize=filesize or 0,
+            url=stream.url,
+            is_sabr=stream.is_sabr,
+        )
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    def __repr__(self):
+        return f"<StreamInfo itag={self.itag} type={self.type} resolution={self.resolution} abr={self.abr}>"
+
+
+class StreamManifest:
+    """All streams of a video plus when their URLs expire"""
+
+    def __init__(self, video_id, streams, expires_at=None):
+        self.video_id = video_id
+        self.streams = streams
+        self.expires_at = expires_at
+
+    def filter(self, type=None, resolution=None):
+        return [
+            s for s in self.streams
+            if (type is None or s.type == type) and (resolution is None or s.resolution == resolution)
+        ]
+
+    def video_streams(self):
+        """Video streams, highest resolution first"""
+        return sorted(self.filter(type='video'), key=lambda s: _resolution_height(s.resolution), reverse=True)
+
+    def audio_streams(self):
+        return self.filter(type='audio')
+
+    def get_by_itag(self, itag):
+        return next((s for s in self.streams if s.itag == itag), None)
+
+    def timeout(self):
+        """Seconds this manifest may stay cached"""
+        if not self.expires_at:
+            return MANIFEST_MAX_TIMEOUT
+        return max(0, min(MANIFEST_MAX_TIMEOUT, self.expires_at - time.time() - MANIFEST_EXPIRY_MARGIN))
+
+    def to_dict(self):
+        return {
+            'video_id': self.video_id,
+            'expires_at': self.expires_at,
+            'streams': [s.to_dict() for s in self.streams],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['video_id'], [StreamInfo(**s) for s in data['streams']], data.get('expires_at'))
+
+    @classmethod
+    def from_youtube(cls, video_id, yt):
+        streams = [StreamInfo.from_pytubefix(s) for s in yt.streams]
+        probe_filesizes(streams)
+        expiries = [e for e in (_url_expiry(s.url) for s in streams if s.url) if e]
+        return cls(video_id, streams, min(expiries) if expiries else None)
+
+
+def _probe_filesize(stream):
+    try:
+        response = get_http_session().head(stream.url, allow_redirects=True, timeout=10)
+        stream.filesize = int(response.headers.get('Content-Length', 0))
+    except Exception as e:
+        logger.warning(f"Could not probe size of stream {stream.itag}: {str(e)}")
+
+
+def probe_filesizes(streams):
+    """Fill in missing stream sizes with concurrent HEAD requests"""
+    missing = [s for s in streams if not s.filesize and s.url and not s.is_sabr]
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(FILESIZE_PROBE_WORKERS, len(missing))) as executor:
+            list(executor.map(_probe_filesize, missing))
+
+
+def _manifest_key(video_id):
+    return f"{MANIFEST_KEY_PREFIX}{video_id}"
+
+
+def cache_manifest(manifest):
+    timeout = manifest.timeout()
+    if timeout > 0:
+        cache.set(_manifest_key(manifest.video_id), manifest.to_dict(), timeout)
+
+
+def extract_video(video_id):
+    """Build the YouTube object once and cache its stream manifest
+
+    Returns (yt, manifest) so callers that also need video metadata don't
+    have to extract again. Raises ExtractionFailed without contacting YouTube
+    if this video failed recently or the circuit breaker is open.
+    """
+    with guarded_extraction(video_id):
+        # YouTube() itself is lazy, reading the streams is what contacts YouTube
+        yt = CachedPlayerYouTube(f'https://www.youtube.com/watch?v={video_id}')
+        manifest = StreamManifest.from_youtube(video_id, yt)
+    cache_manifest(manifest)
+    logger.info(f"Extracted {len(manifest.streams)} streams for {video_id}")
+    return yt, manifest
+
+
+def _parse_publish_date(value):
+    try:
+        publish_date = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if publish_date.tzinfo is None:
+        publish_date = publish_date.replace(tzinfo=timezone.utc)
+    return publish_date
+
+
+def extract_metadata(video_id):
+    """Video fields from the player API response, without extracting streams
+
+    One request instead of the watch page, player JS and stream probes of
+    extract_video(). Unavailable videos raise pytubefix's usual exceptions,
+    and the same negative cache and circuit breaker apply.
+    """
+    with guarded_extraction(video_id):
+        yt = CachedPlayerYouTube(f'https://www.youtube.com/watch?v={video_id}')
+        # Reads the player response only, unlike yt.length or yt.publish_date
+        yt.check_availability()
+        info = yt.vid_info
+    details = info.get('videoDetails', {})
+    thumbnails = details.get('thumbnail', {}).get('thumbnails')
+    microformat = info.get('microformat', {}).get('playerMicroformatRenderer', {})
+    return {
+        'title': details.get('title'),
+        'author': details.get('author'),
+        'length': int(details.get('lengthSeconds') or 0),
+        'views': int(details.get('viewCount') or 0),
+        'description': details.get('shortDescription') or '',
+        'thumbnail_url': thumbnails[-1]['url'] if thumbnails else f'https://img.youtube.com/vi/{video_id}/maxresdefault.jpg',
+        'publish_date': _parse_publish_date(microformat.get('publishDate')),
+    }
+
+
+def get_cached_stream_manifest(video_id):
+    """The cached stream manifest, or None without extracting it"""
+    cached = cache.get(_manifest_key(video_id))
+    if cached:
+        manifest = StreamManifest.from_dict(cached)
+        if manifest.timeout() > 0:
+            return manifest
+    return None
+
+
+def get_stream_manifest(video_id):
+    """Return the cached stream manifest, extracting it on a miss"""
+    manifest = get_cached_stream_manifest(video_id)
+    if manifest:
+        return manifest
+
+    def load():
+        # Re-check: the manifest may have been extracted while we waited
+        return get_cached_stream_manifest(video_id) or extract_video(video_id)[1]
+
+    return _manifest_flight.do(_manifest_key(video_id), load)
+
+
+def _prefetch_error_key(video_id):
+    return f"{PREFETCH_ERROR_KEY_PREFIX}{video_id}"
+
+
+def _prefetch(video_id):
+    try:
+        get_stream_manifest(video_id)
+    except Exception as e:
+        logger.warning(f"Manifest prefetch failed for {video_id}: {str(e)}")
+        cache.set(_prefetch_error_key(video_id), str(e)[:500], PREFETCH_ERROR_TIMEOUT)
+    finally:
+        with _prefetching_lock:
+            _prefetching.discard(video_id)
+
+
+def prefetch_stream_manifest(video_id, retry_failed=False):
+    """Start extracting the manifest in the background unless it is cached or already queued
+
+    A recently failed prefetch is only started again with retry_failed.
+    """
+    if cache.get(_manifest_key(video_id)) is not None:
+        return
+    if retry_failed:
+        cache.delete(_prefetch_error_key(video_id))
+    elif cache.get(_prefetch_error_key(video_id)) is not None:
+        return
+    with _prefetching_lock:
+        if video_id in _prefetching:
+            return
+        _prefetching.add(video_id)
+    _prefetch_executor.submit(_prefetch, video_id)
+
+
+def get_prefetch_error(video_id):
+    """Error message of a recently failed prefetch, or None"""
+    return cache.get(_prefetch_error_key(video_id))
+
+
+def get_pytubefix_stream(video_id, itag):
+    """Fresh pytubefix Stream for streams that can't be fetched by URL (SABR)"""
+    with guarded_extraction(video_id):
+        yt = CachedPlayerYouTube(f'https://www.youtube.com/watch?v={video_id}')
+        return yt.streams.get_by_itag(itag)
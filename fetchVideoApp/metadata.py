@@ -0,0 +1,144 @@
+"""
+Cached video metadata for FetchVideo
+
+Pages and jobs only read a handful of Video fields, so the cache holds a
+small immutable VideoRecord instead of a pickled model instance. Records are
+stored as versioned compact JSON; entries written by an older format (or a
+pickled Video from before) are treated as misses and rebuilt from the database.
+
+Records are never saved back. Counter flushes drop the cached records of the
+videos they updated, and current_views() adds the increments still waiting in
+the buffer, so displayed counts don't lag behind the flush interval.
+"""
+import json
+import logging
+from dataclasses import dataclass, fields
+from datetime import datetime
+from typing import ClassVar, Optional
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+CACHE_TIMEOUT = 3600
+
+
+@dataclass(frozen=True, slots=True)
+class VideoRecord:
+    """Read-only snapshot of a Video for templates, jobs and the cache"""
+
+    FORMAT_VERSION: ClassVar[int] = 1
+
+    video_id: str
+    title: str
+    url: str
+    channel_title: str
+    duration: str
+    thumbnail_url: str
+    views: int = 0
+    description: str = ''
+    publish_date: Optional[datetime] = None
+    is_available: bool = True
+
+    @classmethod
+    def from_video(cls, video):
+        return cls(
+            video_id=video.video_id,
+            title=video.title,
+            url=video.url,
+            channel_title=video.channel_title,
+            duration=video.duration,
+            thumbnail_url=video.thumbnail_url,
+            views=video.views or 0,
+            description=video.description or '',
+            publish_date=video.publish_date,
+            is_available=video.is_available,
+        )
+
+    def _json_values(self):
+        for field in fields(self):
+            value = getattr(self, field.name)
+            yield value.isoformat() if isinstance(value, datetime) else value
+
+    def dumps(self):
+        """Compact JSON: the format version followed by the field values in order"""
+        return json.dumps([self.FORMAT_VERSION, *self._json_values()], separators=(',', ':'))
+
+    @classmethod
+    def loads(cls, data):
+        """Record from dumps() output, or None if it isn't in the current format"""
+        if not isinstance(data, str):
+            return None
+        try:
+            version, *values = json.loads(data)
+            if version != cls.FORMAT_VERSION:
+                return None
+            record = dict(zip((field.name for field in fields(cls)), values))
+            if record['publish_date']:
+                record['publish_date'] = datetime.fromisoformat(record['publish_date'])
+            return cls(**record)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Discarding unreadable video metadata: {str(e)}")
+            return None
+
+    def as_dict(self):
+        """JSON-serializable dict of the record"""
+        return dict(zip((field.name for field in fields(self)), self._json_values()))
+
+    def current_views(self):
+        """Page views including the ones not flushed to the database yet"""
+        from .counters import video_counters
+        return self.views + video_counters.pending(self.video_id, 'views')
+
+    def increment_views(self):
+        """Count a page view (buffered, written with the next counter flush)"""
+        from .counters import video_counters
+        video_counters.increment(self.video_id, 'views')
+
+    def increment_download(self):
+        """Count a download (buffered, written with the next counter flush)"""
+        from .counters import video_counters
+        video_counters.increment(self.video_id, 'download_count')
+
+
+class VideoMetadataCache:
+    """Reads and writes VideoRecords in the cache"""
+
+    KEY_PREFIX = "video_details_"
+
+    @staticmethod
+    def key(video_id):
+        return f"{VideoMetadataCache.KEY_PREFIX}{video_id}"
+
+    @staticmethod
+    def get(video_id):
+        return VideoRecord.loads(cache.get(VideoMetadataCache.key(video_id)))
+
+    @staticmethod
+    def set(record):
+        cache.set(VideoMetadataCache.key(record.video_id), record.dumps(), CACHE_TIMEOUT)
+
+    @staticmethod
+    def get_many(video_ids):
+        """{video_id: VideoRecord} for the cached ones, in one cache round trip"""
+        found = cache.get_many([VideoMetadataCache.key(video_id) for video_id in video_ids])
+        records = {}
+        for key, data in found.items():
+            record = VideoRecord.loads(data)
+            if record:
+                records[record.video_id] = record
+        return records
+
+    @staticmethod
+    def set_many(records):
+        if records:
+            cache.set_many({VideoMetadataCache.key(record.video_id): record.dumps() for record in records}, CACHE_TIMEOUT)
+
+    @staticmethod
+    def delete(video_id):
+        cache.delete(VideoMetadataCache.key(video_id))
+
+    @staticmethod
+    def delete_many(video_ids):
+        if video_ids:
+            cache.delete_many([VideoMetadataCache.key(video_id) for video_id in video_ids])
+
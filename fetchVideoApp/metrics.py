@@ -0,0 +1,410 @@
+"""
+Prometheus metrics for FetchVideo
+
+A small registry of counters, gauges and histograms rendered in the
+Prometheus text format at /metrics (no client library needed).
+
+Each process keeps its own values. When settings.METRICS_DIR is set, every
+process also writes a snapshot of them to METRICS_DIR/<pid>.json every
+METRICS_WRITE_INTERVAL seconds, and /metrics merges the snapshots of all
+processes: counters and histograms are summed over every file, gauges only
+over processes that are still alive. Clear the directory when redeploying.
+"""
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+class Metric:
+    """Base class: a named family of values keyed by label values"""
+
+    type = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(label, '')) for label in self.labels)
+
+    def snapshot(self):
+        with self._lock:
+            values = [[list(key), value] for key, value in self._values.items()]
+        return {'type': self.type, 'help': self.documentation, 'labels': list(self.labels), 'values': values}
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        registry.touch()
+
+    def set(self, value, **labels):
+        """Set the total directly, for counters mirrored from another source"""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+        registry.touch()
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        registry.touch()
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # [per-bucket counts (last one is +Inf), sum, count]
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+        registry.touch()
+
+    def snapshot(self):
+        with self._lock:
+            values = [[list(key), [list(entry[0]), entry[1], entry[2]]] for key, entry in self._values.items()]
+        return {'type': self.type, 'help': self.documentation, 'labels': list(self.labels),
+                'buckets': list(self.buckets), 'values': values}
+
+
+class Registry:
+    """All metrics of this process, plus the snapshot writer for multi-process setups"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._writer = None
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector):
+        """Call collector() before every snapshot, to refresh metrics read from elsewhere"""
+        self._collectors.append(collector)
+
+    def snapshot(self):
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {str(e)}")
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    # Multi-process snapshots
+
+    @staticmethod
+    def metrics_dir():
+        return getattr(settings, 'METRICS_DIR', None)
+
+    def touch(self):
+        """Start the snapshot writer on the first update, if METRICS_DIR is set"""
+        if self._writer is None and self.metrics_dir():
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name='fetchvideo-metrics', daemon=True)
+                    self._writer.start()
+
+    def _write_loop(self):
+        interval = getattr(settings, 'METRICS_WRITE_INTERVAL', 5)
+        while True:
+            time.sleep(interval)
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        directory = self.metrics_dir()
+        if not directory:
+            return
+        try:
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{os.getpid()}.json")
+            with open(f"{path}.tmp", 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(f"{path}.tmp", path)
+        except Exception as e:
+            logger.error(f"Failed to write metrics snapshot: {str(e)}")
+
+    def collect(self):
+        """Metrics of all processes merged into one snapshot"""
+        own = self.snapshot()
+        directory = self.metrics_dir()
+        if not directory or not os.path.isdir(directory):
+            return own
+
+        merged = {}
+        for name in os.listdir(directory):
+            pid, ext = os.path.splitext(name)
+            if ext != '.json' or not pid.isdigit() or int(pid) == os.getpid():
+                continue
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            merge_snapshot(merged, snapshot, alive=_process_alive(int(pid)))
+        merge_snapshot(merged, own, alive=True)
+        return merged
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _add(a, b):
+    if isinstance(a, list):
+        return [_add(x, y) for x, y in zip(a, b)]
+    return a + b
+
+
+def merge_snapshot(merged, snapshot, alive=True):
+    """Add a process snapshot into merged (gauges of dead processes are skipped)"""
+    for name, family in snapshot.items():
+        if family['type'] == 'gauge' and not alive:
+            continue
+        target = merged.setdefault(name, dict(family, values=[]))
+        values = {tuple(labels): value for labels, value in target['values']}
+        for labels, value in family['values']:
+            key = tuple(labels)
+            values[key] = _add(values[key], value) if key in values else value
+        target['values'] = [[list(key), value] for key, value in values.items()]
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def render(snapshot):
+    """Prometheus text exposition format (version 0.0.4)"""
+    lines = []
+    for name in sorted(snapshot):
+        family = snapshot[name]
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for labels, value in sorted(family['values']):
+            if family['type'] == 'histogram':
+                bucket_counts, total, count = value
+                cumulative = 0
+                bounds = list(family['buckets']) + [float('inf')]
+                for bound, bucket_count in zip(bounds, bucket_counts):
+                    cumulative += bucket_count
+                    label_text = _format_labels(family['labels'], labels, [('le', _format_value(float(bound)))])
+                    lines.append(f"{name}_bucket{label_text} {cumulative}")
+                label_text = _format_labels(family['labels'], labels)
+                lines.append(f"{name}_sum{label_text} {_format_value(total)}")
+                lines.append(f"{name}_count{label_text} {count}")
+            else:
+                lines.append(f"{name}{_format_labels(family['labels'], labels)} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+# Pipeline
+stage_duration = registry.register(Histogram(
+    'fetchvideo_stage_duration_seconds', 'Duration of pipeline stages', ('stage', 'status')
+))
+stream_bytes = registry.register(Counter(
+    'fetchvideo_stream_bytes_total', 'Bytes downloaded from YouTube per stream type', ('stream',)
+))
+video_details = registry.register(Counter(
+    'fetchvideo_video_details_total', 'Video detail lookups by where they were served from', ('source',)
+))
+merged_video_cache = registry.register(Counter(
+    'fetchvideo_merged_video_cache_total', 'Downloads served from an already merged file', ('result',)
+))
+
+# Jobs
+job_duration = registry.register(Histogram(
+    'fetchvideo_job_duration_seconds', 'Duration of download jobs', ('status',)
+))
+jobs_active = registry.register(Gauge(
+    'fetchvideo_jobs_active', 'Download jobs currently running'
+))
+jobs_queued = registry.register(Gauge(
+    'fetchvideo_jobs_queued', 'Download jobs waiting for a worker (thread backend)'
+))
+
+# Processing history
+history_dropped = registry.register(Counter(
+    'fetchvideo_history_dropped_total', 'Processing log and download history records dropped, by reason', ('reason',)
+))
+
+# YouTube extraction failures
+extraction_failures = registry.register(Counter(
+    'fetchvideo_extraction_failures_total', 'Failed YouTube extractions by error class', ('error_class',)
+))
+negative_cache_hits = registry.register(Counter(
+    'fetchvideo_negative_cache_hits_total', 'Extractions skipped because the video failed recently', ('error_class',)
+))
+breaker_rejections = registry.register(Counter(
+    'fetchvideo_breaker_rejections_total', 'Extractions rejected while the YouTube circuit breaker was open'
+))
+
+# Player JS
+player_cache = registry.register(Counter(
+    'fetchvideo_player_cache_total', 'Player JS lookups by where the player came from', ('result',)
+))
+
+# Outbound HTTP
+http_requests = registry.register(Counter(
+    'fetchvideo_http_requests_total', 'Outbound HTTP requests per host group', ('host',)
+))
+http_connections = registry.register(Counter(
+    'fetchvideo_http_connections_total', 'Outbound connections opened per host group (requests minus these reused one)', ('host',)
+))
+
+# Cache
+cache_requests = registry.register(Counter(
+    'fetchvideo_cache_requests_total', 'Cache lookups per key namespace and tier', ('namespace', 'result')
+))
+
+
+def _collect_cache_stats():
+    from django.core.cache import cache
+    if not hasattr(cache, 'stats'):
+        return
+    for namespace, counters in cache.stats().items():
+        for result, value in counters.items():
+            cache_requests.set(value, namespace=namespace, result=result)
+
+
+registry.add_collector(_collect_cache_stats)
+
+
+def disk_usage(path):
+    """Bytes used by the files under path (hardlinks counted once)"""
+    total = 0
+    seen = set()
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            if (stat.st_dev, stat.st_ino) not in seen:
+                seen.add((stat.st_dev, stat.st_ino))
+                total += stat.st_size
+    return total
+
+
+def cluster_metrics():
+    """Metrics that are the same from every process, read from shared state at scrape time"""
+    from django.core.cache import cache
+    from .reaper import CleanupReaper
+    from .breaker import youtube_breaker
+
+    families = {}
+
+    breaker = youtube_breaker.state()
+    families['fetchvideo_youtube_breaker_state'] = {
+        'type': 'gauge', 'help': 'YouTube circuit breaker state (1 for the current one)', 'labels': ['state'],
+        'values': [[[name], int(breaker['state'] == name)] for name in ('closed', 'half_open', 'open')]
+    }
+    families['fetchvideo_youtube_breaker_trips'] = {
+        'type': 'gauge', 'help': 'Consecutive trips of the YouTube circuit breaker', 'labels': [],
+        'values': [[[], breaker['trips']]]
+    }
+
+    media_bytes = cache.get('metrics_media_root_bytes')
+    if media_bytes is None:
+        media_bytes = disk_usage(settings.MEDIA_ROOT)
+        cache.set('metrics_media_root_bytes', media_bytes, getattr(settings, 'METRICS_DISK_USAGE_TTL', 60))
+    families['fetchvideo_media_root_bytes'] = {
+        'type': 'gauge', 'help': 'Bytes stored under MEDIA_ROOT', 'labels': [], 'values': [[[], media_bytes]]
+    }
+
+    reaper_stats = CleanupReaper.get_stats()
+    if reaper_stats:
+        totals = reaper_stats['totals']
+        for field, documentation in (
+            ('cycles', 'Cleanup cycles run'),
+            ('sessions', 'Expired sessions cleaned up'),
+            ('orphan_dirs', 'Orphaned session directories removed'),
+            ('cache_entries', 'Expired cached videos removed'),
+            ('artifacts', 'Stored artifacts evicted to keep the disk budget'),
+            ('work_dirs', 'Abandoned artifact scratch directories removed'),
+            ('stalled_ingests', 'Stalled playlist ingests marked failed'),
+            ('bytes_reclaimed', 'Bytes reclaimed by cleanup'),
+        ):
+            families[f'fetchvideo_cleanup_{field}_total'] = {
+                'type': 'counter', 'help': documentation, 'labels': [], 'values': [[[], totals.get(field, 0)]]
+            }
+        families['fetchvideo_cleanup_duration_seconds_total'] = {
+            'type': 'counter', 'help': 'Seconds spent in cleanup cycles', 'labels': [],
+            'values': [[[], totals.get('duration', 0)]]
+        }
+        last_cycle = reaper_stats.get('last_cycle') or {}
+        families['fetchvideo_cleanup_last_cycle_duration_seconds'] = {
+            'type': 'gauge', 'help': 'Duration of the last cleanup cycle', 'labels': [],
+            'values': [[[], last_cycle.get('duration', 0)]]
+        }
+
+    return families
+
+
+@atexit.register
+def _write_on_exit():
+    if registry._writer is not None:
+        registry.write_snapshot()
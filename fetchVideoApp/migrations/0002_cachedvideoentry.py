@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fetchVideoApp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedVideoEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cache_key', models.CharField(max_length=64, unique=True)),
+                ('video_id', models.CharField(db_index=True, max_length=100)),
+                ('quality', models.CharField(max_length=20)),
+                ('file_path', models.CharField(max_length=500)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'ordering': ['expires_at'],
+            },
+        ),
+    ]
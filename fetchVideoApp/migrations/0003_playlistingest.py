@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:04
+
+import fetchVideoApp.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fetchVideoApp', '0002_cachedvideoentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlaylistIngest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ingest_id', models.CharField(default=fetchVideoApp.models.new_ingest_id, editable=False, max_length=32, unique=True)),
+                ('url', models.URLField(max_length=500)),
+                ('title', models.CharField(blank=True, max_length=255)),
+                ('session_key', models.CharField(db_index=True, max_length=40)),
+                ('video_quality', models.CharField(max_length=20)),
+                ('download', models.BooleanField(default=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('next_index', models.PositiveIntegerField(default=0)),
+                ('videos_ingested', models.PositiveIntegerField(default=0)),
+                ('videos_failed', models.PositiveIntegerField(default=0)),
+                ('batch_ids', models.JSONField(blank=True, default=list)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
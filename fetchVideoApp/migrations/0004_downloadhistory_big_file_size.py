@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fetchVideoApp', '0003_playlistingest'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='downloadhistory',
+            name='file_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fetchVideoApp', '0004_downloadhistory_big_file_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='playlistingest',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,3 +1,4 @@
+import uuid
 from django.db import models
 from django.utils import timezone
 
@@ -53,10 +54,14 @@ class Video(models.Model):
         return None
 
     def increment_download(self):
-        """Increment download count and update timestamp"""
-        self.download_count += 1
-        self.last_downloaded = timezone.now()
-        self.save(update_fields=['download_count', 'last_downloaded'])
+        """Count a download (buffered, written with the next counter flush)"""
+        from .counters import video_counters
+        video_counters.increment(self.video_id, 'download_count')
+
+    def increment_views(self):
+        """Count a page view (buffered, written with the next counter flush)"""
+        from .counters import video_counters
+        video_counters.increment(self.video_id, 'views')
 
 class DownloadHistory(models.Model):
     """Track download history for analytics"""
@@ -65,7 +70,7 @@ class DownloadHistory(models.Model):
     user_agent = models.TextField(blank=True, null=True)
     quality = models.CharField(max_length=20)
     format = models.CharField(max_length=10, default='mp4')
-    file_size = models.PositiveIntegerField(blank=True, null=True)  # in bytes
+    file_size = models.PositiveBigIntegerField(blank=True, null=True)  # in bytes
     download_time = models.DateTimeField(default=timezone.now)
 
     class Meta:
@@ -103,5 +108,51 @@ class ProcessingLog(models.Model):
     def __str__(self):
         return f"{self.video_id} - {self.operation} - {self.status}"
 
+class CachedVideoEntry(models.Model):
+    """Index of VideoCacheManager entries, by video and by expiry"""
+    cache_key = models.CharField(max_length=64, unique=True)
+    video_id = models.CharField(max_length=100, db_index=True)
+    quality = models.CharField(max_length=20)
+    file_path = models.CharField(max_length=500)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
 
+    class Meta:
+        ordering = ['expires_at']
 
+    def __str__(self):
+        return f"{self.video_id} - {self.quality} - expires {self.expires_at}"
+
+def new_ingest_id():
+    return uuid.uuid4().hex
+
+class PlaylistIngest(models.Model):
+    """Progress of a playlist or channel being ingested, so it can be resumed"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    ingest_id = models.CharField(max_length=32, unique=True, default=new_ingest_id, editable=False)
+    url = models.URLField(max_length=500)
+    title = models.CharField(max_length=255, blank=True)
+    session_key = models.CharField(max_length=40, db_index=True)
+    video_quality = models.CharField(max_length=20)
+    download = models.BooleanField(default=True)  # Feed the videos to batch downloads
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    next_index = models.PositiveIntegerField(default=0)  # First playlist entry not processed yet
+    videos_ingested = models.PositiveIntegerField(default=0)
+    videos_failed = models.PositiveIntegerField(default=0)
+    batch_ids = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)  # Last sign of life of the running ingest
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.title or self.url} - {self.status} at {self.next_index}"
@@ -0,0 +1,210 @@
+"""
+Player JS and decipher cache for FetchVideo
+
+Deciphering stream signatures and the throttling "n" parameter needs
+YouTube's player JS (base.js, a few MB) and the names and parameters of the
+transform functions found in it by regex. pytubefix keeps the JS in a module
+global of one process and searches the functions again for every extraction.
+
+Both are cached here per player version, so every worker downloads and parses
+a player once at most:
+
+- process memory, for the last few players
+- the shared store: PLAYER_CACHE_DIR on disk when set (workers on one host),
+  otherwise the shared cache tier (Redis in production)
+
+The latest player is loaded from the shared store when the app starts. If
+pytubefix reports that a cached player no longer deciphers (it drops the JS
+and retries), that player is evicted and downloaded again.
+"""
+import os
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from pytubefix import YouTube, request
+from pytubefix.cipher import Cipher
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'player_js_'
+TRANSFORMS_KEY_PREFIX = 'player_transforms_'
+LATEST_KEY = 'player_latest_url'
+TIMEOUT = 7 * 24 * 3600  # Players rotate within days
+MEMORY_ENTRIES = 4
+
+PLAYER_RE = re.compile(r'/s/player/([\w-]+)/')
+
+
+def player_version(js_url):
+    """Stable id of a player: its version plus a hash of the variant path"""
+    match = PLAYER_RE.search(js_url)
+    digest = hashlib.sha1(js_url.split('?')[0].encode()).hexdigest()[:10]
+    return f"{match.group(1) if match else 'unknown'}-{digest}"
+
+
+def _shared_cache():
+    # The shared tier directly: multi-MB players shouldn't be pickled into every process LRU
+    return caches['shared'] if 'shared' in settings.CACHES else caches['default']
+
+
+class PlayerCache:
+    """Player JS and derived decipher transforms per player version"""
+
+    def __init__(self):
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Shared store
+
+    @staticmethod
+    def _disk_path(version):
+        directory = getattr(settings, 'PLAYER_CACHE_DIR', None)
+        return os.path.join(directory, f"{version}.js") if directory else None
+
+    def _load_shared(self, version):
+        path = self._disk_path(version)
+        if path:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    return f.read()
+            except OSError:
+                return None
+        return _shared_cache().get(f"{KEY_PREFIX}{version}")
+
+    def _store_shared(self, version, js):
+        path = self._disk_path(version)
+        try:
+            if path:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(f"{path}.{os.getpid()}.tmp", 'w', encoding='utf-8') as f:
+                    f.write(js)
+                os.replace(f"{path}.{os.getpid()}.tmp", path)
+            else:
+                _shared_cache().set(f"{KEY_PREFIX}{version}", js, TIMEOUT)
+        except Exception as e:
+            logger.warning(f"Could not store player {version}: {str(e)}")
+
+    def _remember(self, version, js):
+        with self._lock:
+            self._memory[version] = js
+            self._memory.move_to_end(version)
+            while len(self._memory) > MEMORY_ENTRIES:
+                self._memory.popitem(last=False)
+
+    # Player JS
+
+    def get_js(self, js_url):
+        """Player JS for js_url from memory, the shared store or YouTube"""
+        version = player_version(js_url)
+        with self._lock:
+            js = self._memory.get(version)
+        if js:
+            metrics.player_cache.inc(result='memory')
+            return js
+
+        js = self._load_shared(version)
+        if js:
+            metrics.player_cache.inc(result='shared')
+        else:
+            metrics.player_cache.inc(result='fetched')
+            js = request.get(js_url)
+            self._store_shared(version, js)
+            logger.info(f"Downloaded player {version} ({len(js)} bytes)")
+        self._remember(version, js)
+        _shared_cache().set(LATEST_KEY, js_url, TIMEOUT)
+        return js
+
+    def invalidate(self, js_url):
+        """Forget a player that no longer deciphers"""
+        version = player_version(js_url)
+        with self._lock:
+            self._memory.pop(version, None)
+        path = self._disk_path(version)
+        if path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        shared = _shared_cache()
+        shared.delete_many([f"{KEY_PREFIX}{version}", f"{TRANSFORMS_KEY_PREFIX}{version}"])
+        logger.warning(f"Evicted player {version} from the cache")
+
+    # Decipher transforms
+
+    def get_transform(self, js_url, name):
+        transforms = _shared_cache().get(f"{TRANSFORMS_KEY_PREFIX}{player_version(js_url)}") or {}
+        return transforms.get(name)
+
+    def set_transform(self, js_url, name, value):
+        key = f"{TRANSFORMS_KEY_PREFIX}{player_version(js_url)}"
+        shared = _shared_cache()
+        transforms = shared.get(key) or {}
+        transforms[name] = value
+        shared.set(key, transforms, TIMEOUT)
+
+    def warm(self):
+        """Load the most recently used player from the shared store into memory"""
+        try:
+            js_url = _shared_cache().get(LATEST_KEY)
+            if not js_url:
+                return False
+            js = self._load_shared(player_version(js_url))
+            if js:
+                self._remember(player_version(js_url), js)
+                logger.info(f"Warmed player cache with {player_version(js_url)}")
+                return True
+        except Exception as e:
+            logger.warning(f"Could not warm the player cache: {str(e)}")
+        return False
+
+
+player_cache = PlayerCache()
+
+
+class CachedPlayerYouTube(YouTube):
+    """YouTube that takes its player JS from the player cache"""
+
+    @property
+    def js(self):
+        if self._js:
+            return self._js
+        js_url = self.js_url
+        if getattr(self, '_cached_player_url', None) == js_url:
+            # pytubefix dropped the JS we gave it because deciphering failed
+            player_cache.invalidate(js_url)
+        self._js = player_cache.get_js(js_url)
+        self._cached_player_url = js_url
+        return self._js
+
+
+def _cached_function_name(original, name, param_attr):
+    """Wrap a Cipher.get_*_function_name method with the transform cache"""
+
+    def wrapper(self, js, js_url):
+        cached = player_cache.get_transform(js_url, name)
+        if cached:
+            setattr(self, param_attr, cached['param'])
+            return cached['function']
+        function = original(self, js, js_url)
+        player_cache.set_transform(js_url, name, {'function': function, 'param': getattr(self, param_attr)})
+        return function
+
+    wrapper.__wrapped__ = original
+    return wrapper
+
+
+def install_decipher_cache():
+    """Cache the sig/nsig function lookups of pytubefix's Cipher per player version"""
+    if hasattr(Cipher.get_sig_function_name, '__wrapped__'):
+        return
+    Cipher.get_sig_function_name = _cached_function_name(Cipher.get_sig_function_name, 'sig', '_sig_param_val')
+    Cipher.get_nsig_function_name = _cached_function_name(Cipher.get_nsig_function_name, 'nsig', '_nsig_param_val')
+
+
+def warm_in_background():
+    threading.Thread(target=player_cache.warm, name='fetchvideo-player-warm', daemon=True).start()
@@ -0,0 +1,329 @@
+"""
+Playlist and channel ingestion for FetchVideo
+
+Entries are enumerated lazily, page by page, from pytubefix's Playlist or
+Channel, and processed in chunks: details of the videos not already in the
+database are fetched concurrently, stored with one bulk insert, and the chunk
+is handed to the batch download pipeline. The next chunk starts once that
+batch has finished (or after PLAYLIST_BATCH_TIMEOUT), which keeps the job
+queue from being flooded.
+
+Each chunk is one task on the ingest executor, so ingests take turns and none
+holds a worker while its downloads run: a timer checks the batch every
+PLAYLIST_BATCH_POLL_INTERVAL seconds and queues the next chunk when it is done.
+
+The index of the first unprocessed entry is saved after every chunk, so an
+interrupted ingest resumes where it stopped instead of starting over. A
+running ingest refreshes heartbeat_at while a chunk is processed (every
+PLAYLIST_HEARTBEAT_INTERVAL seconds) and on every batch check. One whose
+heartbeat is older than PLAYLIST_STALL_TIMEOUT, or that has been queued
+longer than PLAYLIST_QUEUE_TIMEOUT, lost its process: the reaper (or a status
+read) marks it failed, and it can then be resumed.
+"""
+import re
+import time
+import logging
+import threading
+from datetime import timedelta
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q
+from django.utils import timezone
+from pytubefix import Playlist, Channel
+from .models import PlaylistIngest
+from .batches import BatchManager
+
+logger = logging.getLogger(__name__)
+
+PLAYLIST_RE = re.compile(r'youtube\.com/.*[?&]list=([a-zA-Z0-9_-]+)')
+CHANNEL_RE = re.compile(r'youtube\.com/(?:@[\w.-]+|channel/[\w-]+|c/[\w.-]+|user/[\w.-]+)')
+VIDEO_ID_RE = re.compile(r'(?:v=|youtu\.be/|shorts/)([a-zA-Z0-9_-]{11})')
+
+_ingest_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='fetchvideo-playlist')
+_active_ingests = set()
+_entry_iterators = {}  # ingest_id -> (next index, entry iterator), kept between chunks
+_active_lock = threading.Lock()
+
+
+def is_playlist_url(url):
+    """True for playlist and channel URLs"""
+    return bool(PLAYLIST_RE.search(url) or CHANNEL_RE.search(url))
+
+
+def _playlist_source(url):
+    return Playlist(url) if PLAYLIST_RE.search(url) else Channel(url)
+
+
+def iter_playlist_video_ids(url, start=0):
+    """Yield (index, video_id) for the entries of a playlist or channel, fetching pages lazily"""
+    source = _playlist_source(url)
+    urls = islice(source.url_generator(), start, None)
+    for index, video_url in enumerate(urls, start=start):
+        match = VIDEO_ID_RE.search(video_url)
+        if match:
+            yield index, match.group(1)
+
+
+def playlist_title(url):
+    try:
+        source = _playlist_source(url)
+        return (source.channel_name if isinstance(source, Channel) else source.title) or ''
+    except Exception as e:
+        logger.warning(f"Could not read title of {url}: {str(e)}")
+        return ''
+
+
+def ingest_videos(video_ids):
+    """Make sure Video rows exist for video_ids; returns the ids that are available
+
+    Videos already cached or in the database are skipped, the rest are
+    extracted concurrently and inserted with a single bulk_create.
+    """
+    from .views import fetch_video_details_many
+
+    records = fetch_video_details_many(video_ids, workers=getattr(settings, 'PLAYLIST_METADATA_WORKERS', 4))
+    return [video_id for video_id in video_ids if video_id in records]
+
+
+class PlaylistIngestManager:
+    """Starts, runs and resumes playlist ingests"""
+
+    @staticmethod
+    def start(url, session_key, video_quality, download=True):
+        ingest = PlaylistIngest.objects.create(
+            url=url, session_key=session_key, video_quality=video_quality, download=download
+        )
+        PlaylistIngestManager.submit(ingest.ingest_id)
+        return ingest
+
+    @staticmethod
+    def submit(ingest_id):
+        """Queue the next chunk of the ingest unless it is already queued in this process"""
+        with _active_lock:
+            if ingest_id in _active_ingests:
+                return False
+            _active_ingests.add(ingest_id)
+        _ingest_executor.submit(PlaylistIngestManager.run, ingest_id)
+        return True
+
+    @staticmethod
+    def resume(ingest):
+        """Continue a failed (or stalled) ingest from its last processed index
+
+        Only one resume wins: the ingest is claimed with a conditional update
+        and queued as pending; run() marks it running once a worker takes it.
+        """
+        PlaylistIngestManager.fail_stalled(ingest_id=ingest.ingest_id)
+        now = timezone.now()
+        claimed = PlaylistIngest.objects.filter(ingest_id=ingest.ingest_id, status='failed').update(
+            status='pending', error='', heartbeat_at=now, updated_at=now
+        )
+        ingest.refresh_from_db()
+        if not claimed:
+            return False
+        return PlaylistIngestManager.submit(ingest.ingest_id)
+
+    @staticmethod
+    def _stale(cutoff):
+        return Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, updated_at__lt=cutoff)
+
+    @staticmethod
+    def fail_stalled(ingest_id=None, limit=None):
+        """Mark ingests whose process is gone as failed; returns how many were marked
+
+        Running ingests are stalled when their heartbeat is older than
+        PLAYLIST_STALL_TIMEOUT, queued ones when they have waited longer than
+        PLAYLIST_QUEUE_TIMEOUT.
+        """
+        now = timezone.now()
+        stalled_condition = (
+            Q(status='running') & PlaylistIngestManager._stale(
+                now - timedelta(seconds=getattr(settings, 'PLAYLIST_STALL_TIMEOUT', 300)))
+            | Q(status='pending') & PlaylistIngestManager._stale(
+                now - timedelta(seconds=getattr(settings, 'PLAYLIST_QUEUE_TIMEOUT', 3600)))
+        )
+        stalled = PlaylistIngest.objects.filter(stalled_condition)
+        if ingest_id:
+            stalled = stalled.filter(ingest_id=ingest_id)
+        ids = list(stalled.values_list('id', flat=True)[:limit])
+        if not ids:
+            return 0
+        # Re-check in the update, a live ingest may have beaten since the select
+        marked = PlaylistIngest.objects.filter(stalled_condition, id__in=ids).update(
+            status='failed', error='The ingest stopped responding', updated_at=now
+        )
+        if marked:
+            logger.warning(f"Marked {marked} stalled playlist ingests as failed")
+        return marked
+
+    @staticmethod
+    def _heartbeat(ingest_id, stop_event):
+        """Refresh heartbeat_at while a chunk is processed"""
+        interval = getattr(settings, 'PLAYLIST_HEARTBEAT_INTERVAL', 30)
+        try:
+            while not stop_event.wait(interval):
+                try:
+                    PlaylistIngest.objects.filter(ingest_id=ingest_id, status='running').update(
+                        heartbeat_at=timezone.now()
+                    )
+                except Exception as e:
+                    logger.warning(f"Playlist ingest {ingest_id} heartbeat failed: {str(e)}")
+        finally:
+            connection.close()
+
+    @staticmethod
+    def _entries(ingest):
+        """Entry iterator positioned at ingest.next_index, reusing the previous chunk's"""
+        with _active_lock:
+            cached = _entry_iterators.pop(ingest.ingest_id, None)
+        if cached and cached[0] == ingest.next_index:
+            return cached[1]
+        return iter_playlist_video_ids(ingest.url, start=ingest.next_index)
+
+    @staticmethod
+    def _forget_entries(ingest_id):
+        with _active_lock:
+            _entry_iterators.pop(ingest_id, None)
+
+    @staticmethod
+    def run(ingest_id):
+        """Process the next chunk of a queued ingest"""
+        stop_heartbeat = threading.Event()
+        requeue = False
+        try:
+            now = timezone.now()
+            claimed = PlaylistIngest.objects.filter(ingest_id=ingest_id, status='pending').update(
+                status='running', error='', heartbeat_at=now, updated_at=now
+            )
+            if not claimed:
+                return  # Failed while queued, or taken by another process
+            threading.Thread(
+                target=PlaylistIngestManager._heartbeat, args=(ingest_id, stop_heartbeat),
+                name=f'fetchvideo-playlist-heartbeat-{ingest_id[:8]}', daemon=True
+            ).start()
+
+            ingest = PlaylistIngest.objects.get(ingest_id=ingest_id)
+            if not ingest.title:
+                ingest.title = playlist_title(ingest.url)[:255]
+                ingest.save(update_fields=['title', 'updated_at'])
+
+            chunk_size = getattr(settings, 'BATCH_MAX_VIDEOS', 10)
+            max_videos = getattr(settings, 'PLAYLIST_MAX_VIDEOS', 500)
+            chunk = []
+            if ingest.next_index < max_videos:
+                logger.info(f"Ingesting {ingest.url} from entry {ingest.next_index}")
+                entries = PlaylistIngestManager._entries(ingest)
+                chunk = list(islice(entries, min(chunk_size, max_videos - ingest.next_index)))
+            if not chunk:
+                ingest.status = 'completed'
+                ingest.save(update_fields=['status', 'updated_at'])
+                logger.info(f"Finished ingesting {ingest.url}: {ingest.videos_ingested} videos")
+                return
+
+            video_ids = list(dict.fromkeys(video_id for _, video_id in chunk))
+            available = ingest_videos(video_ids)
+            next_index = chunk[-1][0] + 1
+            with _active_lock:
+                _entry_iterators[ingest_id] = (next_index, entries)
+            # Saved together once the chunk is done: a resume starts after it
+            progress = {
+                'next_index': next_index,
+                'videos_ingested': F('videos_ingested') + len(available),
+                'videos_failed': F('videos_failed') + len(video_ids) - len(available),
+            }
+
+            if ingest.download and available:
+                batch = BatchManager.submit(
+                    [(video_id, ingest.video_quality) for video_id in available], ingest.session_key
+                )
+                ingest.batch_ids = ingest.batch_ids + [batch['batch_id']]
+                ingest.save(update_fields=['batch_ids', 'updated_at'])
+                deadline = time.monotonic() + getattr(
+                    settings, 'PLAYLIST_BATCH_TIMEOUT', getattr(settings, 'DOWNLOAD_JOB_TIMEOUT', 3600)
+                )
+                PlaylistIngestManager._schedule_batch_check(ingest_id, batch['batch_id'], progress, deadline)
+            else:
+                PlaylistIngest.objects.filter(ingest_id=ingest_id).update(
+                    status='pending', heartbeat_at=timezone.now(), updated_at=timezone.now(), **progress
+                )
+                requeue = True
+
+        except Exception as e:
+            logger.error(f"Playlist ingest {ingest_id} failed: {str(e)}")
+            PlaylistIngest.objects.filter(ingest_id=ingest_id).update(
+                status='failed', error=str(e), updated_at=timezone.now()
+            )
+            PlaylistIngestManager._forget_entries(ingest_id)
+        finally:
+            stop_heartbeat.set()
+            with _active_lock:
+                _active_ingests.discard(ingest_id)
+            # Executor threads live on, don't leave their connection open
+            connection.close()
+        if requeue:
+            PlaylistIngestManager.submit(ingest_id)
+
+    @staticmethod
+    def _schedule_batch_check(ingest_id, batch_id, progress, deadline):
+        timer = threading.Timer(
+            getattr(settings, 'PLAYLIST_BATCH_POLL_INTERVAL', 5), PlaylistIngestManager._check_batch,
+            args=(ingest_id, batch_id, progress, deadline)
+        )
+        timer.daemon = True
+        timer.start()
+
+    @staticmethod
+    def _check_batch(ingest_id, batch_id, progress, deadline):
+        """Queue the next chunk once the chunk's batch has finished (runs in a timer thread)"""
+        finished = False
+        try:
+            batch = BatchManager.get_batch(batch_id)
+            # A batch that expired from the cache is as finished as it will get
+            finished = not batch or BatchManager.status_snapshot(batch)['status'] in ('completed', 'failed')
+            if not finished and time.monotonic() >= deadline:
+                logger.warning(f"Batch {batch_id} of playlist ingest {ingest_id} did not finish in time, moving on")
+                finished = True
+
+            now = timezone.now()
+            running = PlaylistIngest.objects.filter(ingest_id=ingest_id, status='running')
+            if finished:
+                followed = running.update(status='pending', heartbeat_at=now, updated_at=now, **progress)
+            else:
+                followed = running.update(heartbeat_at=now)
+            if not followed:
+                logger.info(f"Playlist ingest {ingest_id} is no longer running, not following batch {batch_id}")
+                PlaylistIngestManager._forget_entries(ingest_id)
+                return
+        except Exception as e:
+            logger.error(f"Checking batch {batch_id} of playlist ingest {ingest_id} failed: {str(e)}")
+            PlaylistIngest.objects.filter(ingest_id=ingest_id).update(
+                status='failed', error=str(e), updated_at=timezone.now()
+            )
+            PlaylistIngestManager._forget_entries(ingest_id)
+            return
+        finally:
+            connection.close()
+
+        if finished:
+            PlaylistIngestManager.submit(ingest_id)
+        else:
+            PlaylistIngestManager._schedule_batch_check(ingest_id, batch_id, progress, deadline)
+
+    @staticmethod
+    def status_snapshot(ingest):
+        return {
+            'ingest_id': ingest.ingest_id,
+            'url': ingest.url,
+            'title': ingest.title,
+            'status': ingest.status,
+            'video_quality': ingest.video_quality,
+            'next_index': ingest.next_index,
+            'videos_ingested': ingest.videos_ingested,
+            'videos_failed': ingest.videos_failed,
+            'batch_ids': ingest.batch_ids,
+            'error': ingest.error,
+            'heartbeat_at': ingest.heartbeat_at.isoformat() if ingest.heartbeat_at else None,
+            'updated_at': ingest.updated_at.isoformat(),
+        }
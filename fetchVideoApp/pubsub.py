@@ -0,0 +1,186 @@
+"""
+Progress event pub/sub for FetchVideo
+
+Download workers publish status events to a channel per job and the
+Server-Sent Events / long-poll endpoints wait on that channel, so clients
+get progress as it happens instead of polling the cache.
+
+Every channel keeps a short history and events carry an id, so a client that
+connects late (or reconnects with Last-Event-ID) still sees what it missed.
+
+wait_for() blocks the calling thread (long-poll views); wait_for_async() is
+the asyncio-native variant used by the SSE stream, so an open stream holds
+no thread while it waits.
+
+Backends (settings.PROGRESS_PUBSUB_BACKEND):
+- 'memory': process-local, only works when jobs run in the web process
+  (DOWNLOAD_JOB_BACKEND = 'thread')
+- 'redis': Redis streams, works across web and Celery worker processes
+"""
+import json
+import time
+import asyncio
+import weakref
+import threading
+import logging
+from collections import deque
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_HISTORY = 100  # Events kept per channel
+CHANNEL_TTL = 3600  # Idle channels are dropped after an hour
+
+
+class InMemoryPubSub:
+    """Process-local pub/sub with per-channel history"""
+
+    def __init__(self, history=CHANNEL_HISTORY, ttl=CHANNEL_TTL):
+        self.history = history
+        self.ttl = ttl
+        self._condition = threading.Condition()
+        self._channels = {}
+        self._async_waiters = {}  # channel -> {(loop, asyncio.Event)}
+
+    def _prune(self, now):
+        expired = [name for name, channel in self._channels.items() if now - channel['updated_at'] > self.ttl]
+        for name in expired:
+            del self._channels[name]
+
+    def publish(self, channel, data):
+        with self._condition:
+            now = time.time()
+            state = self._channels.get(channel)
+            if state is None:
+                self._prune(now)
+                state = {'seq': 0, 'events': deque(maxlen=self.history), 'updated_at': now}
+                self._channels[channel] = state
+            state['seq'] += 1
+            state['events'].append((str(state['seq']), data))
+            state['updated_at'] = now
+            self._condition.notify_all()
+            for loop, event in self._async_waiters.pop(channel, ()):
+                try:
+                    loop.call_soon_threadsafe(event.set)
+                except RuntimeError:
+                    pass  # The waiter's event loop is closed
+
+    def _events_after(self, channel, cursor):
+        state = self._channels.get(channel)
+        if not state:
+            return []
+        after = int(cursor or 0)
+        return [(event_id, data) for event_id, data in state['events'] if int(event_id) > after]
+
+    def wait_for(self, channel, cursor='0', timeout=15):
+        """Block until events newer than cursor exist (or timeout); returns [(event_id, data)]"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                events = self._events_after(channel, cursor)
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events
+                self._condition.wait(remaining)
+
+    async def wait_for_async(self, channel, cursor='0', timeout=15):
+        """wait_for() for asyncio code: waits on an asyncio.Event instead of blocking a thread"""
+        loop = asyncio.get_running_loop()
+        waiter = (loop, asyncio.Event())
+        with self._condition:
+            # Checked and registered under the lock, so a publish in between can't be missed
+            events = self._events_after(channel, cursor)
+            if events:
+                return events
+            self._async_waiters.setdefault(channel, set()).add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._condition:
+                waiters = self._async_waiters.get(channel)
+                if waiters is not None:
+                    waiters.discard(waiter)
+                    if not waiters:
+                        del self._async_waiters[channel]
+        with self._condition:
+            return self._events_after(channel, cursor)
+
+
+class RedisPubSub:
+    """Pub/sub on Redis streams, shared by all processes"""
+
+    KEY_PREFIX = 'fetchvideo:events:'
+
+    def __init__(self, url, history=CHANNEL_HISTORY, ttl=CHANNEL_TTL):
+        import redis
+        self.url = url
+        self.client = redis.Redis.from_url(url)
+        self.history = history
+        self.ttl = ttl
+        # redis.asyncio connections belong to the event loop that opened them
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def publish(self, channel, data):
+        key = f"{self.KEY_PREFIX}{channel}"
+        pipe = self.client.pipeline()
+        pipe.xadd(key, {'data': json.dumps(data)}, maxlen=self.history, approximate=True)
+        pipe.expire(key, self.ttl)
+        pipe.execute()
+
+    def wait_for(self, channel, cursor='0', timeout=15):
+        key = f"{self.KEY_PREFIX}{channel}"
+        result = self.client.xread({key: cursor or '0'}, count=self.history, block=int(timeout * 1000))
+        return self._decode(result)
+
+    async def wait_for_async(self, channel, cursor='0', timeout=15):
+        """wait_for() on a redis.asyncio connection of the running event loop"""
+        import redis.asyncio
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = redis.asyncio.Redis.from_url(self.url)
+        key = f"{self.KEY_PREFIX}{channel}"
+        result = await client.xread({key: cursor or '0'}, count=self.history, block=int(timeout * 1000))
+        return self._decode(result)
+
+    @staticmethod
+    def _decode(result):
+        events = []
+        for _, entries in result or []:
+            for event_id, fields in entries:
+                events.append((event_id.decode(), json.loads(fields[b'data'])))
+        return events
+
+
+_pubsub = None
+_pubsub_lock = threading.Lock()
+
+
+def get_pubsub():
+    """Return the process-wide pub/sub backend"""
+    global _pubsub
+    if _pubsub is None:
+        with _pubsub_lock:
+            if _pubsub is None:
+                backend = getattr(settings, 'PROGRESS_PUBSUB_BACKEND', 'memory')
+                if backend == 'redis':
+                    _pubsub = RedisPubSub(settings.PROGRESS_PUBSUB_REDIS_URL)
+                elif backend == 'memory':
+                    _pubsub = InMemoryPubSub()
+                else:
+                    raise ValueError(f"Unknown PROGRESS_PUBSUB_BACKEND: {backend}")
+    return _pubsub
+
+
+def job_channel(job_id):
+    return f"job_{job_id}"
+
+
+def publish_job_event(job_id, data):
+    """Publish a job event; progress reporting must never break the download"""
+    try:
+        get_pubsub().publish(job_channel(job_id), data)
+    except Exception as e:
+        logger.warning(f"Failed to publish event for job {job_id}: {str(e)}")
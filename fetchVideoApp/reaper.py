@@ -0,0 +1,158 @@
+"""
+Incremental cleanup reaper for FetchVideo
+
+Expired sessions and cached videos are cleaned up by a background process
+(cleanup_scheduler.py or the cleanup_sessions command), never on the request
+path. The reaper also keeps the artifact store within its disk budget,
+removes scratch directories of builds whose process died, and marks playlist
+ingests whose process died as failed. Each cycle works in bounded batches
+until there is nothing left or its time budget is spent; whatever is left is
+picked up by the next cycle.
+
+Only one reaper runs at a time: across all hosts through a redis-py lock
+when REDIS_CACHE_URL is set (token checked and deleted atomically, so a
+reaper whose lock expired can't release its successor's), otherwise through
+a lock file in MEDIA_ROOT, which every process on the host sees (a plain
+cache.add on the file-based cache isn't atomic). Every cycle records how much it reclaimed and how long
+it took.
+"""
+import time
+import logging
+from datetime import datetime
+from django.conf import settings
+from django.core.cache import cache
+from .session_manager import SessionTempManager, VideoCacheManager
+from .playlists import PlaylistIngestManager
+from .artifact_store import ArtifactStore
+from .singleflight import FileLock
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = 'cleanup_reaper_lock'
+STATS_KEY = 'cleanup_reaper_stats'
+
+
+class CleanupReaper:
+    """Runs bounded, time-budgeted cleanup cycles under a lock shared by all reapers"""
+
+    def __init__(self, time_budget=None, batch_size=None, sessions=True, cache_entries=True, store=True):
+        self.sessions = sessions
+        self.cache_entries = cache_entries
+        self.store = store
+        self.time_budget = time_budget or getattr(settings, 'CLEANUP_TIME_BUDGET', 30)
+        self.batch_size = batch_size or getattr(settings, 'CLEANUP_BATCH_SIZE', 200)
+        self.lock_timeout = max(getattr(settings, 'CLEANUP_LOCK_TIMEOUT', 300), self.time_budget * 2)
+        self._lock = None
+
+    def acquire(self):
+        """Take the reaper lock; returns False if another reaper holds it"""
+        redis_url = getattr(settings, 'REDIS_CACHE_URL', None)
+        if redis_url:
+            import redis
+            self._lock = redis.Redis.from_url(redis_url).lock(
+                f"fetchvideo:{LOCK_KEY}", timeout=self.lock_timeout
+            )
+            return self._lock.acquire(blocking=False)
+        self._lock = FileLock(LOCK_KEY, stale_after=self.lock_timeout)
+        return self._lock.try_acquire()
+
+    def release(self):
+        if self._lock is None:
+            return
+        lock, self._lock = self._lock, None
+        if isinstance(lock, FileLock):
+            lock.release()
+            return
+        from redis.exceptions import LockError
+        try:
+            lock.release()  # Deletes the key only if it still holds our token
+        except LockError:
+            logger.warning("The cleanup reaper lock expired before the cycle finished")
+
+    def _steps(self):
+        steps = []
+        if self.cache_entries:
+            steps.append(('cache', lambda: VideoCacheManager.cleanup_expired_cache(limit=self.batch_size), 'cache_entries'))
+        if self.sessions:
+            steps.append(('sessions', lambda: SessionTempManager.cleanup_expired_sessions(limit=self.batch_size), 'sessions'))
+            steps.append(('orphans', lambda: SessionTempManager.cleanup_orphaned_session_dirs(limit=self.batch_size), 'orphan_dirs'))
+        if self.store:
+            steps.append(('artifacts', self._enforce_store_budget, 'artifacts'))
+            steps.append(('work_dirs', self._sweep_work_dirs, 'work_dirs'))
+        steps.append(('playlists', self._fail_stalled_ingests, 'stalled_ingests'))
+        return steps
+
+    def _enforce_store_budget(self):
+        evicted, freed = ArtifactStore.enforce_budget(limit=self.batch_size)
+        return {'artifacts': evicted, 'bytes_reclaimed': freed}
+
+    def _sweep_work_dirs(self):
+        removed, freed = ArtifactStore.sweep_work_dirs(limit=self.batch_size)
+        return {'work_dirs': removed, 'bytes_reclaimed': freed}
+
+    def _fail_stalled_ingests(self):
+        return {'stalled_ingests': PlaylistIngestManager.fail_stalled(limit=self.batch_size), 'bytes_reclaimed': 0}
+
+    def run_cycle(self):
+        """Run one cleanup cycle; returns its stats, or None if another reaper is running"""
+        if not self.acquire():
+            logger.info("Another cleanup reaper is running, skipping this cycle")
+            return None
+
+        started = time.monotonic()
+        deadline = started + self.time_budget
+        stats = {
+            'sessions': 0,
+            'orphan_dirs': 0,
+            'cache_entries': 0,
+            'artifacts': 0,
+            'work_dirs': 0,
+            'stalled_ingests': 0,
+            'bytes_reclaimed': 0,
+            'batches': 0,
+            'budget_exhausted': False,
+        }
+        try:
+            pending = self._steps()
+            # Alternate between the steps one batch at a time until all are done
+            while pending:
+                if time.monotonic() >= deadline:
+                    stats['budget_exhausted'] = True
+                    break
+                name, step, count_field = pending.pop(0)
+                result = step()
+                stats['batches'] += 1
+                stats[count_field] += result[count_field]
+                stats['bytes_reclaimed'] += result['bytes_reclaimed']
+                if result[count_field] >= self.batch_size:
+                    pending.append((name, step, count_field))
+        finally:
+            self.release()
+
+        stats['duration'] = round(time.monotonic() - started, 3)
+        stats['finished_at'] = datetime.now().isoformat()
+        self._record(stats)
+        logger.info(
+            f"Cleanup cycle: {stats['sessions']} sessions, {stats['orphan_dirs']} orphaned session dirs, "
+            f"{stats['cache_entries']} cache entries, {stats['artifacts']} evicted artifacts, "
+            f"{stats['work_dirs']} abandoned scratch dirs, {stats['stalled_ingests']} stalled playlist ingests, "
+            f"{stats['bytes_reclaimed']} bytes reclaimed in {stats['duration']}s"
+            + (" (time budget exhausted)" if stats['budget_exhausted'] else "")
+        )
+        return stats
+
+    def _record(self, stats):
+        """Keep the last cycle and running totals in the cache for monitoring"""
+        recorded = cache.get(STATS_KEY) or {'totals': {'cycles': 0}}
+        totals = recorded['totals']
+        totals['cycles'] += 1
+        for field in ('sessions', 'orphan_dirs', 'cache_entries', 'artifacts', 'work_dirs', 'stalled_ingests',
+                      'bytes_reclaimed', 'duration'):
+            totals[field] = totals.get(field, 0) + stats[field]
+        recorded['last_cycle'] = stats
+        cache.set(STATS_KEY, recorded, None)
+
+    @staticmethod
+    def get_stats():
+        """Last cycle and running totals, as recorded by the reapers"""
+        return cache.get(STATS_KEY)
@@ -2,16 +2,36 @@
 Session-based temporary directory and video caching management for FetchVideo
 """
 import os
+import time
 import shutil
 import hashlib
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from django.conf import settings
 from django.core.cache import cache
 from django.contrib.sessions.models import Session
+from django.utils import timezone
+from .models import CachedVideoEntry
+from .artifact_store import ArtifactStore
 
 logger = logging.getLogger(__name__)
 
+
+def directory_size(path):
+    """Bytes that removing a directory frees (hardlinked store files don't count)"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            if stat.st_nlink <= 1:
+                total += stat.st_size
+    return total
+
+
 class SessionTempManager:
     """Manages temporary directories and video caching based on user sessions"""
 
@@ -24,8 +44,7 @@ class SessionTempManager:
             request.session.create()
             session_key = request.session.session_key
 
-        temp_dir = os.path.join(settings.MEDIA_ROOT, f"session_{session_key}")
-        os.makedirs(temp_dir, exist_ok=True)
+        temp_dir = SessionTempManager.get_session_temp_dir_for_key(session_key)
 
         # Store temp dir in session for cleanup
         if 'temp_dirs' not in request.session:
@@ -36,36 +55,128 @@ class SessionTempManager:
 
         return temp_dir
 
+    @staticmethod
+    def get_session_temp_dir_for_key(session_key):
+        """Get or create the temporary directory for a known session key (no request needed)"""
+        temp_dir = os.path.join(settings.MEDIA_ROOT, f"session_{session_key}")
+        os.makedirs(temp_dir, exist_ok=True)
+        return temp_dir
+
     @staticmethod
     def cleanup_session_temp_dirs(session_key):
-        """Clean up all temporary directories for a session"""
+        """Clean up all temporary directories for a session; returns the bytes freed"""
         try:
             session_temp_dir = os.path.join(settings.MEDIA_ROOT, f"session_{session_key}")
             if os.path.exists(session_temp_dir):
+                freed = directory_size(session_temp_dir)
                 shutil.rmtree(session_temp_dir)
                 logger.info(f"Cleaned up session temp directory: {session_temp_dir}")
+                return freed
         except Exception as e:
             logger.error(f"Failed to cleanup session temp dir {session_key}: {str(e)}")
+        return 0
+
+    @staticmethod
+    def _remove_session_dirs(executor, session_keys):
+        """Remove the temp directories of several sessions in parallel; returns the bytes freed"""
+        return sum(executor.map(SessionTempManager.cleanup_session_temp_dirs, session_keys))
+
+    @staticmethod
+    def _cleanup_executor():
+        return ThreadPoolExecutor(
+            max_workers=getattr(settings, 'CLEANUP_RMTREE_WORKERS', 4), thread_name_prefix='fetchvideo-cleanup'
+        )
 
     @staticmethod
-    def cleanup_expired_sessions():
-        """Clean up temporary directories for expired sessions"""
+    def cleanup_expired_sessions(limit=None, chunk_size=500):
+        """Clean up temporary directories for expired sessions
+
+        Expired session keys are streamed in chunks (keyset pagination on the
+        session key); each chunk's directories are removed in parallel and its
+        rows deleted in one statement, so memory use and transaction size stay
+        bounded. With a limit, at most that many sessions are handled per call.
+        Returns the counts of the work done.
+        """
+        stats = {'sessions': 0, 'bytes_reclaimed': 0, 'chunks': 0, 'duration': 0.0}
+        started = time.monotonic()
+        now = timezone.now()
+        last_key = ''
         try:
-            # Get all expired sessions
-            expired_sessions = Session.objects.filter(
-                expire_date__lt=datetime.now()
-            )
+            with SessionTempManager._cleanup_executor() as executor:
+                while limit is None or stats['sessions'] < limit:
+                    size = chunk_size if limit is None else min(chunk_size, limit - stats['sessions'])
+                    expired_keys = list(
+                        Session.objects.filter(expire_date__lt=now, session_key__gt=last_key)
+                        .order_by('session_key')
+                        .values_list('session_key', flat=True)[:size]
+                    )
+                    if not expired_keys:
+                        break
 
-            for session in expired_sessions:
-                SessionTempManager.cleanup_session_temp_dirs(session.session_key)
+                    stats['bytes_reclaimed'] += SessionTempManager._remove_session_dirs(executor, expired_keys)
 
-            # Delete expired sessions from database
-            expired_sessions.delete()
-            logger.info(f"Cleaned up {expired_sessions.count()} expired sessions")
+                    # Delete this chunk of expired sessions from database
+                    Session.objects.filter(session_key__in=expired_keys).delete()
+                    stats['sessions'] += len(expired_keys)
+                    stats['chunks'] += 1
+                    last_key = expired_keys[-1]
 
         except Exception as e:
             logger.error(f"Failed to cleanup expired sessions: {str(e)}")
 
+        stats['duration'] = round(time.monotonic() - started, 3)
+        if stats['sessions']:
+            logger.info(f"Cleaned up {stats['sessions']} expired sessions in {stats['duration']}s")
+        return stats
+
+    @staticmethod
+    def cleanup_orphaned_session_dirs(limit=None, chunk_size=500, grace_period=600):
+        """Remove media/session_* directories whose session no longer exists
+
+        Directories younger than grace_period seconds are left alone so a
+        session that is being created right now isn't touched. Returns the
+        counts of the work done.
+        """
+        stats = {'orphan_dirs': 0, 'bytes_reclaimed': 0, 'duration': 0.0}
+        started = time.monotonic()
+        cutoff = time.time() - grace_period
+
+        def remove_orphans(executor, session_keys):
+            existing = set(Session.objects.filter(session_key__in=session_keys).values_list('session_key', flat=True))
+            orphans = [key for key in session_keys if key not in existing]
+            if limit is not None:
+                orphans = orphans[:limit - stats['orphan_dirs']]
+            stats['bytes_reclaimed'] += SessionTempManager._remove_session_dirs(executor, orphans)
+            stats['orphan_dirs'] += len(orphans)
+
+        try:
+            with SessionTempManager._cleanup_executor() as executor, os.scandir(settings.MEDIA_ROOT) as entries:
+                candidates = []
+                for entry in entries:
+                    if limit is not None and stats['orphan_dirs'] >= limit:
+                        break
+                    if not entry.name.startswith('session_') or not entry.is_dir(follow_symlinks=False):
+                        continue
+                    if entry.stat(follow_symlinks=False).st_mtime > cutoff:
+                        continue
+                    candidates.append(entry.name[len('session_'):])
+                    if len(candidates) >= chunk_size:
+                        remove_orphans(executor, candidates)
+                        candidates = []
+
+                if candidates and (limit is None or stats['orphan_dirs'] < limit):
+                    remove_orphans(executor, candidates)
+
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Failed to cleanup orphaned session dirs: {str(e)}")
+
+        stats['duration'] = round(time.monotonic() - started, 3)
+        if stats['orphan_dirs']:
+            logger.info(f"Removed {stats['orphan_dirs']} orphaned session directories in {stats['duration']}s")
+        return stats
+
 class VideoCacheManager:
     """Manages caching of processed videos to avoid reprocessing"""
 
@@ -105,6 +216,19 @@ class VideoCacheManager:
         }
 
         cache.set(cache_key, cache_data, VideoCacheManager.CACHE_TIMEOUT)
+
+        # Index the entry so invalidation and expiry sweeps don't scan the cache
+        now = timezone.now()
+        CachedVideoEntry.objects.update_or_create(
+            cache_key=cache_key,
+            defaults={
+                'video_id': video_id,
+                'quality': quality,
+                'file_path': file_path,
+                'created_at': now,
+                'expires_at': now + timedelta(seconds=VideoCacheManager.CACHE_TIMEOUT),
+            }
+        )
         logger.info(f"Cached video: {video_id} at quality {quality}")
 
     @staticmethod
@@ -115,50 +239,73 @@ class VideoCacheManager:
             return cached_data['file_path']
         return None
 
+    @staticmethod
+    def _remove_entries(entries, remove_files=True):
+        """Delete indexed entries from the cache and the index, optionally with their files
+
+        Returns the bytes freed on disk.
+        """
+        entries = list(entries)
+        if not entries:
+            return 0
+        freed = 0
+        cache.delete_many([entry.cache_key for entry in entries])
+        if remove_files:
+            for entry in entries:
+                # Shared artifacts outlive cache entries, the store evicts them by disk budget
+                if entry.file_path and not ArtifactStore.contains(entry.file_path) and os.path.exists(entry.file_path):
+                    freed += os.path.getsize(entry.file_path)
+                    os.remove(entry.file_path)
+        CachedVideoEntry.objects.filter(pk__in=[entry.pk for entry in entries]).delete()
+        return freed
+
     @staticmethod
     def clear_video_cache(video_id=None):
         """Clear video cache, optionally for a specific video"""
         try:
             if video_id:
                 # Clear cache for specific video
-                cache_keys = cache.keys(f"{VideoCacheManager.CACHE_KEY_PREFIX}*")
-                for key in cache_keys:
-                    cached_data = cache.get(key)
-                    if cached_data and cached_data.get('video_id') == video_id:
-                        cache.delete(key)
-                        # Also remove the file if it exists
-                        file_path = cached_data.get('file_path')
-                        if file_path and os.path.exists(file_path):
-                            os.remove(file_path)
+                entries = list(CachedVideoEntry.objects.filter(video_id=video_id))
+                for entry in entries:
+                    # Clearing one video also drops its shared artifacts, with their sidecars
+                    if entry.file_path and ArtifactStore.contains(entry.file_path):
+                        ArtifactStore.remove(entry.file_path)
+                    elif entry.file_path and os.path.exists(entry.file_path):
+                        os.remove(entry.file_path)
+                VideoCacheManager._remove_entries(entries, remove_files=False)
                 logger.info(f"Cleared cache for video: {video_id}")
             else:
                 # Clear all video cache
-                cache.delete_pattern(f"{VideoCacheManager.CACHE_KEY_PREFIX}*")
+                cache_keys = list(CachedVideoEntry.objects.values_list('cache_key', flat=True))
+                cache.delete_many(cache_keys)
+                CachedVideoEntry.objects.all().delete()
                 logger.info("Cleared all video cache")
         except Exception as e:
             logger.error(f"Failed to clear video cache: {str(e)}")
 
     @staticmethod
-    def cleanup_expired_cache():
-        """Clean up expired cache entries and their associated files"""
+    def cleanup_expired_cache(batch_size=500, limit=None):
+        """Clean up expired cache entries and their associated files
+
+        With a limit, at most that many entries are handled per call. Returns
+        the counts of the work done.
+        """
+        stats = {'cache_entries': 0, 'bytes_reclaimed': 0}
         try:
-            cache_keys = cache.keys(f"{VideoCacheManager.CACHE_KEY_PREFIX}*")
-            cleaned_count = 0
-
-            for key in cache_keys:
-                cached_data = cache.get(key)
-                if cached_data:
-                    file_path = cached_data.get('file_path')
-                    if file_path and os.path.exists(file_path):
-                        # Check if file is older than cache timeout
-                        file_mtime = datetime.fromtimestamp(os.path.getmtime(file_path))
-                        if datetime.now() - file_mtime > timedelta(seconds=VideoCacheManager.CACHE_TIMEOUT):
-                            os.remove(file_path)
-                            cache.delete(key)
-                            cleaned_count += 1
-
-            if cleaned_count > 0:
-                logger.info(f"Cleaned up {cleaned_count} expired cached videos")
+            now = timezone.now()
+
+            # Only entries past their expiry are touched, oldest first
+            while limit is None or stats['cache_entries'] < limit:
+                size = batch_size if limit is None else min(batch_size, limit - stats['cache_entries'])
+                batch = list(CachedVideoEntry.objects.filter(expires_at__lte=now).order_by('expires_at')[:size])
+                if not batch:
+                    break
+                stats['bytes_reclaimed'] += VideoCacheManager._remove_entries(batch)
+                stats['cache_entries'] += len(batch)
+
+            if stats['cache_entries'] > 0:
+                logger.info(f"Cleaned up {stats['cache_entries']} expired cached videos")
 
         except Exception as e:
-            logger.error(f"Failed to cleanup expired cache: {str(e)}")
\ No newline at end of file
+            logger.error(f"Failed to cleanup expired cache: {str(e)}")
+        return stats
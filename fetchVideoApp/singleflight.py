@@ -0,0 +1,188 @@
+"""
+Single-flight execution for FetchVideo
+
+Makes sure identical work (e.g. the same video at the same quality) only runs
+once at a time. Concurrent callers in the same process attach to the in-flight
+call and receive its result; callers in other processes (other gunicorn
+workers, Celery workers) wait on a lock file and then run the function
+themselves, which is expected to find the leader's result in the cache.
+The lock is kept fresh by its holder, so it is only considered abandoned
+when the holding process has died.
+"""
+import os
+import time
+import uuid
+import threading
+import logging
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class FileLock:
+    """Cross-process lock backed by an exclusively created file in MEDIA_ROOT
+
+    While held, a heartbeat thread keeps refreshing the file's modification
+    time, so only the lock of a crashed holder ever becomes stale. Each holder
+    writes a unique token into the file and only touches or removes a lock
+    file that still carries its token.
+    """
+
+    def __init__(self, name, stale_after=1800, heartbeat_interval=None):
+        self.path = os.path.join(settings.MEDIA_ROOT, '.locks', f"{name}.lock")
+        self.stale_after = stale_after
+        self.heartbeat_interval = heartbeat_interval or max(stale_after / 4, 0.5)
+        self.token = None
+        self._stop_heartbeat = None
+
+    def _is_stale(self, path=None):
+        try:
+            return time.time() - os.path.getmtime(path or self.path) > self.stale_after
+        except FileNotFoundError:
+            return False
+
+    def _read_token(self):
+        try:
+            with open(self.path) as lock_file:
+                return lock_file.read()
+        except FileNotFoundError:
+            return None
+
+    def _break_stale(self):
+        """Remove the lock file if it is stale; returns True if it was removed
+
+        The file is renamed to a unique name first, so of several processes
+        breaking the same lock only one succeeds. If the renamed file turns out
+        to be fresh (another process re-created the lock in between), it is
+        put back.
+        """
+        if not self._is_stale():
+            return False
+        broken_path = f"{self.path}.{uuid.uuid4().hex}.broken"
+        try:
+            os.rename(self.path, broken_path)
+        except FileNotFoundError:
+            return True  # Someone else broke it already
+        if not self._is_stale(broken_path):
+            try:
+                os.link(broken_path, self.path)
+            except FileExistsError:
+                logger.warning(f"Lock {self.path} was taken over while breaking it")
+            os.remove(broken_path)
+            return False
+        os.remove(broken_path)
+        logger.warning(f"Broke stale lock: {self.path}")
+        return True
+
+    def try_acquire(self):
+        """Try to take the lock without waiting"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        try:
+            fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if self._break_stale():
+                return self.try_acquire()
+            return False
+        self.token = f"{os.getpid()}:{uuid.uuid4().hex}"
+        with os.fdopen(fd, 'w') as lock_file:
+            lock_file.write(self.token)
+        self._start_heartbeat()
+        return True
+
+    def acquire(self, poll_interval=1.0, timeout=None):
+        """Wait until the lock is free and take it; returns False if timeout seconds pass first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.try_acquire():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(poll_interval)
+        return True
+
+    def _start_heartbeat(self):
+        stop = self._stop_heartbeat = threading.Event()
+        token = self.token
+
+        def heartbeat():
+            while not stop.wait(self.heartbeat_interval):
+                if self._read_token() != token:
+                    logger.warning(f"Lost lock {self.path}")
+                    return
+                try:
+                    os.utime(self.path)
+                except FileNotFoundError:
+                    return
+
+        threading.Thread(target=heartbeat, name='fetchvideo-lock-heartbeat', daemon=True).start()
+
+    def release(self):
+        if self._stop_heartbeat:
+            self._stop_heartbeat.set()
+            self._stop_heartbeat = None
+        if self.token and self._read_token() == self.token:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+        self.token = None
+
+
+class _InFlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs fn once per key; concurrent callers share the result"""
+
+    def __init__(self, lock_timeout=1800, poll_interval=1.0, wait_timeout=None):
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self.wait_timeout = wait_timeout or lock_timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn, on_wait=None):
+        """Run fn for key, or wait for the identical call already running
+
+        on_wait is called (without arguments) if this caller has to wait.
+        Raises TimeoutError if another process holds the work's lock for
+        longer than wait_timeout seconds.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _InFlightCall()
+                self._calls[key] = call
+
+        if not is_leader:
+            if on_wait:
+                on_wait()
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            lock = FileLock(key, stale_after=self.lock_timeout)
+            if not lock.try_acquire():
+                # Another process is doing the work, wait for it to finish
+                if on_wait:
+                    on_wait()
+                if not lock.acquire(self.poll_interval, timeout=self.wait_timeout):
+                    raise TimeoutError(f"Timed out waiting for {key} in another process")
+            try:
+                call.result = fn()
+            finally:
+                lock.release()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+        return call.result
@@ -0,0 +1,11 @@
+"""
+Celery tasks for FetchVideo
+"""
+from celery import shared_task
+from .jobs import run_download_job
+
+
+@shared_task(name='fetchVideoApp.run_download_job', ignore_result=True)
+def run_download_job_task(job_id):
+    """Run a download job on a Celery worker"""
+    run_download_job(job_id)
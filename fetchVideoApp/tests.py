@@ -1,3 +1,1366 @@
-from django.test import TestCase
+import io
+import os
+import re
+import time
+import shutil
+import json
+import asyncio
+import tempfile
+import threading
+import zipfile
+import http.client
+from datetime import datetime, timedelta, timezone as dt_timezone
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.error import HTTPError
+import requests
+from pytubefix import request as pytubefix_request
+from pytubefix.exceptions import BotDetection, VideoUnavailable
+from django.core.cache import cache, caches
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from .file_response import ranged_file_response
+from .downloader import SegmentedDownloader, SegmentError, DownloadCancelled
+from .manifest import StreamInfo, StreamManifest
+from .metadata import VideoRecord, VideoMetadataCache
+from .models import Video, PlaylistIngest, ProcessingLog, DownloadHistory
+from .playlists import PlaylistIngestManager
+from . import playlists
+from .artifact_store import ArtifactStore
+from .cache_backends import TieredCache
+from . import cache_backends
+from .batches import BatchManager, stream_zip
+from .jobs import DownloadJobManager, JobQueueFull, ThreadPoolJobBackend
+from . import jobs
+from .reaper import CleanupReaper
+from .pubsub import InMemoryPubSub, job_channel
+from .counters import VideoCounters
+from . import counters
+from .breaker import CircuitBreaker, CircuitOpen, ExtractionFailed, guarded_extraction
+from . import breaker
+from .history import HistoryBuffer, history_buffer
+from . import metrics
+from . import http_client
+from .player_cache import CachedPlayerYouTube, PlayerCache
+from . import player_cache as player_cache_module
+from . import views
 
-# Create your tests here.
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'fetchvideo-tests'},
+}
+
+
+class SharedDownloadTests(TransactionTestCase):
+    """Identical downloads from several sessions build one artifact and link it into every session"""
+
+    VIDEO_ID = 'dQw4w9WgXcQ'
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            ARTIFACT_STORE_ROOT=os.path.join(self.media_root, 'store'),
+            CACHES=TEST_CACHES,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # Write buffered processing logs while the test database still exists
+        self.addCleanup(history_buffer.flush)
+
+        self.download_started = threading.Event()
+        self.release_download = threading.Event()
+        self.downloads = 0
+
+        record = VideoRecord(video_id=self.VIDEO_ID, title='Test video', url='', channel_title='',
+                             duration='00:00:10', thumbnail_url='')
+        manifest = StreamManifest(self.VIDEO_ID, [
+            StreamInfo(itag=136, type='video', mime_type='video/mp4', subtype='mp4', resolution='720p',
+                       fps=30, url='http://example.invalid/v', is_sabr=False),
+            StreamInfo(itag=251, type='audio', mime_type='audio/webm', subtype='webm', abr='160kbps',
+                       audio_codec='opus', url='http://example.invalid/a', is_sabr=False),
+        ])
+        for name, replacement in (
+            ('fetch_video_details', lambda video_id, processor=None: record),
+            ('get_stream_manifest', lambda video_id: manifest),
+            ('download_streams_concurrently', self.fake_download),
+            ('merge_streams', self.fake_merge),
+        ):
+            patcher = mock.patch.object(views, name, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def fake_download(self, downloads, on_progress=None, on_stream_done=None):
+        self.downloads += 1
+        self.download_started.set()
+        self.release_download.wait(5)
+        for _, _, path in downloads:
+            with open(path, 'wb') as f:
+                f.write(b'stream')
+
+    def fake_merge(self, video_path, audio_path, output_path, audio_codec=None):
+        with open(output_path, 'wb') as f:
+            f.write(b'merged video')
+
+    def test_concurrent_sessions_get_their_own_link_to_one_artifact(self):
+        results = {}
+
+        def request(session_key):
+            results[session_key] = views.download_video_with_best_audio(session_key, self.VIDEO_ID, '720p')
+
+        first = threading.Thread(target=request, args=('session-a',))
+        first.start()
+        self.assertTrue(self.download_started.wait(5))
+        # The second session asks while the first one's build is still running
+        second = threading.Thread(target=request, args=('session-b',))
+        second.start()
+        second.join(0.5)
+        self.assertTrue(second.is_alive(), "the second session should wait for the running build")
+        self.release_download.set()
+        first.join(5)
+        second.join(5)
+
+        self.assertEqual(self.downloads, 1)
+        (name_a, dir_a, key_a), (name_b, dir_b, key_b) = results['session-a'], results['session-b']
+        self.assertEqual(dir_a, 'session_session-a')
+        self.assertEqual(dir_b, 'session_session-b')
+        self.assertEqual(name_a, name_b)
+        self.assertEqual(key_a, key_b)
+
+        path_a = os.path.join(self.media_root, dir_a, name_a)
+        path_b = os.path.join(self.media_root, dir_b, name_b)
+        self.assertTrue(os.path.samefile(path_a, path_b))
+        stored = [os.path.join(root, f) for root, _, files in os.walk(os.path.join(self.media_root, 'store'))
+                  for f in files if f.endswith('.mp4')]
+        self.assertEqual(len(stored), 1)
+        self.assertTrue(os.path.samefile(path_a, stored[0]))
+
+        # Reaping one session leaves the other session's file in place
+        shutil.rmtree(os.path.join(self.media_root, dir_a))
+        with open(path_b, 'rb') as f:
+            self.assertEqual(f.read(), b'merged video')
+
+    def test_later_session_links_the_stored_artifact(self):
+        self.release_download.set()
+        name_a, dir_a, _ = views.download_video_with_best_audio('session-a', self.VIDEO_ID, '720p')
+        name_b, dir_b, _ = views.download_video_with_best_audio('session-b', self.VIDEO_ID, '720p')
+
+        self.assertEqual(self.downloads, 1)
+        self.assertNotEqual(dir_a, dir_b)
+        self.assertTrue(os.path.samefile(os.path.join(self.media_root, dir_a, name_a),
+                                         os.path.join(self.media_root, dir_b, name_b)))
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'fetchvideo-tests'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'fetchvideo-tests-shared'},
+})
+class TieredCacheTests(SimpleTestCase):
+    """Per-process front tier over the shared cache"""
+
+    def setUp(self):
+        self.cache = TieredCache('', {'OPTIONS': {'BACK_ALIAS': 'shared', 'LOCAL_TIMEOUT': 5}})
+        self.shared = caches['shared']
+        self.shared.clear()
+        self.now = 1000.0
+        clock = SimpleNamespace(monotonic=lambda: self.now, time=time.time)
+        patcher = mock.patch.object(cache_backends, 'time', clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_local_hit_until_local_timeout(self):
+        self.cache.set('video_details_a', {'title': 'A'})
+        # Another process changes the shared value: this one keeps serving its copy for a few seconds
+        self.shared.set('video_details_a', {'title': 'B'})
+        self.assertEqual(self.cache.get('video_details_a'), {'title': 'A'})
+
+        self.now += 6
+        self.assertEqual(self.cache.get('video_details_a'), {'title': 'B'})
+        self.assertEqual(self.cache.stats()['video_details'],
+                         {'local_hits': 1, 'shared_hits': 1, 'misses': 0, 'sets': 1})
+
+    def test_local_copies_are_not_shared_with_callers(self):
+        self.cache.set('video_details_a', {'title': 'A'})
+        self.cache.get('video_details_a')['title'] = 'changed'
+        self.assertEqual(self.cache.get('video_details_a'), {'title': 'A'})
+
+    def test_excluded_namespaces_always_read_the_shared_tier(self):
+        self.cache.set('download_job_1', {'status': 'queued'})
+        self.shared.set('download_job_1', {'status': 'running'})
+        self.assertEqual(self.cache.get('download_job_1'), {'status': 'running'})
+        self.assertEqual(self.cache.stats()['download_job']['shared_hits'], 1)
+
+    def test_delete_drops_the_local_copy(self):
+        self.cache.set('stream_manifest_a', 'manifest')
+        self.cache.delete('stream_manifest_a')
+        self.assertIsNone(self.cache.get('stream_manifest_a'))
+
+    def test_stats_per_namespace(self):
+        self.cache.get('video_details_missing')
+        self.cache.get('download_job_progress_1')
+        self.cache.set('unrelated', 1)
+        self.cache.get_many(['unrelated', 'video_details_missing'])
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['video_details']['misses'], 2)
+        self.assertEqual(stats['download_job_progress']['misses'], 1)
+        self.assertNotIn('download_job', stats)
+        self.assertEqual(stats['other'], {'local_hits': 1, 'shared_hits': 0, 'misses': 0, 'sets': 1})
+
+
+class ArtifactStoreTests(SimpleTestCase):
+    """Budget enforcement and scratch directory sweeping, as run by the cleanup reaper"""
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        settings_override = override_settings(ARTIFACT_STORE_ROOT=root, ARTIFACT_STORE_MAX_BYTES=250)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def store(self, name, used_at):
+        src = os.path.join(ArtifactStore.create_work_dir(), 'merged.mp4')
+        with open(src, 'wb') as f:
+            f.write(b'x' * 100)
+        path = ArtifactStore.put(src, ArtifactStore.artifact_key(name, 1, 2, 'mp4'), 'mp4')
+        os.rmdir(os.path.dirname(src))
+        os.utime(path + ArtifactStore.USED_SUFFIX, (used_at, used_at))
+        return path
+
+    def test_put_leaves_eviction_to_the_reaper(self):
+        now = time.time()
+        paths = [self.store(name, now - age) for name, age in (('a', 30), ('b', 10), ('c', 20))]
+        self.assertTrue(all(os.path.exists(path) for path in paths))
+
+        self.assertEqual(ArtifactStore.enforce_budget(), (1, 100))
+        self.assertFalse(os.path.exists(paths[0]))
+        self.assertFalse(os.path.exists(paths[0] + ArtifactStore.USED_SUFFIX))
+        self.assertTrue(os.path.exists(paths[1]) and os.path.exists(paths[2]))
+
+    def test_only_abandoned_work_dirs_are_swept(self):
+        abandoned = ArtifactStore.create_work_dir()
+        with open(os.path.join(abandoned, 'video.mp4'), 'wb') as f:
+            f.write(b'x' * 10)
+        old = time.time() - 7200
+        for path in (os.path.join(abandoned, 'video.mp4'), abandoned):
+            os.utime(path, (old, old))
+        # An old directory with a file still being written to belongs to a running build
+        running = ArtifactStore.create_work_dir()
+        os.utime(running, (old, old))
+        with open(os.path.join(running, 'video.mp4'), 'wb') as f:
+            f.write(b'x')
+
+        self.assertEqual(ArtifactStore.sweep_work_dirs(max_age=3600), (1, 10))
+        self.assertFalse(os.path.exists(abandoned))
+        self.assertTrue(os.path.exists(running))
+
+
+class VideoCacheClearTests(TestCase):
+    """Clearing one video's cache removes its stored artifacts through the store"""
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        settings_override = override_settings(ARTIFACT_STORE_ROOT=root, CACHES=TEST_CACHES)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_clear_removes_the_artifact_and_its_sidecar(self):
+        from .session_manager import VideoCacheManager
+
+        src = os.path.join(ArtifactStore.create_work_dir(), 'merged.mp4')
+        with open(src, 'wb') as f:
+            f.write(b'x' * 10)
+        path = ArtifactStore.put(src, ArtifactStore.artifact_key('video', 1, 2, 'mp4'), 'mp4')
+        self.assertTrue(os.path.exists(path + ArtifactStore.USED_SUFFIX))
+        VideoCacheManager.cache_video('video', '1080p', path)
+
+        VideoCacheManager.clear_video_cache('video')
+
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(path + ArtifactStore.USED_SUFFIX))
+        self.assertIsNone(VideoCacheManager.is_video_cached('video', '1080p'))
+
+
+class CleanupReaperLockTests(SimpleTestCase):
+    """Only one reaper runs at a time, and only the holder releases the lock"""
+
+    def test_lock_file_without_redis(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with self.settings(MEDIA_ROOT=media_root, REDIS_CACHE_URL=None):
+            first, second = CleanupReaper(), CleanupReaper()
+            self.assertTrue(first.acquire())
+            self.assertFalse(second.acquire())
+            first.release()
+            self.assertTrue(second.acquire())
+            second.release()
+
+    def test_redis_lock_is_released_by_token(self):
+        import redis
+        from redis.exceptions import LockError
+
+        lock = mock.Mock()
+        lock.acquire.return_value = True
+        lock.release.side_effect = LockError("Cannot release a lock that's no longer owned")
+        client = mock.Mock()
+        client.lock.return_value = lock
+        with self.settings(REDIS_CACHE_URL='redis://localhost:6379/0'), \
+                mock.patch.object(redis.Redis, 'from_url', return_value=client):
+            reaper = CleanupReaper(time_budget=30)
+            self.assertTrue(reaper.acquire())
+            # The lock expired and was taken over: releasing must not delete the new holder's key
+            with self.assertLogs('fetchVideoApp.reaper', 'WARNING'):
+                reaper.release()
+
+        client.lock.assert_called_once_with('fetchvideo:cleanup_reaper_lock', timeout=reaper.lock_timeout)
+        lock.acquire.assert_called_once_with(blocking=False)
+        client.delete.assert_not_called()
+
+
+@override_settings(CACHES=TEST_CACHES, COUNTER_BACKEND='memory')
+class VideoCounterTests(TestCase):
+    """Buffered counters reach the database, the cached record and the displayed count"""
+
+    def setUp(self):
+        self.video = Video.objects.create(video_id='dQw4w9WgXcQ', title='Test video', url='', channel_title='',
+                                          duration='00:00:10', thumbnail_url='', views=5)
+        self.counters = VideoCounters()
+        patcher = mock.patch.object(counters, 'video_counters', self.counters)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_pending_views_are_displayed(self):
+        record = VideoRecord.from_video(self.video)
+        self.counters.backend.increment(record.video_id, 'views', 2)
+        self.assertEqual(record.current_views(), 7)
+
+    def test_flush_drops_the_cached_record(self):
+        VideoMetadataCache.set(VideoRecord.from_video(self.video))
+        self.counters.backend.increment(self.video.video_id, 'views', 3)
+
+        self.assertEqual(self.counters.flush(), 1)
+        self.assertIsNone(VideoMetadataCache.get(self.video.video_id))
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.views, 8)
+        self.assertEqual(VideoRecord.from_video(self.video).current_views(), 8)
+
+
+@override_settings(CACHES=TEST_CACHES, PLAYLIST_STALL_TIMEOUT=300, PLAYLIST_QUEUE_TIMEOUT=3600,
+                   BATCH_MAX_VIDEOS=2, PLAYLIST_MAX_VIDEOS=500)
+class PlaylistIngestTests(TestCase):
+    """Stalled ingests are failed and resumable; playlist URLs are routed to the ingest"""
+
+    PLAYLIST_URL = 'https://www.youtube.com/playlist?list=PLabcdefghijklmnop'
+
+    def setUp(self):
+        patcher = mock.patch.object(PlaylistIngestManager, 'submit', return_value=True)
+        self.submit = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def running_ingest(self, heartbeat_age, status='running'):
+        ingest = PlaylistIngest.objects.create(url=self.PLAYLIST_URL, session_key='session', video_quality='720p')
+        PlaylistIngest.objects.filter(pk=ingest.pk).update(
+            status=status, heartbeat_at=timezone.now() - timedelta(seconds=heartbeat_age)
+        )
+        ingest.refresh_from_db()
+        return ingest
+
+    def patch_pipeline(self, entries):
+        # Connections can't be closed inside the test transaction
+        for target, name, value in (
+            (playlists, 'connection', mock.Mock()),
+            (playlists, 'playlist_title', lambda url: 'Test playlist'),
+            (playlists, 'iter_playlist_video_ids', lambda url, start=0: iter(entries[start:])),
+            (playlists, 'ingest_videos', lambda video_ids: video_ids[:1]),
+            (playlists.BatchManager, 'submit', mock.Mock(return_value={'batch_id': 'batch-1'})),
+            (PlaylistIngestManager, '_schedule_batch_check', mock.Mock()),
+        ):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_chunk_releases_the_worker_while_its_batch_runs(self):
+        self.patch_pipeline([(0, 'aaaaaaaaaaa'), (1, 'bbbbbbbbbbb'), (2, 'ccccccccccc')])
+        ingest = PlaylistIngest.objects.create(url=self.PLAYLIST_URL, session_key='session', video_quality='720p')
+
+        PlaylistIngestManager.run(ingest.ingest_id)
+
+        ingest.refresh_from_db()
+        self.assertEqual(ingest.status, 'running')
+        self.assertEqual(ingest.batch_ids, ['batch-1'])
+        self.assertEqual(ingest.next_index, 0)  # Saved once the batch is done
+        check = PlaylistIngestManager._schedule_batch_check
+        check.assert_called_once()
+        ingest_id, batch_id, progress, deadline = check.call_args.args
+
+        # The batch finished (or expired): the next chunk is queued
+        with mock.patch.object(playlists.BatchManager, 'get_batch', return_value=None):
+            PlaylistIngestManager._check_batch(ingest_id, batch_id, progress, deadline)
+        ingest.refresh_from_db()
+        self.assertEqual((ingest.status, ingest.next_index), ('pending', 2))
+        self.assertEqual((ingest.videos_ingested, ingest.videos_failed), (1, 1))
+        self.submit.assert_called_once_with(ingest.ingest_id)
+
+        # Last chunk, then nothing left
+        PlaylistIngestManager.run(ingest.ingest_id)
+        with mock.patch.object(playlists.BatchManager, 'get_batch', return_value=None):
+            PlaylistIngestManager._check_batch(*check.call_args.args)
+        PlaylistIngestManager.run(ingest.ingest_id)
+        ingest.refresh_from_db()
+        self.assertEqual((ingest.status, ingest.next_index, ingest.videos_ingested), ('completed', 3, 2))
+
+    def test_batch_wait_has_a_deadline(self):
+        self.patch_pipeline([])
+        ingest = self.running_ingest(0)
+        running_batch = {'batch_id': 'batch-1'}
+        with mock.patch.object(playlists.BatchManager, 'get_batch', return_value=running_batch), \
+                mock.patch.object(playlists.BatchManager, 'status_snapshot', return_value={'status': 'running'}):
+            PlaylistIngestManager._check_batch(ingest.ingest_id, 'batch-1', {'next_index': 2}, time.monotonic() + 60)
+            ingest.refresh_from_db()
+            self.assertEqual(ingest.status, 'running')
+            PlaylistIngestManager._schedule_batch_check.assert_called_once()
+
+            PlaylistIngestManager._check_batch(ingest.ingest_id, 'batch-1', {'next_index': 2}, time.monotonic() - 1)
+        ingest.refresh_from_db()
+        self.assertEqual((ingest.status, ingest.next_index), ('pending', 2))
+        self.submit.assert_called_once_with(ingest.ingest_id)
+
+    def test_queued_ingest_is_not_taken_for_stalled(self):
+        queued = self.running_ingest(600, status='pending')
+        lost = self.running_ingest(7200, status='pending')
+
+        self.assertEqual(PlaylistIngestManager.fail_stalled(), 1)
+        queued.refresh_from_db()
+        lost.refresh_from_db()
+        self.assertEqual((queued.status, lost.status), ('pending', 'failed'))
+
+    def test_only_stalled_ingests_are_failed(self):
+        live = self.running_ingest(10)
+        stalled = self.running_ingest(600)
+
+        self.assertEqual(PlaylistIngestManager.fail_stalled(), 1)
+        live.refresh_from_db()
+        stalled.refresh_from_db()
+        self.assertEqual(live.status, 'running')
+        self.assertEqual(stalled.status, 'failed')
+
+    def test_resume_refuses_a_live_ingest(self):
+        live = self.running_ingest(10)
+        self.assertFalse(PlaylistIngestManager.resume(live))
+        self.submit.assert_not_called()
+
+    def test_resume_takes_over_a_stalled_ingest(self):
+        stalled = self.running_ingest(600)
+        self.assertTrue(PlaylistIngestManager.resume(stalled))
+        self.assertEqual(stalled.status, 'pending')
+        self.submit.assert_called_once_with(stalled.ingest_id)
+        # A second resume finds it claimed
+        self.assertFalse(PlaylistIngestManager.resume(stalled))
+
+    def test_index_starts_an_ingest_for_playlist_urls(self):
+        response = self.client.post(reverse('FetchVideoApp:index'), {'youtube_link': self.PLAYLIST_URL})
+
+        ingest = PlaylistIngest.objects.get()
+        self.assertEqual(ingest.url, self.PLAYLIST_URL)
+        self.assertRedirects(response, reverse('FetchVideoApp:playlist_detail', kwargs={'ingest_id': ingest.ingest_id}))
+        self.submit.assert_called_once_with(ingest.ingest_id)
+
+    def test_validate_url_reports_playlists(self):
+        response = self.client.post(reverse('FetchVideoApp:validate_url'), json.dumps({'url': self.PLAYLIST_URL}),
+                                    content_type='application/json')
+        self.assertEqual(response.json()['type'], 'playlist')
+        self.assertTrue(response.json()['valid'])
+
+
+class DownloadJobTests(SimpleTestCase):
+    """Jobs are queued on a bounded pool and move from queued to running to completed or failed"""
+
+    def setUp(self):
+        settings_override = override_settings(CACHES=TEST_CACHES)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+
+        patcher = mock.patch.object(jobs, 'publish_job_event')
+        self.publish = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.backend = ThreadPoolJobBackend(max_workers=1, max_pending=2)
+        patcher = mock.patch.object(jobs, '_backend', self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.release = threading.Event()
+        self.statuses = []
+
+        def download(session_key, video_id, video_quality, processor):
+            self.statuses.append(DownloadJobManager.get_job(processor.job_id)['status'])
+            self.release.wait(5)
+            if video_id == 'broken':
+                raise RuntimeError('merge failed')
+            return 'video.mp4', '/tmp/session', 'content-key'
+
+        patcher = mock.patch.object(views, 'download_video_with_best_audio', side_effect=download)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Let the remaining jobs finish while the pipeline is still patched
+        self.addCleanup(self.backend._executor.shutdown)
+        self.addCleanup(self.release.set)
+
+    def wait_for_status(self, job_id, *statuses):
+        deadline = time.monotonic() + 5
+        while DownloadJobManager.get_job(job_id)['status'] not in statuses:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        return DownloadJobManager.get_job(job_id)
+
+    def test_job_runs_to_completion(self):
+        job = DownloadJobManager.enqueue('video', '720p', 'session')
+        self.assertEqual(job['status'], 'queued')
+
+        self.wait_for_status(job['job_id'], 'running')
+        self.release.set()
+        job = self.wait_for_status(job['job_id'], 'completed', 'failed')
+
+        self.assertEqual(self.statuses, ['running'])
+        self.assertEqual(job['status'], 'completed')
+        self.assertEqual((job['video_name'], job['temp_dir'], job['content_key']), ('video.mp4', '/tmp/session', 'content-key'))
+        self.assertIsNotNone(job['started_at'])
+        self.assertIsNotNone(job['finished_at'])
+        published = [call.args[1]['status'] for call in self.publish.call_args_list]
+        self.assertEqual(published[0], 'running')
+        self.assertEqual(published[-1], 'completed')
+
+    def test_crashed_pipeline_fails_the_job(self):
+        job = DownloadJobManager.enqueue('broken', '720p', 'session')
+        self.release.set()
+        job = self.wait_for_status(job['job_id'], 'completed', 'failed')
+
+        self.assertEqual(job['status'], 'failed')
+        self.assertIn('merge failed', job['message'])
+        self.assertIsNone(job['video_name'])
+
+    def test_full_queue_rejects_and_fails_the_job(self):
+        first = DownloadJobManager.enqueue('video', '720p', 'session')
+        self.wait_for_status(first['job_id'], 'running')
+        second = DownloadJobManager.enqueue('video', '1080p', 'session')
+
+        created = []
+        create_job = DownloadJobManager.create_job
+        with mock.patch.object(DownloadJobManager, 'create_job', side_effect=lambda *args: created.append(create_job(*args)) or created[-1]):
+            with self.assertRaises(JobQueueFull):
+                DownloadJobManager.enqueue('video', '480p', 'session')
+        self.assertEqual(DownloadJobManager.get_job(created[0]['job_id'])['status'], 'failed')
+        self.assertEqual(DownloadJobManager.get_job(second['job_id'])['status'], 'queued')
+
+        # Finished jobs free their slot
+        self.release.set()
+        self.wait_for_status(second['job_id'], 'completed')
+        self.assertEqual(DownloadJobManager.enqueue('video', '480p', 'session')['status'], 'queued')
+
+    def test_status_read_does_not_touch_the_job(self):
+        job = DownloadJobManager.create_job('video', '720p', 'session')
+        DownloadJobManager.record_progress(job['job_id'], 'downloading', 40, 'Downloading...')
+        self.publish.reset_mock()
+        request = RequestFactory().get(reverse('FetchVideoApp:job_status', args=[job['job_id']]))
+        request.session = SimpleNamespace(session_key='session')
+
+        response = views.get_job_status(request, job['job_id'])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)['message'], 'Waiting for a free worker...')
+        self.assertEqual(DownloadJobManager.get_job(job['job_id']), job)
+        self.publish.assert_not_called()
+
+        request.session = SimpleNamespace(session_key='other-session')
+        self.assertEqual(views.get_job_status(request, job['job_id']).status_code, 404)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BatchTests(SimpleTestCase):
+    """Batch progress is aggregated from its jobs and finished videos stream as one ZIP"""
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def finish_job(self, item, status, video_name=None):
+        job = DownloadJobManager.create_job(item['video_id'], item['video_quality'], 'session')
+        item.update(job_id=job['job_id'], status='queued')
+        # Every job links its video into its own session directory
+        temp_dir = f"session-{item['video_quality']}"
+        if video_name:
+            os.makedirs(os.path.join(self.media_root, temp_dir), exist_ok=True)
+            with open(os.path.join(self.media_root, temp_dir, video_name), 'wb') as f:
+                f.write(item['video_quality'].encode() * 1000)
+        if status != 'queued':
+            DownloadJobManager.update_job(job['job_id'], status=status, message=status, video_name=video_name, temp_dir=temp_dir)
+        return job
+
+    def test_status_is_aggregated_from_the_jobs(self):
+        batch = BatchManager.create_batch([('a', '720p'), ('b', '720p'), ('a', '720p'), ('c', '720p')], 'session')
+        self.assertEqual([item['video_id'] for item in batch['items']], ['a', 'b', 'c'])
+        first, second, third = batch['items']
+        self.finish_job(first, 'completed', 'a.mp4')
+        running = self.finish_job(second, 'running')
+        DownloadJobManager.record_progress(running['job_id'], 'downloading', 50, 'Downloading...')
+        third.update(status='failed', message='Unable to fetch video details')
+        batch['status'] = 'running'
+
+        snapshot = BatchManager.status_snapshot(batch)
+        self.assertEqual(snapshot['status'], 'running')
+        self.assertEqual(snapshot['progress'], 83)
+        self.assertEqual(snapshot['counts'], {'completed': 1, 'running': 1, 'failed': 1})
+        self.assertNotIn('temp_dir', snapshot['items'][0])
+
+        DownloadJobManager.update_job(running['job_id'], status='failed', message='Download failed')
+        snapshot = BatchManager.status_snapshot(batch)
+        self.assertEqual((snapshot['status'], snapshot['progress']), ('completed', 100))
+
+        first_job = DownloadJobManager.get_job(first['job_id'])
+        DownloadJobManager.update_job(first_job['job_id'], status='failed')
+        self.assertEqual(BatchManager.status_snapshot(batch)['status'], 'failed')
+
+    def test_finished_videos_stream_as_a_stored_zip(self):
+        batch = BatchManager.create_batch([('a', '720p'), ('a', '1080p'), ('b', '720p')], 'session')
+        first, second, third = batch['items']
+        self.finish_job(first, 'completed', 'video.mp4')
+        self.finish_job(second, 'completed', 'video.mp4')
+        self.finish_job(third, 'queued')
+
+        files = BatchManager.completed_files(batch)
+        self.assertEqual([name for _, name in files], ['video.mp4', 'video_1080p.mp4'])
+
+        chunks = list(stream_zip(files, chunk_size=256))
+        self.assertGreater(len(chunks), 2)
+        with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.namelist(), ['video.mp4', 'video_1080p.mp4'])
+            self.assertTrue(all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist()))
+            self.assertEqual(archive.read('video.mp4'), b'720p' * 1000)
+            self.assertEqual(archive.read('video_1080p.mp4'), b'1080p' * 1000)
+
+
+@override_settings(CACHES=TEST_CACHES, PROGRESS_SSE_HEARTBEAT=0.2)
+class JobEventsTests(SimpleTestCase):
+    """The SSE stream: snapshot first, then events, ending with the job"""
+
+    def setUp(self):
+        cache.clear()
+        self.pubsub = InMemoryPubSub()
+        patcher = mock.patch.object(views, 'get_pubsub', return_value=self.pubsub)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.job = DownloadJobManager.create_job('dQw4w9WgXcQ', '720p', 'session')
+
+    async def read_stream(self):
+        request = AsyncRequestFactory().get(f"/api/jobs/{self.job['job_id']}/events/")
+        request.session = SimpleNamespace(session_key='session')
+        response = await views.job_events(request, self.job['job_id'])
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        messages = []
+        async for chunk in response.streaming_content:
+            messages.append(chunk.decode() if isinstance(chunk, bytes) else chunk)
+        return messages
+
+    @staticmethod
+    def data(messages):
+        return [json.loads(line[len('data: '):]) for message in messages
+                for line in message.splitlines() if line.startswith('data: ')]
+
+    async def test_snapshot_events_and_terminal_event(self):
+        channel = job_channel(self.job['job_id'])
+
+        async def publish():
+            await asyncio.sleep(0.05)
+            # Published from a worker thread, as the download pipeline does
+            await asyncio.to_thread(self.pubsub.publish, channel, {'status': 'running', 'progress': 50})
+            await asyncio.sleep(0.05)
+            await asyncio.to_thread(self.pubsub.publish, channel, {'status': 'completed', 'progress': 100})
+
+        messages, _ = await asyncio.wait_for(asyncio.gather(self.read_stream(), publish()), 5)
+
+        self.assertEqual([d['status'] for d in self.data(messages)], ['queued', 'running', 'completed'])
+        self.assertTrue(messages[1].startswith('id: 1\n'))
+
+    async def test_missed_terminal_event_ends_the_stream(self):
+        async def finish_silently():
+            await asyncio.sleep(0.05)
+            # The job finished but its event never reached this process's channel
+            job = dict(self.job, status='completed', message='Download completed successfully')
+            await asyncio.to_thread(cache.set, DownloadJobManager._job_key(self.job['job_id']), job)
+
+        messages, _ = await asyncio.wait_for(asyncio.gather(self.read_stream(), finish_silently()), 5)
+
+        statuses = [d['status'] for d in self.data(messages)]
+        self.assertEqual(statuses, ['queued', 'completed'])
+
+    async def test_stream_lifetime_is_capped(self):
+        with self.settings(PROGRESS_SSE_MAX_DURATION=0.3):
+            messages = await asyncio.wait_for(self.read_stream(), 5)
+        self.assertEqual(self.data(messages)[0]['status'], 'queued')
+        self.assertIn(': keep-alive\n\n', messages)
+
+
+class VideoDetailsTests(TestCase):
+    """Video details come from the player API response only, the streams are left to the prefetch"""
+
+    VIDEO_ID = 'dQw4w9WgXcQ'
+
+    def setUp(self):
+        settings_override = override_settings(CACHES=TEST_CACHES)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        self.addCleanup(history_buffer.flush)
+
+        test = self
+        self.extracted = []
+        self.unavailable = set()
+
+        class FakeYouTube:
+            def __init__(self, url):
+                from pytubefix.exceptions import VideoUnavailable
+
+                video_id = url.rsplit('=', 1)[-1]
+                test.extracted.append(video_id)
+                self.check_availability = mock.Mock(
+                    side_effect=VideoUnavailable(video_id) if video_id in test.unavailable else None
+                )
+                self.vid_info = {
+                    'playabilityStatus': {'status': 'OK'},
+                    'videoDetails': {
+                        'title': 'Title \U0001F600', 'author': 'Author', 'lengthSeconds': '212',
+                        'viewCount': '42', 'shortDescription': 'Description',
+                        'thumbnail': {'thumbnails': [{'url': 'small.jpg'}, {'url': 'large.jpg'}]},
+                    },
+                    'microformat': {'playerMicroformatRenderer': {'publishDate': '2009-10-24T23:57:33-07:00'}},
+                }
+                test.youtube = self
+
+            @property
+            def streams(self):
+                raise AssertionError('streams extracted on the page path')
+
+        patcher = mock.patch('fetchVideoApp.manifest.CachedPlayerYouTube', FakeYouTube)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(views, 'prefetch_stream_manifest')
+        self.prefetch = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_miss_fetches_metadata_and_prefetches_the_streams(self):
+        record = views.fetch_video_details(self.VIDEO_ID)
+
+        self.youtube.check_availability.assert_called_once_with()
+        self.prefetch.assert_called_once_with(self.VIDEO_ID)
+        self.assertEqual(record.title, 'Title ')
+        self.assertEqual(record.duration, '00:03:32')
+        self.assertEqual(record.views, 42)
+        self.assertEqual(record.thumbnail_url, 'large.jpg')
+        self.assertEqual(record.publish_date, datetime(2009, 10, 25, 6, 57, 33, tzinfo=dt_timezone.utc))
+        self.assertTrue(Video.objects.filter(video_id=self.VIDEO_ID).exists())
+
+    def test_unavailable_video_is_not_stored(self):
+        from pytubefix.exceptions import VideoUnavailable
+
+        with mock.patch('fetchVideoApp.manifest.CachedPlayerYouTube') as youtube:
+            youtube.return_value.check_availability.side_effect = VideoUnavailable(self.VIDEO_ID)
+            self.assertIsNone(views.fetch_video_details(self.VIDEO_ID))
+
+        self.prefetch.assert_not_called()
+        self.assertFalse(Video.objects.filter(video_id=self.VIDEO_ID).exists())
+
+    def test_details_of_many_videos(self):
+        cached, stored, new, unavailable = 'cachedvideo', 'storedvideo', 'newvideo123', 'unavailable'
+        VideoMetadataCache.set(VideoRecord(video_id=cached, title='Cached', url='', channel_title='',
+                                           duration='00:00:10', thumbnail_url=''))
+        Video.objects.create(video_id=stored, title='Stored', url='', channel_title='',
+                             duration='00:00:10', thumbnail_url='')
+        self.unavailable.add(unavailable)
+
+        response = self.client.get(reverse('FetchVideoApp:video_details_many'),
+                                   {'ids': f'{cached},{stored},{new},{unavailable},{cached}'})
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(list(data['videos']), [cached, stored, new])
+        self.assertEqual([data['videos'][video_id]['title'] for video_id in (cached, stored)], ['Cached', 'Stored'])
+        self.assertEqual(data['missing'], [unavailable])
+        # Only the videos in neither the cache nor the database contact YouTube, without their streams
+        self.assertEqual(sorted(self.extracted), [new, unavailable])
+        self.prefetch.assert_not_called()
+        self.assertTrue(Video.objects.filter(video_id=new).exists())
+        self.assertIsNotNone(VideoMetadataCache.get(new))
+
+    @override_settings(VIDEO_DETAILS_MAX_IDS=2)
+    def test_details_of_many_videos_validates_the_ids(self):
+        url = reverse('FetchVideoApp:video_details_many')
+        for ids in ('', 'not-an-id', 'aaaaaaaaaaa,bbbbbbbbbbb,ccccccccccc'):
+            self.assertEqual(self.client.get(url, {'ids': ids}).status_code, 400, ids)
+        for body in ('{"ids": "aaaaaaaaaaa"}', '{"ids": [1]}', '[', '[]'):
+            self.assertEqual(self.client.post(url, body, content_type='application/json').status_code, 400, body)
+
+        # Repeated ids count once
+        response = self.client.post(url, {'ids': ['aaaaaaaaaaa', 'bbbbbbbbbbb', 'aaaaaaaaaaa']},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(self.extracted), ['aaaaaaaaaaa', 'bbbbbbbbbbb'])
+
+
+class HistoryBufferTests(TransactionTestCase):
+    """Buffered history is written with one bulk insert per flush, from a background thread"""
+
+    def setUp(self):
+        self.buffer = HistoryBuffer()
+        self.addCleanup(lambda: self.buffer._timer and self.buffer._timer.cancel())
+        patcher = mock.patch.object(ProcessingLog.objects, 'bulk_create', wraps=ProcessingLog.objects.bulk_create)
+        self.bulk_create = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_logs(self, count):
+        for index in range(count):
+            self.buffer.add_log(video_id='video', operation='extraction', status='success', message=str(index))
+
+    def wait_for_logs(self, count):
+        deadline = time.monotonic() + 5
+        while ProcessingLog.objects.count() < count:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.02)
+
+    @override_settings(HISTORY_BUFFER_SIZE=3, HISTORY_FLUSH_INTERVAL=60)
+    def test_full_buffer_flushes_at_once(self):
+        self.add_logs(2)
+        time.sleep(0.1)
+        self.assertEqual(ProcessingLog.objects.count(), 0)
+
+        self.add_logs(1)
+        self.wait_for_logs(3)
+        self.assertEqual(self.bulk_create.call_count, 1)
+
+    @override_settings(HISTORY_BUFFER_SIZE=200, HISTORY_FLUSH_INTERVAL=0.2)
+    def test_timer_flushes_what_is_waiting(self):
+        self.add_logs(5)
+        self.assertEqual(ProcessingLog.objects.count(), 0)
+
+        self.wait_for_logs(5)
+        self.assertEqual(self.bulk_create.call_count, 1)
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.bulk_create.call_count, 1)
+
+    def test_downloads_of_unknown_videos_are_dropped(self):
+        def dropped():
+            values = {tuple(key): value for key, value in metrics.history_dropped.snapshot()['values']}
+            return values.get(('unknown_video',), 0)
+
+        Video.objects.create(video_id='dQw4w9WgXcQ', title='Test video', url='', channel_title='',
+                             duration='00:00:10', thumbnail_url='')
+        before = dropped()
+        for video_id in ('dQw4w9WgXcQ', 'unknown', 'dQw4w9WgXcQ'):
+            self.buffer.add_download(video_id=video_id, quality='720p', file_size=10, download_time=timezone.now())
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(DownloadHistory.objects.filter(video__video_id='dQw4w9WgXcQ').count(), 2)
+        self.assertEqual(dropped() - before, 1)
+
+
+class MetricsTests(SimpleTestCase):
+    """Prometheus text output and the merge of per-process snapshots"""
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self.requests = self.registry.register(metrics.Counter('test_requests_total', 'Requests', ['path']))
+        self.active = self.registry.register(metrics.Gauge('test_active', 'Active jobs'))
+        self.duration = self.registry.register(metrics.Histogram('test_duration_seconds', 'Duration', buckets=(1, 5)))
+
+    def test_exposition_format(self):
+        self.requests.inc(path='/a"b')
+        self.requests.inc(2, path='/a"b')
+        self.active.set(3)
+        for value in (0.5, 2, 10):
+            self.duration.observe(value)
+
+        self.assertEqual(metrics.render(self.registry.snapshot()), '\n'.join([
+            '# HELP test_active Active jobs',
+            '# TYPE test_active gauge',
+            'test_active 3',
+            '# HELP test_duration_seconds Duration',
+            '# TYPE test_duration_seconds histogram',
+            'test_duration_seconds_bucket{le="1"} 1',
+            'test_duration_seconds_bucket{le="5"} 2',
+            'test_duration_seconds_bucket{le="+Inf"} 3',
+            'test_duration_seconds_sum 12.5',
+            'test_duration_seconds_count 3',
+            '# HELP test_requests_total Requests',
+            '# TYPE test_requests_total counter',
+            'test_requests_total{path="/a\\"b"} 3',
+        ]) + '\n')
+
+    def test_snapshots_of_all_processes_are_merged(self):
+        self.requests.inc(path='/')
+        self.active.set(1)
+        self.duration.observe(2)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        # Another worker that is still running and one that has exited
+        other = {'alive': os.getppid(), 'dead': 999999999}
+        for name, pid in other.items():
+            with open(os.path.join(directory, f'{pid}.json'), 'w') as f:
+                json.dump(self.registry.snapshot(), f)
+        with open(os.path.join(directory, 'notes.txt'), 'w') as f:
+            f.write('not a snapshot')
+
+        with override_settings(METRICS_DIR=directory):
+            merged = self.registry.collect()
+
+        self.assertEqual(merged['test_requests_total']['values'], [[['/'], 3]])
+        # Gauges of the exited worker describe nothing that still exists
+        self.assertEqual(merged['test_active']['values'], [[[], 2]])
+        self.assertEqual(merged['test_duration_seconds']['values'], [[[], [[0, 3, 0], 6, 3]]])
+
+
+@override_settings(CACHES=TEST_CACHES, NEGATIVE_CACHE_TTLS={'throttled': 45})
+class ExtractionBreakerTests(SimpleTestCase):
+    """Failed extractions are cached per error class and repeated throttling opens the breaker"""
+
+    def setUp(self):
+        self.cache = mock.Mock(wraps=caches['default'])
+        self.cache.clear()
+        self.now = 1000.0
+        for name, value in (('cache', self.cache), ('time', SimpleNamespace(time=lambda: self.now)),
+                            ('youtube_breaker', CircuitBreaker('test', failure_threshold=2, base_backoff=10, max_backoff=15))):
+            patcher = mock.patch.object(breaker, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.calls = []
+
+    def extract(self, video_id, error=None):
+        with guarded_extraction(video_id):
+            self.calls.append(video_id)
+            if error:
+                raise error
+
+    def fail(self, video_id, error):
+        with self.assertRaises(type(error)):
+            self.extract(video_id, error)
+
+    def test_failures_are_remembered_per_error_class(self):
+        failures = [
+            ('removed', VideoUnavailable('removed'), 'unavailable', 600),
+            ('throttled', HTTPError('https://www.youtube.com', 429, 'Too Many Requests', {}, None), 'throttled', 45),
+            ('broken', RuntimeError('parse error'), 'error', 30),
+        ]
+        for video_id, error, error_class, ttl in failures:
+            self.fail(video_id, error)
+            self.cache.set.assert_any_call(f'{breaker.NEGATIVE_KEY_PREFIX}{video_id}', mock.ANY, ttl)
+            with self.assertRaises(ExtractionFailed) as raised:
+                self.extract(video_id)
+            self.assertEqual(raised.exception.error_class, error_class)
+        self.assertEqual(self.calls, ['removed', 'throttled', 'broken'])
+
+    def test_unavailable_videos_do_not_open_the_breaker(self):
+        for index in range(3):
+            self.fail(f'removed{index}', VideoUnavailable(f'removed{index}'))
+        self.extract('video')
+        self.assertEqual(breaker.youtube_breaker.state()['state'], 'closed')
+
+    def test_breaker_opens_lets_one_probe_through_and_closes(self):
+        self.fail('first', BotDetection('first'))
+        self.extract('second')  # A success resets the consecutive failures
+        self.fail('third', BotDetection('third'))
+        self.assertEqual(breaker.youtube_breaker.state()['state'], 'closed')
+        self.fail('fourth', RuntimeError('timeout'))
+        self.assertEqual(breaker.youtube_breaker.state()['state'], 'open')
+
+        with self.assertRaises(CircuitOpen) as raised:
+            self.extract('fifth')
+        self.assertEqual(raised.exception.retry_after, 10)
+        self.assertNotIn('fifth', self.calls)
+
+        # Half open: the first caller probes, everyone else still fails fast
+        self.now += 10
+        self.assertEqual(breaker.youtube_breaker.state()['state'], 'half_open')
+        self.assertTrue(breaker.youtube_breaker.before_call())
+        with self.assertRaises(CircuitOpen):
+            self.extract('sixth')
+        # The probe fails: open again with a doubled (capped) backoff
+        breaker.youtube_breaker.record_failure(probe=True)
+        state = breaker.youtube_breaker.state()
+        self.assertEqual((state['state'], state['trips'], state['open_until']), ('open', 2, self.now + 15))
+
+        self.now += 15
+        self.extract('seventh')
+        self.assertEqual(breaker.youtube_breaker.state(), {'failures': 0, 'trips': 0, 'open_until': 0, 'state': 'closed'})
+        self.extract('eighth')
+        self.assertEqual(self.calls, ['first', 'second', 'third', 'fourth', 'seventh', 'eighth'])
+
+
+@override_settings(CACHES=TEST_CACHES, PLAYER_CACHE_DIR=None)
+class PlayerCacheTests(SimpleTestCase):
+    """Players are downloaded once, shared between processes and evicted when they stop deciphering"""
+
+    JS_URL = 'https://www.youtube.com/s/player/abcd1234/player_ias.vflset/en_US/base.js'
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(player_cache_module, 'player_cache', PlayerCache())
+        self.player_cache = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(player_cache_module.request, 'get', side_effect=lambda url: f'// player {url}')
+        self.fetch = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cached_player_is_not_fetched_again(self):
+        self.assertEqual(self.player_cache.get_js(self.JS_URL), f'// player {self.JS_URL}')
+        self.assertEqual(self.player_cache.get_js(self.JS_URL), f'// player {self.JS_URL}')
+        self.assertEqual(self.fetch.call_count, 1)
+
+        # Another worker finds it in the shared store and warms up with it
+        other_worker = PlayerCache()
+        self.assertEqual(other_worker.get_js(self.JS_URL), f'// player {self.JS_URL}')
+        self.assertTrue(PlayerCache().warm())
+        self.assertEqual(self.fetch.call_count, 1)
+
+        # Extractions share it through the YouTube objects
+        with mock.patch.object(CachedPlayerYouTube, 'js_url', new_callable=mock.PropertyMock, return_value=self.JS_URL):
+            for _ in range(2):
+                yt = CachedPlayerYouTube('https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+                self.assertEqual(yt.js, f'// player {self.JS_URL}')
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_player_that_fails_to_decipher_is_evicted(self):
+        self.player_cache.set_transform(self.JS_URL, 'sig', {'function': 'xy', 'param': None})
+        with mock.patch.object(CachedPlayerYouTube, 'js_url', new_callable=mock.PropertyMock, return_value=self.JS_URL):
+            yt = CachedPlayerYouTube('https://www.youtube.com/watch?v=dQw4w9WgXcQ')
+            yt.js
+            self.assertEqual(self.fetch.call_count, 1)
+
+            # What pytubefix does after an ExtractError before it retries deciphering
+            yt._js = None
+            yt._js_url = None
+            with self.assertLogs('fetchVideoApp.player_cache', 'WARNING'):
+                self.assertEqual(yt.js, f'// player {self.JS_URL}')
+
+        self.assertEqual(self.fetch.call_count, 2)
+        self.assertIsNone(self.player_cache.get_transform(self.JS_URL, 'sig'))
+
+
+class RangedFileResponseTests(SimpleTestCase):
+    """Downloads honour Range, If-Range and conditional GET headers"""
+
+    CONTENT = bytes(range(256)) * 40
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.mp4')
+        with os.fdopen(handle, 'wb') as f:
+            f.write(self.CONTENT)
+        self.addCleanup(os.remove, self.path)
+
+    def get(self, content_key='content-key', **headers):
+        request = RequestFactory().get('/download/', headers=headers)
+        response = ranged_file_response(request, self.path, 'video.mp4', content_key=content_key)
+        self.addCleanup(response.close)
+        return response
+
+    @staticmethod
+    def body(response):
+        return b''.join(response.streaming_content)
+
+    def test_full_download(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(self.body(response), self.CONTENT)
+
+    def test_range_is_served_partially(self):
+        response = self.get(range='bytes=100-1099')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-1099/{len(self.CONTENT)}')
+        self.assertEqual(response['Content-Length'], '1000')
+        self.assertEqual(self.body(response), self.CONTENT[100:1100])
+
+        response = self.get(range='bytes=-10')
+        self.assertEqual(self.body(response), self.CONTENT[-10:])
+
+    def test_unsatisfiable_range(self):
+        response = self.get(range=f'bytes={len(self.CONTENT)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.CONTENT)}')
+
+    def test_if_range_only_resumes_the_same_file(self):
+        etag = self.get()['ETag']
+        response = self.get(range='bytes=0-9', if_range=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), self.CONTENT[:10])
+
+        # The file changed since the client's partial download: send all of it again
+        response = self.get(content_key='other-content', range='bytes=0-9', if_range=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.CONTENT)
+
+    def test_etag_is_independent_of_mtime_with_a_content_key(self):
+        etag = self.get()['ETag']
+        os.utime(self.path, (1, 1))
+        self.assertEqual(self.get()['ETag'], etag)
+
+    def test_conditional_get(self):
+        response = self.get()
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(self.get(if_none_match=etag).status_code, 304)
+        self.assertEqual(self.get(if_modified_since=last_modified).status_code, 304)
+        self.assertEqual(self.get(if_none_match='"stale"').status_code, 200)
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """Serves server.content with single byte range support and scripted misbehaviour"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def handle(self):
+        try:
+            super().handle()
+        except ConnectionError:
+            pass  # The client closed a kept-alive connection (cancelled download, closed session)
+
+    def do_GET(self):
+        server = self.server
+        content = server.content
+        match = re.fullmatch(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+        with server.lock:
+            server.ranges.append(match.group(0) if match else None)
+
+        if not match or server.ignore_range:
+            start, end, status = 0, len(content) - 1, 200
+        else:
+            start, end, status = int(match.group(1)), min(int(match.group(2)), len(content) - 1), 206
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(content)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+        body = content[start:end + 1]
+        self.send_response(status)
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(content)}')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        with server.lock:
+            drop = start in server.drop_once
+            server.drop_once.discard(start)
+        if drop:
+            # Announce the whole range but hang up halfway through it
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+
+        for offset in range(0, len(body), 4096):
+            if server.delay:
+                time.sleep(server.delay)
+            self.wfile.write(body[offset:offset + 4096])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class SegmentedDownloaderTests(SimpleTestCase):
+    """SegmentedDownloader against a local HTTP server with Range support"""
+
+    CONTENT = os.urandom(100 * 1024 + 123)
+    SEGMENT_SIZE = 16 * 1024
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+        self.server.daemon_threads = True
+        self.server.content = self.CONTENT
+        self.server.lock = threading.Lock()
+        self.server.ranges = []
+        self.server.drop_once = set()
+        self.server.ignore_range = False
+        self.server.delay = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        self.url = f'http://127.0.0.1:{self.server.server_port}/stream'
+        self.session = requests.Session()
+        self.addCleanup(self.session.close)
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir, ignore_errors=True)
+        self.output_path = os.path.join(self.output_dir, 'stream.mp4')
+
+    def downloader(self, filesize=None, segment_size=SEGMENT_SIZE, max_retries=2):
+        return SegmentedDownloader(
+            self.url, len(self.CONTENT) if filesize is None else filesize, self.output_path,
+            segment_size=segment_size, concurrency=4, max_retries=max_retries, session=self.session, timeout=5
+        )
+
+    def read_output(self):
+        with open(self.output_path, 'rb') as f:
+            return f.read()
+
+    def test_segments_cover_the_file(self):
+        segments = SegmentedDownloader(self.url, 2500, self.output_path, segment_size=1000,
+                                       session=self.session).segments()
+        self.assertEqual(segments, [(0, 999), (1000, 1999), (2000, 2499)])
+
+    def test_downloads_all_ranges_in_parallel(self):
+        progress = []
+        self.downloader().download(on_progress=progress.append)
+
+        self.assertEqual(self.read_output(), self.CONTENT)
+        expected = [f'bytes={start}-{end}' for start, end in self.downloader().segments()]
+        self.assertCountEqual(self.server.ranges, expected)
+        self.assertEqual(max(progress), len(self.CONTENT))
+
+    def test_full_response_accepted_for_a_single_segment(self):
+        self.server.ignore_range = True
+        self.downloader(segment_size=len(self.CONTENT)).download()
+        self.assertEqual(self.read_output(), self.CONTENT)
+
+    def test_full_response_rejected_for_a_partial_segment(self):
+        self.server.ignore_range = True
+        with self.assertRaisesRegex(SegmentError, 'Unexpected HTTP 200'):
+            self.downloader(max_retries=0).download()
+
+    def test_dropped_connection_is_retried(self):
+        self.server.drop_once.add(self.SEGMENT_SIZE)
+        progress = []
+        self.downloader().download(on_progress=progress.append)
+
+        self.assertEqual(self.read_output(), self.CONTENT)
+        retried = f'bytes={self.SEGMENT_SIZE}-{2 * self.SEGMENT_SIZE - 1}'
+        self.assertEqual(self.server.ranges.count(retried), 2)
+        # Bytes of the dropped attempt are not counted twice
+        self.assertEqual(max(progress), len(self.CONTENT))
+
+    def test_size_mismatch_fails(self):
+        # The stream is shorter than announced: the last range comes back short
+        with self.assertRaises(SegmentError):
+            self.downloader(filesize=len(self.CONTENT) + 1000, max_retries=0).download()
+
+    def test_cancellation_stops_the_download(self):
+        self.server.delay = 0.05
+        cancel_event = threading.Event()
+        received = threading.Event()
+
+        def on_progress(bytes_done):
+            received.set()
+
+        threading.Timer(0.2, cancel_event.set).start()
+        started = time.monotonic()
+        with self.assertRaises(DownloadCancelled):
+            self.downloader().download(on_progress=on_progress, cancel_event=cancel_event)
+        self.assertTrue(received.is_set())
+        self.assertLess(time.monotonic() - started, 3)
+
+
+class TransportRequestHandler(RangeRequestHandler):
+    """RangeRequestHandler plus HEAD, a JSON echo for POST and a missing page"""
+
+    def do_GET(self):
+        if self.path == '/missing':
+            self.send_response(404)
+            self.send_header('Content-Length', '4')
+            self.end_headers()
+            self.wfile.write(b'gone')
+            return
+        super().do_GET()
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.server.content)))
+        self.end_headers()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Type', self.headers['Content-Type'])
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class PooledTransportTests(SimpleTestCase):
+    """pytubefix's requests go through the pooled session and keep their connection alive"""
+
+    CONTENT = b'0123456789' * 10000
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), TransportRequestHandler)
+        self.server.daemon_threads = True
+        self.server.content = self.CONTENT
+        self.server.lock = threading.Lock()
+        self.server.ranges = []
+        self.server.drop_once = set()
+        self.server.ignore_range = False
+        self.server.delay = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+        # A session of our own, so connections opened by other tests don't count
+        patcher = mock.patch.object(http_client, '_http_session', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(lambda: http_client._http_session and http_client._http_session.close())
+        patcher = mock.patch.object(pytubefix_request, '_execute_request', pytubefix_request._execute_request)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def counts():
+        def value(metric):
+            values = {tuple(key): value for key, value in metric.snapshot()['values']}
+            return values.get(('other',), 0)
+        return value(metrics.http_requests), value(metrics.http_connections)
+
+    def test_pytubefix_requests_reuse_one_connection(self):
+        http_client.install_pytubefix_transport()
+        self.assertIs(pytubefix_request._execute_request, http_client.pytubefix_execute_request)
+        requests_before, connections_before = self.counts()
+
+        self.assertEqual(pytubefix_request.get(f'{self.url}/page'), self.CONTENT.decode())
+        self.assertEqual(json.loads(pytubefix_request.post(f'{self.url}/api', data={'videoId': 'abc'})), {'videoId': 'abc'})
+        self.assertEqual(pytubefix_request.head(f'{self.url}/stream')['content-length'], str(len(self.CONTENT)))
+        self.assertEqual(pytubefix_request.get(f'{self.url}/page'), self.CONTENT.decode())
+
+        requests_after, connections_after = self.counts()
+        self.assertEqual(requests_after - requests_before, 4)
+        self.assertEqual(connections_after - connections_before, 1)
+
+    def test_response_surface(self):
+        response = http_client.pytubefix_execute_request(f'{self.url}/stream', headers={'Range': 'bytes=10-29'})
+        self.assertEqual((response.getcode(), response.status), (206, 206))
+        self.assertEqual(response.read(5), self.CONTENT[10:15])
+        self.assertEqual(response.read(), self.CONTENT[15:30])
+        self.assertEqual(response.read(), b'')
+        self.assertEqual(response.info()['Content-Range'], f'bytes 10-29/{len(self.CONTENT)}')
+
+        # Only the headers were wanted: the body is dropped instead of holding the connection
+        response = http_client.pytubefix_execute_request(f'{self.url}/stream')
+        self.assertEqual(response.info()['Content-Length'], str(len(self.CONTENT)))
+        self.assertEqual(response.read(), b'')
+
+        with self.assertRaises(HTTPError) as raised:
+            http_client.pytubefix_execute_request(f'{self.url}/missing')
+        self.assertEqual(raised.exception.code, 404)
+        self.assertEqual(raised.exception.read(), b'gone')
+
+    def test_dropped_connection_keeps_the_received_bytes(self):
+        self.server.drop_once.add(0)
+        response = http_client.pytubefix_execute_request(f'{self.url}/stream')
+        with self.assertRaises(http.client.IncompleteRead) as raised:
+            response.read()
+        self.assertEqual(raised.exception.partial, self.CONTENT[:len(self.CONTENT) // 2])
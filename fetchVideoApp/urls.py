@@ -9,13 +9,26 @@ urlpatterns = [
     path('', views.index, name='index'),
 
     path('video/<str:video_id>/', views.video_detail, name='video_detail'),
-    path('video/<str:video_id>/download/<str:video_quality>/', views.download_video_with_best_audio, name='download_video_with_best_audio'),
+    path('video/<str:video_id>/download/<str:video_quality>/', views.start_download, name='download_video_with_best_audio'),
+    path('downloads/<str:job_id>/', views.download_job, name='download_job'),
+    path('playlist/<str:ingest_id>/', views.playlist_detail, name='playlist_detail'),
     path('media/<path:temp_dir>/<str:video_name>/', views.download, name='download'),
 
     # API endpoints
     path('api/status/<str:video_id>/', views.get_processing_status, name='processing_status'),
+    path('api/jobs/<str:job_id>/', views.get_job_status, name='job_status'),
+    path('api/jobs/<str:job_id>/events/', views.job_events, name='job_events'),
+    path('api/jobs/<str:job_id>/poll/', views.job_events_poll, name='job_events_poll'),
+    path('api/video/<str:video_id>/streams/', views.stream_options, name='stream_options'),
+    path('api/videos/', views.video_details_many, name='video_details_many'),
     path('api/validate-url/', views.validate_youtube_url, name='validate_url'),
     path('api/batch-download/', views.batch_download, name='batch_download'),
+    path('api/batches/<str:batch_id>/', views.batch_status, name='batch_status'),
+    path('api/batches/<str:batch_id>/zip/', views.batch_zip, name='batch_zip'),
+    path('api/playlists/', views.playlist_ingest, name='playlist_ingest'),
+    path('api/playlists/<str:ingest_id>/', views.playlist_status, name='playlist_status'),
+    path('api/playlists/<str:ingest_id>/resume/', views.playlist_resume, name='playlist_resume'),
+    path('metrics', views.metrics_view, name='metrics'),
 
     path('contact/', views.contact, name='contact'),
     path('about/', views.about, name='about'),
@@ -1,20 +1,36 @@
 import os
 import re
-import shlex
-import subprocess
+import shutil
 import logging
 import json
-from django.http import HttpResponse, HttpResponseNotFound, JsonResponse
+from django.http import HttpResponse, HttpResponseNotFound, JsonResponse, StreamingHttpResponse
 from django import forms
 from django.conf import settings
 from django.shortcuts import render, redirect
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.utils.decorators import method_decorator
 from django.views import View
-from pytubefix import YouTube
 from .forms import VideoForm
-from .models import Video
+from .models import Video, PlaylistIngest
+from .jobs import DownloadJobManager, JobQueueFull
+from .batches import BatchManager, stream_zip
+from .playlists import PlaylistIngestManager, is_playlist_url
+from .singleflight import SingleFlight
+from .file_response import ranged_file_response
+from .downloader import download_streams_concurrently, StreamDownloadError
+from .ffmpeg import merge_streams, FFmpegError
+from .pubsub import get_pubsub, job_channel
+from .history import log_processing, timed_stage, record_download
+from .counters import video_counters
+from .metadata import VideoRecord, VideoMetadataCache
+from . import metrics
+from .manifest import (
+    extract_metadata, get_stream_manifest, get_cached_stream_manifest, get_pytubefix_stream,
+    prefetch_stream_manifest, get_prefetch_error,
+)
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from urllib.parse import urlparse
 import requests
@@ -23,10 +39,13 @@ from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
 import threading
 import time
+from asgiref.sync import sync_to_async
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
+VIDEO_ID_RE = re.compile(r'[a-zA-Z0-9_-]{11}')
+
 def contact(request):
     # Redirect to youtube.com
     return redirect('https://www.youtube.com/')
@@ -65,25 +84,28 @@ def index(request):
 
     return render(request, 'index.html', {'form': form})
 
-# Get the base directory of the Django project
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-
-# Define the path to the FFmpeg executable
-FFmpeg_PATH = os.path.join(BASE_DIR, 'ffmpeg', 'bin', 'ffmpeg.exe')
-
 # Video processing status cache key prefix
 VIDEO_STATUS_KEY = 'video_processing_status_'
 
 class VideoProcessor:
-    """Enhanced video processor with progress tracking and error handling"""
+    """Enhanced video processor with progress tracking and error handling
+
+    With a job_id, status is stored on that job only, so concurrent downloads
+    of the same video each keep their own progress. Without one (e.g. the
+    details fetch on the video page) it is stored per video.
+    """
 
-    def __init__(self, video_id):
+    def __init__(self, video_id, job_id=None):
         self.video_id = video_id
+        self.job_id = job_id
         self.status_key = f"{VIDEO_STATUS_KEY}{video_id}"
-        self._update_status('initialized', 0, 'Video processor initialized')
 
-    def _update_status(self, status, progress, message):
+    def _update_status(self, status, progress, message, bytes_done=None, bytes_total=None):
         """Update processing status in cache"""
+        if self.job_id:
+            DownloadJobManager.record_progress(self.job_id, status, progress, message, bytes_done, bytes_total)
+            return
+
         cache.set(self.status_key, {
             'status': status,
             'progress': progress,
@@ -93,7 +115,21 @@ class VideoProcessor:
 
     def get_status(self):
         """Get current processing status"""
-        return cache.get(self.status_key, {
+        if self.job_id:
+            record = DownloadJobManager.get_progress(self.job_id)
+            if record:
+                return {
+                    'status': record['stage'],
+                    'progress': record['progress'],
+                    'message': record['message'],
+                    'timestamp': record['updated_at']
+                }
+        return VideoProcessor.read_status(self.video_id)
+
+    @staticmethod
+    def read_status(video_id):
+        """Read the per-video status without touching it"""
+        return cache.get(f"{VIDEO_STATUS_KEY}{video_id}", {
             'status': 'unknown',
             'progress': 0,
             'message': 'Status unknown',
@@ -168,26 +204,42 @@ def remove_emojis(text):
     return emoji_pattern.sub('', text)
 
 
+def build_video(video_id, metadata):
+    """Unsaved Video for the metadata returned by extract_metadata()"""
+    return Video(
+        title=remove_emojis(metadata['title'] or 'Unknown Title'),
+        url=f'https://www.youtube.com/watch?v={video_id}',
+        video_id=video_id,
+        channel_title=remove_emojis(metadata['author'] or 'Unknown Author'),
+        duration=str(seconds_to_hhmmss(metadata['length'])),
+        thumbnail_url=metadata['thumbnail_url'],
+        views=metadata['views'],
+        description=metadata['description'][:500],
+        publish_date=metadata['publish_date']
+    )
+
+
 def fetch_video_details(video_id, processor=None):
-    """Enhanced video details fetching with progress tracking"""
+    """VideoRecord for a video from the cache, the database or YouTube, with progress tracking"""
     try:
         if processor:
             processor._update_status('fetching', 10, 'Fetching video details from YouTube...')
 
         # Check cache first
-        cache_key = f"video_details_{video_id}"
-        cached_video = cache.get(cache_key)
+        cached_video = VideoMetadataCache.get(video_id)
         if cached_video:
+            metrics.video_details.inc(source='cache')
             if processor:
                 processor._update_status('completed', 100, 'Video details loaded from cache')
             return cached_video
 
         # Try to get from database
         try:
-            video = Video.objects.get(video_id=video_id)
+            video = VideoRecord.from_video(Video.objects.get(video_id=video_id))
+            metrics.video_details.inc(source='database')
             if processor:
                 processor._update_status('completed', 100, 'Video details loaded from database')
-            cache.set(cache_key, video, timeout=3600)  # Cache for 1 hour
+            VideoMetadataCache.set(video)
             return video
         except Video.DoesNotExist:
             pass
@@ -195,42 +247,22 @@ def fetch_video_details(video_id, processor=None):
         if processor:
             processor._update_status('processing', 30, 'Connecting to YouTube...')
 
-        youtube_link = f'https://www.youtube.com/watch?v={video_id}'
-
         try:
-            yt = YouTube(youtube_link)
+            # Metadata only: the streams are extracted by the background prefetch
+            with timed_stage(video_id, 'extraction'):
+                metadata = extract_metadata(video_id)
 
             if processor:
                 processor._update_status('processing', 60, 'Extracting video information...')
 
-            title = remove_emojis(yt.title or 'Unknown Title')
-            author = remove_emojis(yt.author or 'Unknown Author')
-
-            # Get additional metadata
-            try:
-                view_count = yt.views or 0
-                publish_date = yt.publish_date
-                description = yt.description[:500] if yt.description else ''
-            except:
-                view_count = 0
-                publish_date = None
-                description = ''
-
-            video = Video(
-                title=title,
-                url=youtube_link,
-                video_id=video_id,
-                channel_title=author,
-                duration=str(seconds_to_hhmmss(yt.length)),
-                thumbnail_url=yt.thumbnail_url,
-                views=view_count,
-                description=description,
-                publish_date=publish_date
-            )
+            video = build_video(video_id, metadata)
             video.save()
+            prefetch_stream_manifest(video_id)
+            metrics.video_details.inc(source='network')
 
             # Cache the result
-            cache.set(cache_key, video, timeout=3600)
+            video = VideoRecord.from_video(video)
+            VideoMetadataCache.set(video)
 
             if processor:
                 processor._update_status('completed', 100, 'Video details fetched successfully')
@@ -239,6 +271,7 @@ def fetch_video_details(video_id, processor=None):
             return video
 
         except Exception as e:
+            metrics.video_details.inc(source='error')
             error_msg = f"Failed to fetch video details: {str(e)}"
             logger.error(f"Error fetching video {video_id}: {error_msg}")
             if processor:
@@ -253,6 +286,52 @@ def fetch_video_details(video_id, processor=None):
         return None
 
 
+def _extract_unsaved_video(video_id):
+    """Unsaved Video extracted from YouTube, or None if it can't be extracted"""
+    try:
+        with timed_stage(video_id, 'extraction'):
+            metadata = extract_metadata(video_id)
+        return build_video(video_id, metadata)
+    except Exception as e:
+        logger.warning(f"Could not fetch video details for {video_id}: {str(e)}")
+        return None
+
+
+def fetch_video_details_many(video_ids, workers=None):
+    """VideoRecords for many videos at once, as {video_id: VideoRecord}
+
+    One cache read, one query for the cache misses and a bounded pool of
+    concurrent extractions for the videos not in the database; new rows are
+    stored with one bulk insert and all records with one cache write. Videos
+    that can't be fetched are left out.
+    """
+    video_ids = list(dict.fromkeys(video_ids))
+    records = VideoMetadataCache.get_many(video_ids)
+    metrics.video_details.inc(len(records), source='cache')
+
+    missing = [video_id for video_id in video_ids if video_id not in records]
+    fetched = []
+    if missing:
+        fetched = [VideoRecord.from_video(video) for video in Video.objects.filter(video_id__in=missing)]
+        metrics.video_details.inc(len(fetched), source='database')
+        found = {record.video_id for record in fetched}
+        missing = [video_id for video_id in missing if video_id not in found]
+
+    if missing:
+        workers = min(workers or getattr(settings, 'VIDEO_DETAILS_WORKERS', 4), len(missing))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fetchvideo-details') as executor:
+            new_videos = [video for video in executor.map(_extract_unsaved_video, missing) if video]
+        # Another request may have stored some of them meanwhile
+        Video.objects.bulk_create(new_videos, ignore_conflicts=True)
+        metrics.video_details.inc(len(new_videos), source='network')
+        metrics.video_details.inc(len(missing) - len(new_videos), source='error')
+        fetched += [VideoRecord.from_video(video) for video in new_videos]
+
+    VideoMetadataCache.set_many(fetched)
+    records.update((record.video_id, record) for record in fetched)
+    return {video_id: records[video_id] for video_id in video_ids if video_id in records}
+
+
 class VideoDownloadForm(forms.Form):
     video_quality = forms.CharField(widget=forms.HiddenInput)
     audio_quality = forms.CharField(widget=forms.HiddenInput)
@@ -263,201 +342,181 @@ def extract_numeric_bitrate(abr):
     return int(match.group()) if match else 0
 
 
-def video_detail(request, video_id):
-    """Enhanced video detail view with progress tracking and better error handling"""
-    try:
-        # Validate video_id format
-        if not video_id or len(video_id) != 11:
-            return render(request, 'error_page.html', {
-                'error_message': 'Invalid video ID format'
-            })
-
-        # Create video processor for progress tracking
-        processor = VideoProcessor(video_id)
-
-        # Fetch video details with progress tracking
-        video = fetch_video_details(video_id, processor)
+def build_download_options(manifest):
+    """Categorized video qualities (AV1 > VP9 > H264) and the best audio stream per codec"""
+    video_streams = manifest.video_streams()
+    audio_streams = manifest.audio_streams()
 
-        if not video:
-            return render(request, 'error_page.html', {
-                'error_message': 'Unable to fetch video details. Please check the URL and try again.'
-            })
-
-        # Increment views count
-        video.views += 1
-        video.save()
+    # Initialize lists for video qualities with enhanced metadata
+    av01_qualities = []
+    vp9_qualities = []
+    h264_qualities = []
 
-        processor._update_status('processing', 20, 'Analyzing available streams...')
+    for stream in video_streams:
+        try:
+            resolution = stream.resolution or 'Unknown'
+            codecs = stream.codecs or []
+            fps = stream.fps or 30
+            file_size = stream.filesize or 0
+
+            stream_info = {
+                'format': resolution,
+                'fps': fps,
+                'url': stream.url,
+                'mime_type': stream.mime_type,
+                'codecs': codecs,
+                'itag': stream.itag,
+                'file_size': file_size,
+                'file_size_formatted': format_file_size(file_size) if file_size else 'Unknown'
+            }
 
-        # Get all available video and audio qualities from pytube
-        youtube_link = f'https://www.youtube.com/watch?v={video_id}'
+            # Categorize by codec
+            if 'av01' in str(codecs).lower():
+                av01_qualities.append(stream_info)
+            elif 'vp9' in str(codecs).lower():
+                vp9_qualities.append(stream_info)
+            elif 'avc1' in str(codecs).lower():
+                h264_qualities.append(stream_info)
 
-        try:
-            yt = YouTube(youtube_link)
         except Exception as e:
-            logger.error(f"Failed to create YouTube object for {video_id}: {str(e)}")
-            return render(request, 'error_page.html', {
-                'error_message': 'Failed to connect to YouTube. Please try again later.'
-            })
+            logger.warning(f"Error processing stream {stream.itag}: {str(e)}")
+            continue
 
-        processor._update_status('processing', 40, 'Processing video streams...')
+    # Priority: AV1 > VP9 > H264
+    video_qualities = av01_qualities + vp9_qualities + h264_qualities
 
-        # Get all video streams and sort them by resolution in descending order
+    audio_qualities = []
+    for stream in audio_streams:
         try:
-            video_streams = yt.streams.filter(type="video").order_by('resolution')
-            video_streams = list(reversed(video_streams))
-        except Exception as e:
-            logger.error(f"Failed to get video streams for {video_id}: {str(e)}")
-            return render(request, 'error_page.html', {
-                'error_message': 'Failed to retrieve video streams. The video might be unavailable.'
+            file_size = stream.filesize or 0
+            audio_qualities.append({
+                'itag': stream.itag,
+                'abr': stream.abr or 'Unknown',
+                'audio_codec': stream.audio_codec or 'Unknown',
+                'mime_type': stream.mime_type,
+                'url': stream.url,
+                'file_size': file_size,
+                'file_size_formatted': format_file_size(file_size) if file_size else 'Unknown'
             })
+        except Exception as e:
+            logger.warning(f"Error processing audio stream {stream.itag}: {str(e)}")
+            continue
 
-        # Initialize lists for video qualities with enhanced metadata
-        av01_qualities = []
-        vp9_qualities = []
-        h264_qualities = []
+    # Sort audio qualities by bitrate (numerical value)
+    audio_qualities.sort(key=lambda x: extract_numeric_bitrate(x['abr']), reverse=True)
 
-        for stream in video_streams:
-            try:
-                resolution = stream.resolution or 'Unknown'
-                codecs = stream.codecs or []
-                fps = stream.fps or 30
-                file_size = getattr(stream, 'filesize', 0) or getattr(stream, 'filesize_approx', 0) or 0
-
-                stream_info = {
-                    'format': resolution,
-                    'fps': fps,
-                    'url': stream.url,
-                    'mime_type': stream.mime_type,
-                    'codecs': codecs,
-                    'itag': stream.itag,
-                    'file_size': file_size,
-                    'file_size_formatted': format_file_size(file_size) if file_size else 'Unknown'
-                }
+    # Group by codec and keep only the highest quality for each codec
+    codec_groups = {}
+    for audio_quality in audio_qualities:
+        codec = audio_quality['audio_codec'].lower() if audio_quality['audio_codec'] != 'Unknown' else 'unknown'
+        bitrate = extract_numeric_bitrate(audio_quality['abr'])
+        
+        if codec not in codec_groups or bitrate > extract_numeric_bitrate(codec_groups[codec]['abr']):
+            codec_groups[codec] = audio_quality
 
-                # Categorize by codec
-                if 'av01' in str(codecs).lower():
-                    av01_qualities.append(stream_info)
-                elif 'vp9' in str(codecs).lower():
-                    vp9_qualities.append(stream_info)
-                elif 'avc1' in str(codecs).lower():
-                    h264_qualities.append(stream_info)
+    # Convert back to list and sort by bitrate
+    filtered_audio_qualities = list(codec_groups.values())
+    filtered_audio_qualities.sort(key=lambda x: extract_numeric_bitrate(x['abr']), reverse=True)
 
-            except Exception as e:
-                logger.warning(f"Error processing stream {stream.itag}: {str(e)}")
-                continue
+    return {
+        'video_qualities': video_qualities,
+        'audio_qualities': filtered_audio_qualities,
+    }
 
-        # Priority: AV1 > VP9 > H264
-        video_qualities = av01_qualities + vp9_qualities + h264_qualities
 
-        processor._update_status('processing', 60, 'Processing audio streams...')
+def stream_options(request, video_id):
+    """API endpoint with the download options of a video (filled into the detail page)
 
-        # Get all available audio streams with enhanced metadata
-        try:
-            audio_streams = yt.streams.filter(type="audio")
-        except Exception as e:
-            logger.error(f"Failed to get audio streams for {video_id}: {str(e)}")
-            return render(request, 'error_page.html', {
-                'error_message': 'Failed to retrieve audio streams.'
-            })
+    The extraction runs in the background: until the manifest is ready this
+    answers 202 with {"status": "pending"} and the client polls again.
+    """
+    if not video_id or len(video_id) != 11:
+        return JsonResponse({'error': 'Invalid video ID format'}, status=400)
 
-        audio_qualities = []
-        for stream in audio_streams:
-            try:
-                file_size = getattr(stream, 'filesize', 0) or getattr(stream, 'filesize_approx', 0) or 0
-                audio_qualities.append({
-                    'itag': stream.itag,
-                    'abr': stream.abr or 'Unknown',
-                    'audio_codec': stream.audio_codec or 'Unknown',
-                    'mime_type': stream.mime_type,
-                    'url': stream.url,
-                    'file_size': file_size,
-                    'file_size_formatted': format_file_size(file_size) if file_size else 'Unknown'
-                })
-            except Exception as e:
-                logger.warning(f"Error processing audio stream {stream.itag}: {str(e)}")
-                continue
-
-        # Sort audio qualities by bitrate (numerical value)
-        audio_qualities.sort(key=lambda x: extract_numeric_bitrate(x['abr']), reverse=True)
+    try:
+        manifest = get_cached_stream_manifest(video_id)
+        if manifest:
+            return JsonResponse(build_download_options(manifest))
+
+        error = get_prefetch_error(video_id)
+        if error is None:
+            prefetch_stream_manifest(video_id)
+            retry_after = getattr(settings, 'STREAM_OPTIONS_POLL_INTERVAL', 1)
+            response = JsonResponse({'status': 'pending', 'retry_after': retry_after}, status=202)
+            response['Retry-After'] = str(retry_after)
+            return response
+    except Exception as e:
+        error = str(e)
 
-        # Group by codec and keep only the highest quality for each codec
-        codec_groups = {}
-        for audio_quality in audio_qualities:
-            codec = audio_quality['audio_codec'].lower() if audio_quality['audio_codec'] != 'Unknown' else 'unknown'
-            bitrate = extract_numeric_bitrate(audio_quality['abr'])
-            
-            if codec not in codec_groups or bitrate > extract_numeric_bitrate(codec_groups[codec]['abr']):
-                codec_groups[codec] = audio_quality
+    logger.error(f"Failed to load streams for {video_id}: {error}")
+    return JsonResponse({
+        'error': 'Failed to retrieve video streams. The video might be unavailable.'
+    }, status=502)
 
-        # Convert back to list and sort by bitrate
-        filtered_audio_qualities = list(codec_groups.values())
-        filtered_audio_qualities.sort(key=lambda x: extract_numeric_bitrate(x['abr']), reverse=True)
 
-        processor._update_status('processing', 80, 'Preparing download options...')
+def video_details_many(request):
+    """API endpoint with the details of several videos (ids=a,b,c or JSON {"ids": [...]})"""
+    if request.method == 'POST':
+        try:
+            video_ids = json.loads(request.body).get('ids') or []
+        except (json.JSONDecodeError, AttributeError):
+            return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+    else:
+        video_ids = [video_id for video_id in request.GET.get('ids', '').split(',') if video_id]
+
+    if not isinstance(video_ids, list) or not all(isinstance(v, str) and VIDEO_ID_RE.fullmatch(v) for v in video_ids):
+        return JsonResponse({'error': 'ids must be a list of YouTube video IDs'}, status=400)
+    video_ids = list(dict.fromkeys(video_ids))
+    max_ids = getattr(settings, 'VIDEO_DETAILS_MAX_IDS', 50)
+    if not video_ids or len(video_ids) > max_ids:
+        return JsonResponse({'error': f'Between 1 and {max_ids} video IDs are accepted'}, status=400)
+
+    records = fetch_video_details_many(video_ids)
+    return JsonResponse({
+        'videos': {video_id: record.as_dict() for video_id, record in records.items()},
+        'missing': [video_id for video_id in video_ids if video_id not in records],
+    })
 
-        # Prepare video_audio_qualities list with better pairing logic
-        video_audio_qualities = []
 
-        # Pair highest quality videos with highest quality audio
-        min_length = min(len(video_qualities), len(filtered_audio_qualities))
+def video_detail(request, video_id):
+    """Enhanced video detail view with progress tracking and better error handling"""
+    try:
+        # Validate video_id format
+        if not video_id or len(video_id) != 11:
+            return render(request, 'error_page.html', {
+                'error_message': 'Invalid video ID format'
+            })
 
-        for i in range(min_length):
-            video_audio_qualities.append((video_qualities[i], filtered_audio_qualities[i]))
+        # Create video processor for progress tracking
+        processor = VideoProcessor(video_id)
 
-        # Add remaining videos with best audio
-        for i in range(min_length, len(video_qualities)):
-            video_audio_qualities.append((video_qualities[i], filtered_audio_qualities[0] if filtered_audio_qualities else None))
+        # Fetch video details with progress tracking
+        video = fetch_video_details(video_id, processor)
 
-        # Add remaining audio with best video
-        for i in range(min_length, len(filtered_audio_qualities)):
-            video_audio_qualities.append((video_qualities[0] if video_qualities else None, filtered_audio_qualities[i]))
+        if not video:
+            return render(request, 'error_page.html', {
+                'error_message': 'Unable to fetch video details. Please check the URL and try again.'
+            })
 
-        processor._update_status('completed', 100, 'Ready for download')
+        # Increment views count (buffered, no database write on the request path)
+        video.increment_views()
 
-        # Handle video download form submission
+        # Handle video download form submission: queue the job and return straight away
         if request.method == 'POST':
             form = VideoDownloadForm(request.POST)
             if form.is_valid():
-                video_quality = form.cleaned_data['video_quality']
+                return _enqueue_download(request, video_id, form.cleaned_data['video_quality'])
 
-                # Start async download process
-                processor._update_status('downloading', 0, 'Starting download process...')
+        form = VideoDownloadForm()
 
-                try:
-                    # Call the download function
-                    video_name, temp_dir = download_video_with_best_audio(request, video_id, video_quality, processor)
-
-                    if video_name and temp_dir:
-                        processor._update_status('completed', 100, 'Download completed successfully')
-                        return render(request, 'download.html', {
-                            'video_name': video_name,
-                            'temp_dir': temp_dir,
-                            'video': video
-                        })
-                    else:
-                        processor._update_status('error', 0, 'Download failed')
-                        return render(request, 'error_page.html', {
-                            'error_message': 'Download failed. Please try again.'
-                        })
-                except Exception as e:
-                    logger.error(f"Download error for {video_id}: {str(e)}")
-                    processor._update_status('error', 0, f'Download failed: {str(e)}')
-                    return render(request, 'error_page.html', {
-                        'error_message': f'Download failed: {str(e)}'
-                    })
-        else:
-            form = VideoDownloadForm()
+        # Stream analysis runs in the background, the page loads the options from stream_options
+        prefetch_stream_manifest(video_id, retry_failed=True)
+        processor._update_status('completed', 100, 'Ready for download')
 
         # Add additional context for template
         context = {
             'video': video,
-            'video_audio_qualities': video_audio_qualities,
-            'video_qualities': video_qualities,
-            'audio_qualities': filtered_audio_qualities,
             'form': form,
-            'video_qualities_count': len(video_qualities),
-            'audio_qualities_count': len(filtered_audio_qualities),
             'processor': processor
         }
 
@@ -478,8 +537,98 @@ def sanitize_video_title(title):
     return sanitized_title
 
 
-def download_video_with_best_audio(request, video_id, video_quality, processor=None):
+def _enqueue_download(request, video_id, video_quality):
+    """Queue a download job for the current session and send the user to its progress page"""
+    if not request.session.session_key:
+        request.session.create()
+
+    try:
+        job = DownloadJobManager.enqueue(video_id, video_quality, request.session.session_key)
+    except JobQueueFull:
+        return render(request, 'error_page.html', {
+            'error_message': 'The server is busy processing other downloads. Please try again in a minute.'
+        })
+
+    if request.headers.get('Accept', '').startswith('application/json'):
+        return JsonResponse({
+            'job_id': job['job_id'],
+            'status': job['status'],
+            'status_url': reverse('FetchVideoApp:job_status', kwargs={'job_id': job['job_id']}),
+        }, status=202)
+    return redirect('FetchVideoApp:download_job', job_id=job['job_id'])
+
+
+@require_POST
+def start_download(request, video_id, video_quality):
+    """Queue a download for the given video and quality"""
+    if not video_id or len(video_id) != 11:
+        return render(request, 'error_page.html', {
+            'error_message': 'Invalid video ID format'
+        })
+    return _enqueue_download(request, video_id, video_quality)
+
+
+# Shared by all download workers in this process so identical downloads only run once
+download_flight = SingleFlight(
+    lock_timeout=getattr(settings, 'SINGLE_FLIGHT_LOCK_TIMEOUT', 300),
+    wait_timeout=getattr(settings, 'SINGLE_FLIGHT_WAIT_TIMEOUT', 3600),
+)
+
+
+def download_video_with_best_audio(session_key, video_id, video_quality, processor=None):
+    """Download, convert and merge the streams for a video (runs inside a job worker)
+
+    Concurrent requests for the same video and quality are collapsed into a
+    single build of the merged file; every caller then links the stored file
+    into its own session directory. Returns (filename, session dir relative
+    to MEDIA_ROOT, content key of the stored file), or (None, None, None) if
+    the download failed.
+    """
     from .session_manager import SessionTempManager, VideoCacheManager
+    from .artifact_store import ArtifactStore
+
+    waited = []
+
+    def on_wait():
+        waited.append(True)
+        if processor:
+            processor._update_status('downloading', 5, 'Waiting for an identical download already in progress...')
+
+    artifact = download_flight.do(
+        VideoCacheManager.get_cache_key(video_id, video_quality),
+        lambda: _build_merged_video(video_id, video_quality, processor),
+        on_wait=on_wait
+    )
+    if not artifact:
+        if waited and processor:
+            processor._update_status('error', 0, 'The identical download this one waited for failed')
+        return None, None, None
+
+    stored_path, filename = artifact
+    try:
+        session_dir = SessionTempManager.get_session_temp_dir_for_key(session_key)
+        ArtifactStore.link_into_session(stored_path, session_dir, filename)
+    except OSError as e:
+        error_msg = f"Could not prepare the video for this session: {str(e)}"
+        logger.error(f"Linking {stored_path} for session failed: {error_msg}")
+        if processor:
+            processor._update_status('error', 0, error_msg)
+        return None, None, None
+
+    if waited and processor:
+        processor._update_status('completed', 100, 'Video ready!')
+    return filename, os.path.relpath(session_dir, settings.MEDIA_ROOT), ArtifactStore.content_key(stored_path)
+
+
+def _build_merged_video(video_id, video_quality, processor=None):
+    """Path and file name of the merged video, built unless it is already stored
+
+    Runs once per video and quality at a time (see download_video_with_best_audio)
+    and never touches a session directory. Returns (stored_path, filename), or
+    None if the video couldn't be built.
+    """
+    from .session_manager import VideoCacheManager
+    from .artifact_store import ArtifactStore
 
     video = fetch_video_details(video_id)
 
@@ -487,60 +636,54 @@ def download_video_with_best_audio(request, video_id, video_quality, processor=N
         error_msg = "Video details not found"
         if processor:
             processor._update_status('error', 0, error_msg)
-        return None, None
+        return None
 
     try:
-        if processor:
-            processor._update_status('downloading', 5, 'Creating temporary directory...')
-
         # Check if video is already cached
         cached_video = VideoCacheManager.is_video_cached(video_id, video_quality)
+        metrics.merged_video_cache.inc(result='hit' if cached_video else 'miss')
         if cached_video:
             if processor:
                 processor._update_status('completed', 100, 'Video loaded from cache!')
             cached_file_path = cached_video['file_path']
-            # Return relative path from MEDIA_ROOT
-            relative_path = os.path.relpath(os.path.dirname(cached_file_path), settings.MEDIA_ROOT)
-            filename = os.path.basename(cached_file_path)
-            return filename, relative_path
-
-        # Create session-based temporary directory
-        temp_dir = SessionTempManager.get_session_temp_dir(request)
-
-        youtube_link = f'https://www.youtube.com/watch?v={video.video_id}'
+            if ArtifactStore.contains(cached_file_path):
+                ArtifactStore.mark_used(cached_file_path)
+            return cached_file_path, cached_video['metadata'].get('filename') or os.path.basename(cached_file_path)
 
         if processor:
             processor._update_status('downloading', 10, 'Connecting to YouTube...')
 
-        yt = YouTube(youtube_link)
+        # Usually already cached by the detail page
+        manifest = get_stream_manifest(video_id)
 
         if processor:
             processor._update_status('downloading', 15, 'Finding video stream...')
 
         # Try to get the video stream with the selected quality
-        video_stream = yt.streams.filter(type="video", resolution=video_quality).first()
+        matching_streams = manifest.filter(type="video", resolution=video_quality)
+        video_stream = matching_streams[0] if matching_streams else None
 
         if not video_stream:
             # Try alternative approach - find closest quality
-            available_resolutions = [s.resolution for s in yt.streams.filter(type="video") if s.resolution]
+            available_resolutions = [s.resolution for s in manifest.filter(type="video") if s.resolution]
             if available_resolutions:
                 # Find closest resolution
                 target_height = int(video_quality.split('p')[0])
                 closest_resolution = min(available_resolutions,
                     key=lambda x: abs(int(x.split('p')[0]) - target_height))
-                video_stream = yt.streams.filter(type="video", resolution=closest_resolution).first()
+                video_stream = manifest.filter(type="video", resolution=closest_resolution)[0]
 
         if not video_stream:
             error_msg = f"No video stream found for quality {video_quality}"
             if processor:
                 processor._update_status('error', 0, error_msg)
-            return None, None
+            return None
 
         if processor:
             processor._update_status('downloading', 20, 'Finding audio stream...')
 
         # Get available audio streams with improved selection
-        audio_streams = yt.streams.filter(type="audio")
+        audio_streams = manifest.audio_streams()
 
         # Priority: webm > mp4 for audio quality
         webm_audio = [s for s in audio_streams if s.mime_type == 'audio/webm']
@@ -558,138 +701,105 @@ def download_video_with_best_audio(request, video_id, video_quality, processor=N
             error_msg = "No suitable audio stream found"
             if processor:
                 processor._update_status('error', 0, error_msg)
-            return None, None
-
-        if processor:
-            processor._update_status('downloading', 30, 'Downloading video stream...')
+            return None
 
-        # Download video stream
-        video_format = video_stream.subtype
         fps = int(video_stream.fps) if video_stream.fps else 30
-        video_path = os.path.join(temp_dir, f"{video.video_id}_video.{video_format}")
+        merged_filename = f"{sanitize_video_title(video.title)}_-_{video_quality}_{fps}fps.mp4"
+        cache_metadata = {
+            'title': video.title,
+            'duration': getattr(video, 'duration', None),
+            'author': getattr(video, 'author', None),
+            'filename': merged_filename
+        }
 
-        try:
-            video_stream.download(output_path=temp_dir, filename=os.path.basename(video_path))
-        except Exception as e:
-            error_msg = f"Failed to download video stream: {str(e)}"
+        # Another session may already have built this exact video/audio combination
+        artifact_key = ArtifactStore.artifact_key(video_id, video_stream.itag, audio_stream.itag, 'mp4')
+        stored_path = ArtifactStore.get(artifact_key, 'mp4')
+        if stored_path:
+            VideoCacheManager.cache_video(video_id=video_id, quality=video_quality,
+                                          file_path=stored_path, metadata=cache_metadata)
             if processor:
-                processor._update_status('error', 0, error_msg)
-            return None, None
+                processor._update_status('completed', 100, 'Video loaded from cache!')
+            return stored_path, merged_filename
 
-        if processor:
-            processor._update_status('downloading', 60, 'Downloading audio stream...')
+        # SABR streams can't be fetched by URL, they need pytubefix's own downloader
+        if video_stream.is_sabr:
+            video_stream = get_pytubefix_stream(video_id, video_stream.itag)
+        if audio_stream.is_sabr:
+            audio_stream = get_pytubefix_stream(video_id, audio_stream.itag)
 
-        # Download audio stream
-        audio_path = os.path.join(temp_dir, f"{video.video_id}_audio.{audio_stream.subtype}")
+        # Build the artifact in a private scratch directory
+        temp_dir = ArtifactStore.create_work_dir()
 
         try:
-            audio_stream.download(output_path=temp_dir, filename=os.path.basename(audio_path))
-        except Exception as e:
-            error_msg = f"Failed to download audio stream: {str(e)}"
-            if processor:
-                processor._update_status('error', 0, error_msg)
-            return None, None
+            # Download video and audio streams at the same time
+            video_path = os.path.join(temp_dir, f"{video.video_id}_video.{video_stream.subtype}")
+            audio_path = os.path.join(temp_dir, f"{video.video_id}_audio.{audio_stream.subtype}")
 
-        # Verify downloads
-        if not os.path.exists(video_path) or not os.path.exists(audio_path):
-            error_msg = "Downloaded files not found"
-            if processor:
-                processor._update_status('error', 0, error_msg)
-            return None, None
-
-        if processor:
-            processor._update_status('downloading', 70, 'Processing audio format...')
+            def on_stream_progress(fraction, bytes_done, bytes_total):
+                if processor:
+                    processor._update_status(
+                        'downloading', 30 + int(fraction * 40),
+                        f"Downloading streams... {format_file_size(bytes_done)} of {format_file_size(bytes_total)}",
+                        bytes_done=bytes_done, bytes_total=bytes_total
+                    )
 
-        audio_format = os.path.splitext(audio_path)[1].lstrip('.')
+            def on_stream_done(name, seconds, size):
+                metrics.stream_bytes.inc(size, stream=name)
+                log_processing(video_id, f'{name}_fetch', 'success', f'{size} bytes at {video_quality}', seconds)
 
-        # Convert audio to compatible format if needed
-        if audio_format in ['mp4', 'webm']:
-            m4a_audio_path = os.path.join(temp_dir, f"{video.video_id}_audio.m4a")
+            if processor:
+                processor._update_status('downloading', 30, 'Downloading video and audio streams...')
 
             try:
-                if audio_format == 'mp4':
-                    cmd = f'"{FFmpeg_PATH}" -i "{audio_path}" -vn -c:a copy "{m4a_audio_path}"'
-                elif audio_format == 'webm':
-                    cmd = f'"{FFmpeg_PATH}" -i "{audio_path}" -vn -c:a aac -strict -2 "{m4a_audio_path}"'
-
-                process = subprocess.Popen(shlex.split(cmd),
-                                         stdout=subprocess.PIPE,
-                                         stderr=subprocess.PIPE,
-                                         creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0)
-                stdout, stderr = process.communicate(timeout=300)  # 5 minute timeout
-
-                if process.returncode != 0:
-                    error_msg = f"Audio conversion failed: {stderr.decode('utf-8', errors='ignore')}"
-                    if processor:
-                        processor._update_status('error', 0, error_msg)
-                    return None, None
-
-                # Replace audio path
-                os.remove(audio_path)
-                audio_path = m4a_audio_path
-
-            except subprocess.TimeoutExpired:
-                error_msg = "Audio conversion timed out"
+                download_streams_concurrently([
+                    ('video', video_stream, video_path),
+                    ('audio', audio_stream, audio_path),
+                ], on_progress=on_stream_progress, on_stream_done=on_stream_done)
+            except StreamDownloadError as e:
+                log_processing(video_id, f'{e.name}_fetch', 'error', str(e.error))
                 if processor:
-                    processor._update_status('error', 0, error_msg)
-                return None, None
-            except Exception as e:
-                error_msg = f"Audio conversion error: {str(e)}"
+                    processor._update_status('error', 0, str(e))
+                return None
+
+            # Verify downloads
+            if not os.path.exists(video_path) or not os.path.exists(audio_path):
+                error_msg = "Downloaded files not found"
                 if processor:
                     processor._update_status('error', 0, error_msg)
-                return None, None
-
-        if processor:
-            processor._update_status('downloading', 80, 'Merging video and audio...')
+                return None
 
-        # Merge video and audio
-        merged_filename = f"{sanitize_video_title(video.title)}_-_{video_quality}_{fps}fps.mp4"
-        merged_path = os.path.join(temp_dir, merged_filename)
-
-        try:
-            cmd = f'"{FFmpeg_PATH}" -i "{video_path}" -i "{audio_path}" -c:v copy -c:a copy -avoid_negative_ts make_zero "{merged_path}"'
+            if processor:
+                processor._update_status('downloading', 75, 'Merging video and audio...')
 
-            process = subprocess.Popen(shlex.split(cmd),
-                                     stdout=subprocess.PIPE,
-                                     stderr=subprocess.PIPE,
-                                     creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0)
-            stdout, stderr = process.communicate(timeout=600)  # 10 minute timeout
+            # Merge video and audio in one FFmpeg pass (audio is only transcoded if MP4 can't hold it)
+            merged_path = os.path.join(temp_dir, f"{artifact_key}.mp4")
 
-            if process.returncode != 0:
-                error_msg = f"Merging failed: {stderr.decode('utf-8', errors='ignore')}"
+            try:
+                # Conversion (when needed) happens in the same pass, so it is one logged stage
+                with timed_stage(video_id, 'merge', f'audio codec {audio_stream.audio_codec}'):
+                    merge_streams(video_path, audio_path, merged_path, audio_codec=audio_stream.audio_codec)
+            except FFmpegError as e:
+                error_msg = f"Merging failed: {str(e)}"
                 if processor:
                     processor._update_status('error', 0, error_msg)
-                return None, None
+                return None
 
-        except subprocess.TimeoutExpired:
-            error_msg = "Video merging timed out"
-            if processor:
-                processor._update_status('error', 0, error_msg)
-            return None, None
-        except Exception as e:
-            error_msg = f"Merging error: {str(e)}"
-            if processor:
-                processor._update_status('error', 0, error_msg)
-            return None, None
+            # Verify merged file
+            if not os.path.exists(merged_path):
+                error_msg = "Merged video file not created"
+                if processor:
+                    processor._update_status('error', 0, error_msg)
+                return None
 
-        # Verify merged file
-        if not os.path.exists(merged_path):
-            error_msg = "Merged video file not created"
             if processor:
-                processor._update_status('error', 0, error_msg)
-            return None, None
+                processor._update_status('downloading', 90, 'Saving merged video...')
 
-        if processor:
-            processor._update_status('downloading', 90, 'Cleaning up temporary files...')
-
-        # Clean up temporary files
-        try:
-            if os.path.exists(video_path):
-                os.remove(video_path)
-            if os.path.exists(audio_path):
-                os.remove(audio_path)
-        except Exception as e:
-            logger.warning(f"Failed to clean up temporary files: {str(e)}")
+            # Publish the merged file to the store (callers link it into their sessions)
+            stored_path = ArtifactStore.put(merged_path, artifact_key, 'mp4')
+        finally:
+            # Scratch files are never needed once the artifact is stored (or the build failed)
+            shutil.rmtree(temp_dir, ignore_errors=True)
 
         if processor:
             processor._update_status('completed', 100, 'Download completed successfully!')
@@ -698,44 +808,49 @@ def download_video_with_best_audio(request, video_id, video_quality, processor=N
         VideoCacheManager.cache_video(
             video_id=video_id,
             quality=video_quality,
-            file_path=merged_path,
-            metadata={
-                'title': video.title,
-                'duration': getattr(video, 'duration', None),
-                'author': getattr(video, 'author', None)
-            }
+            file_path=stored_path,
+            metadata=cache_metadata
         )
 
-        relative_temp_dir = os.path.relpath(temp_dir, settings.MEDIA_ROOT)
-        return merged_filename, relative_temp_dir
+        return stored_path, merged_filename
 
     except Exception as e:
         error_msg = f"Unexpected download error: {str(e)}"
         logger.error(f"Download error for {video_id}: {error_msg}")
         if processor:
             processor._update_status('error', 0, error_msg)
-        return None, None
+        return None
 
 
 def download(request, temp_dir, video_name):
-    """Enhanced download function with better error handling"""
+    """Stream a merged video to the browser (supports resuming via Range requests)"""
     try:
-        # Construct the relative path to the video file
-        relative_video_path = os.path.join(settings.MEDIA_ROOT, temp_dir, video_name)
+        # Construct the path to the video file and make sure it stays inside MEDIA_ROOT
+        media_root = os.path.abspath(settings.MEDIA_ROOT)
+        video_path = os.path.abspath(os.path.join(media_root, temp_dir, video_name))
+        if not video_path.startswith(media_root + os.sep):
+            logger.warning(f"Rejected download outside MEDIA_ROOT: {temp_dir}/{video_name}")
+            return HttpResponseNotFound("Error: Video file not found.")
 
         # Verify file existence
-        if not os.path.exists(relative_video_path):
-            logger.error(f"Video file not found: {relative_video_path}")
+        if not os.path.isfile(video_path):
+            logger.error(f"Video file not found: {video_path}")
             return HttpResponseNotFound("Error: Video file not found.")
 
-        # Get file size for progress indication
-        file_size = os.path.getsize(relative_video_path)
+        job = _get_session_job(request, request.GET['job']) if request.GET.get('job') else None
+        if job and (job['temp_dir'] != temp_dir or job['video_name'] != video_name):
+            job = None
 
-        with open(relative_video_path, 'rb') as video_file:
-            response = HttpResponse(video_file.read(), content_type='video/mp4')
-            response['Content-Disposition'] = f'attachment; filename="{video_name}"'
-            response['Content-Length'] = file_size
-            return response
+        # The job knows the stored file's content key, which keeps the ETag stable across sessions
+        response = ranged_file_response(request, video_path, video_name, content_key=job and job.get('content_key'))
+
+        # Count the download once: on the full response or the first range, not on resumes
+        if job:
+            if response.status_code == 200 or response.get('Content-Range', '').startswith('bytes 0-'):
+                record_download(request, job['video_id'], job['video_quality'], os.path.getsize(video_path))
+                video_counters.increment(job['video_id'], 'download_count')
+
+        return response
 
     except FileNotFoundError:
         logger.error(f"Video file not found: {temp_dir}/{video_name}")
@@ -749,9 +864,7 @@ def download(request, temp_dir, video_name):
 def get_processing_status(request, video_id):
     """API endpoint to get video processing status"""
     try:
-        processor = VideoProcessor(video_id)
-        status = processor.get_status()
-        return JsonResponse(status)
+        return JsonResponse(VideoProcessor.read_status(video_id))
     except Exception as e:
         logger.error(f"Status check error for {video_id}: {str(e)}")
         return JsonResponse({
@@ -761,6 +874,112 @@ def get_processing_status(request, video_id):
             'timestamp': datetime.now().isoformat()
         })
 
+def _get_session_job(request, job_id):
+    """Return the job if it belongs to the requesting session"""
+    job = DownloadJobManager.get_job(job_id)
+    if not job or job['session_key'] != request.session.session_key:
+        return None
+    return job
+
+
+def download_job(request, job_id):
+    """Progress page for a queued download; shows the download link once the job completes"""
+    job = _get_session_job(request, job_id)
+    if not job:
+        return render(request, 'error_page.html', {
+            'error_message': 'This download was not found or has expired.',
+            'status_code': 404
+        })
+
+    if job['status'] == 'failed':
+        return render(request, 'error_page.html', {
+            'error_message': f"Download failed: {job['message']}"
+        })
+
+    return render(request, 'download.html', {
+        'job': job,
+        'video_name': job['video_name'],
+        'temp_dir': job['temp_dir'],
+        'video': fetch_video_details(job['video_id'])
+    })
+
+
+def get_job_status(request, job_id):
+    """API endpoint to get the status of a download job"""
+    job = _get_session_job(request, job_id)
+    if not job:
+        return JsonResponse({'status': 'not_found', 'message': 'Job not found'}, status=404)
+
+    return JsonResponse(DownloadJobManager.status_snapshot(job))
+
+
+async def job_events(request, job_id):
+    """Server-Sent Events stream of a job's progress (serve under ASGI)"""
+    job = await sync_to_async(_get_session_job)(request, job_id)
+    if not job:
+        return JsonResponse({'status': 'not_found', 'message': 'Job not found'}, status=404)
+
+    pubsub = get_pubsub()
+    channel = job_channel(job_id)
+    get_job = sync_to_async(DownloadJobManager.get_job)
+    status_snapshot = sync_to_async(DownloadJobManager.status_snapshot)  # Reads the cache
+    heartbeat = getattr(settings, 'PROGRESS_SSE_HEARTBEAT', 15)
+    max_duration = getattr(settings, 'PROGRESS_SSE_MAX_DURATION', 3600)
+
+    async def event_stream():
+        # Start with a snapshot so late subscribers know where the job is
+        snapshot = await status_snapshot(job)
+        yield f"data: {json.dumps(snapshot)}\n\n"
+        if snapshot['status'] in DownloadJobManager.TERMINAL_STATUSES:
+            return
+
+        cursor = request.headers.get('Last-Event-ID', '0')
+        deadline = time.monotonic() + max_duration
+        while time.monotonic() < deadline:
+            events = await pubsub.wait_for_async(channel, cursor, heartbeat)
+            if not events:
+                # The terminal event may have been missed (published in another process
+                # without a shared channel, or trimmed from the stream): check the job itself
+                current = await get_job(job_id)
+                if not current or current['status'] in DownloadJobManager.TERMINAL_STATUSES:
+                    final = (await status_snapshot(current) if current
+                             else {'status': 'not_found', 'message': 'Job not found'})
+                    yield f"data: {json.dumps(final)}\n\n"
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            for event_id, data in events:
+                cursor = event_id
+                yield f"id: {event_id}\ndata: {json.dumps(data)}\n\n"
+                if data.get('status') in DownloadJobManager.TERMINAL_STATUSES:
+                    return
+        # Lifetime cap reached: EventSource reconnects with Last-Event-ID and resumes from there
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+    return response
+
+
+def job_events_poll(request, job_id):
+    """Long-poll fallback for job_events: waits for events newer than ?cursor="""
+    job = _get_session_job(request, job_id)
+    if not job:
+        return JsonResponse({'status': 'not_found', 'message': 'Job not found'}, status=404)
+
+    cursor = request.GET.get('cursor', '0')
+    events = []
+    if job['status'] not in DownloadJobManager.TERMINAL_STATUSES:
+        events = get_pubsub().wait_for(job_channel(job_id), cursor, getattr(settings, 'PROGRESS_LONG_POLL_TIMEOUT', 25))
+        job = DownloadJobManager.get_job(job_id) or job
+
+    return JsonResponse({
+        'job': DownloadJobManager.status_snapshot(job),
+        'events': [data for _, data in events],
+        'cursor': events[-1][0] if events else cursor,
+    })
+
+
 def validate_youtube_url(request):
     """API endpoint to validate YouTube URLs"""
     if request.method == 'POST':
@@ -771,6 +990,13 @@ def validate_youtube_url(request):
             if not url:
                 return JsonResponse({'valid': False, 'message': 'URL is required'})
 
+            if not is_valid_youtube_url(url) and is_playlist_url(url):
+                return JsonResponse({
+                    'valid': True,
+                    'type': 'playlist',
+                    'message': 'Valid YouTube playlist or channel URL'
+                })
+
             if not is_valid_youtube_url(url):
                 return JsonResponse({'valid': False, 'message': 'Invalid YouTube URL format'})
 
@@ -780,6 +1006,7 @@ def validate_youtube_url(request):
 
             return JsonResponse({
                 'valid': True,
+                'type': 'video',
                 'video_id': video_id,
                 'message': 'Valid YouTube URL'
             })
@@ -792,33 +1019,170 @@ def validate_youtube_url(request):
 
     return JsonResponse({'valid': False, 'message': 'Method not allowed'})
 
+def _parse_batch_items(request):
+    """(video_id, quality) pairs from a JSON body or urls[]/qualities[] form fields"""
+    default_quality = getattr(settings, 'BATCH_DEFAULT_QUALITY', '720p')
+    if request.content_type == 'application/json':
+        data = json.loads(request.body)
+        entries = [
+            (video.get('url') or video.get('video_id', ''), video.get('quality') or default_quality)
+            for video in data.get('videos', [])
+        ]
+    else:
+        urls = request.POST.getlist('urls[]')
+        qualities = request.POST.getlist('qualities[]')
+        entries = [
+            (url, qualities[i] if i < len(qualities) and qualities[i] else default_quality)
+            for i, url in enumerate(urls)
+        ]
+
+    items = []
+    for value, quality in entries:
+        value = value.strip()
+        if len(value) == 11 and re.fullmatch(r'[\w-]{11}', value):
+            items.append((value, quality))
+        elif value and is_valid_youtube_url(value):
+            video_id = get_video_id(value)
+            if video_id:
+                items.append((video_id, quality))
+    return items
+
+
+@require_POST
 def batch_download(request):
-    """Handle batch video downloads"""
-    if request.method == 'POST':
-        try:
-            urls = request.POST.getlist('urls[]')
-            if not urls:
-                return JsonResponse({'error': 'No URLs provided'})
-
-            results = []
-            for url in urls[:10]:  # Limit to 10 videos
-                url = url.strip()
-                if url and is_valid_youtube_url(url):
-                    video_id = get_video_id(url)
-                    if video_id:
-                        results.append({
-                            'url': url,
-                            'video_id': video_id,
-                            'status': 'queued'
-                        })
-
-            return JsonResponse({'results': results})
+    """Queue downloads for several videos at once and return the batch id"""
+    try:
+        items = _parse_batch_items(request)
+    except (json.JSONDecodeError, AttributeError):
+        return JsonResponse({'error': 'Invalid JSON data'}, status=400)
 
-        except Exception as e:
-            logger.error(f"Batch download error: {str(e)}")
-            return JsonResponse({'error': 'Batch processing failed'})
+    if not items:
+        return JsonResponse({'error': 'No valid YouTube URLs provided'}, status=400)
 
-    return JsonResponse({'error': 'Method not allowed'})
+    max_videos = getattr(settings, 'BATCH_MAX_VIDEOS', 10)
+    if len(items) > max_videos:
+        return JsonResponse({'error': f'A batch can contain at most {max_videos} videos'}, status=400)
+
+    if not request.session.session_key:
+        request.session.create()
+
+    try:
+        batch = BatchManager.submit(items, request.session.session_key)
+    except Exception as e:
+        logger.error(f"Batch download error: {str(e)}")
+        return JsonResponse({'error': 'Batch processing failed'}, status=500)
+
+    return JsonResponse({
+        'batch_id': batch['batch_id'],
+        'status': batch['status'],
+        'items': [{'video_id': i['video_id'], 'video_quality': i['video_quality']} for i in batch['items']],
+        'status_url': reverse('FetchVideoApp:batch_status', kwargs={'batch_id': batch['batch_id']}),
+        'zip_url': reverse('FetchVideoApp:batch_zip', kwargs={'batch_id': batch['batch_id']}),
+    }, status=202)
+
+
+def _get_session_batch(request, batch_id):
+    """Return the batch if it belongs to the requesting session"""
+    batch = BatchManager.get_batch(batch_id)
+    if not batch or batch['session_key'] != request.session.session_key:
+        return None
+    return batch
+
+
+def batch_status(request, batch_id):
+    """API endpoint with the aggregated progress of a batch"""
+    batch = _get_session_batch(request, batch_id)
+    if not batch:
+        return JsonResponse({'status': 'not_found', 'message': 'Batch not found'}, status=404)
+    return JsonResponse(BatchManager.status_snapshot(batch))
+
+
+def batch_zip(request, batch_id):
+    """Stream the finished videos of a batch as one ZIP archive"""
+    batch = _get_session_batch(request, batch_id)
+    if not batch:
+        return HttpResponseNotFound("Error: Batch not found.")
+
+    files = BatchManager.completed_files(batch)
+    if not files:
+        return HttpResponseNotFound("Error: No finished videos in this batch yet.")
+
+    response = StreamingHttpResponse(stream_zip(files), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="fetchvideo_{batch_id[:8]}.zip"'
+    return response
+
+@require_POST
+def playlist_ingest(request):
+    """Start ingesting a playlist or channel and downloading its videos in batches"""
+    try:
+        data = json.loads(request.body) if request.content_type == 'application/json' else request.POST
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON data'}, status=400)
+
+    url = (data.get('url') or '').strip()
+    if not is_playlist_url(url):
+        return JsonResponse({'error': 'Not a YouTube playlist or channel URL'}, status=400)
+
+    if not request.session.session_key:
+        request.session.create()
+
+    download = str(data.get('download', 'true')).lower() not in ('0', 'false', 'no')
+    ingest = PlaylistIngestManager.start(
+        url, request.session.session_key,
+        data.get('quality') or getattr(settings, 'BATCH_DEFAULT_QUALITY', '720p'),
+        download=download
+    )
+    return JsonResponse({
+        'ingest_id': ingest.ingest_id,
+        'status': ingest.status,
+        'status_url': reverse('FetchVideoApp:playlist_status', kwargs={'ingest_id': ingest.ingest_id}),
+    }, status=202)
+
+
+def _get_session_ingest(request, ingest_id):
+    """Return the playlist ingest if it belongs to the requesting session"""
+    return PlaylistIngest.objects.filter(ingest_id=ingest_id, session_key=request.session.session_key or '').first()
+
+
+def playlist_status(request, ingest_id):
+    """API endpoint with the progress of a playlist ingest"""
+    ingest = _get_session_ingest(request, ingest_id)
+    if not ingest:
+        return JsonResponse({'status': 'not_found', 'message': 'Playlist not found'}, status=404)
+    if ingest.status == 'running' and PlaylistIngestManager.fail_stalled(ingest_id=ingest.ingest_id):
+        ingest.refresh_from_db()
+    return JsonResponse(PlaylistIngestManager.status_snapshot(ingest))
+
+
+def playlist_detail(request, ingest_id):
+    """Progress page of a playlist ingest started from the index form"""
+    ingest = _get_session_ingest(request, ingest_id)
+    if not ingest:
+        return render(request, 'error_page.html', {
+            'error_message': 'Playlist not found. It may belong to an expired session.',
+            'status_code': 404
+        }, status=404)
+    return render(request, 'playlist.html', {'ingest': ingest})
+
+
+@require_POST
+def playlist_resume(request, ingest_id):
+    """Resume an interrupted playlist ingest from its last processed entry"""
+    ingest = _get_session_ingest(request, ingest_id)
+    if not ingest:
+        return JsonResponse({'status': 'not_found', 'message': 'Playlist not found'}, status=404)
+    resumed = PlaylistIngestManager.resume(ingest)
+    return JsonResponse(dict(PlaylistIngestManager.status_snapshot(ingest), resumed=resumed), status=202 if resumed else 200)
+
+def metrics_view(request):
+    """Prometheus metrics of all processes"""
+    allowed_ips = getattr(settings, 'METRICS_ALLOWED_IPS', [])
+    if allowed_ips and request.META.get('REMOTE_ADDR') not in allowed_ips:
+        return HttpResponse("Forbidden", status=403)
+
+    snapshot = metrics.registry.collect()
+    snapshot.update(metrics.cluster_metrics())
+    return HttpResponse(metrics.render(snapshot), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 def undefined_page(request, undefined_path):
     """Enhanced 404 page handler"""
@@ -836,6 +1200,23 @@ def index(request):
         if form.is_valid():
             youtube_link = form.cleaned_data['youtube_link'].strip()
 
+            # Playlists and channels are ingested in the background
+            if not is_valid_youtube_url(youtube_link) and is_playlist_url(youtube_link):
+                if not request.session.session_key:
+                    request.session.create()
+                try:
+                    ingest = PlaylistIngestManager.start(
+                        youtube_link, request.session.session_key,
+                        getattr(settings, 'BATCH_DEFAULT_QUALITY', '720p')
+                    )
+                except Exception as e:
+                    logger.error(f"Playlist ingest error for {youtube_link}: {str(e)}")
+                    return render(request, 'index.html', {
+                        'form': form,
+                        'error_message': 'Could not start downloading this playlist. Please try again.'
+                    })
+                return redirect('FetchVideoApp:playlist_detail', ingest_id=ingest.ingest_id)
+
             # Validate URL format
             if not is_valid_youtube_url(youtube_link):
                 return render(request, 'index.html', {
@@ -0,0 +1,16 @@
+"""
+Celery application for fetchVideoProject.
+
+Start a worker with:
+    celery -A fetchVideoProject worker -l info
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'fetchVideoProject.settings')
+
+app = Celery('fetchVideoProject')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
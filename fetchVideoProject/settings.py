@@ -135,13 +135,33 @@ STATICFILES_DIRS = [
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Caching configuration
+# A short-lived in-process LRU in front of a shared cache. Set REDIS_CACHE_URL
+# in production; without it the shared tier is a file-based cache, which all
+# processes on one host share (job records, single-flight lookups, player cache)
+# but which doesn't reach other hosts.
+REDIS_CACHE_URL = os.environ.get('REDIS_CACHE_URL')
+
 CACHES = {
     'default': {
+        'BACKEND': 'fetchVideoApp.cache_backends.TieredCache',
+        'TIMEOUT': 3600,  # 1 hour
+        'OPTIONS': {
+            'BACK_ALIAS': 'shared',
+            'LOCAL_MAX_ENTRIES': 1000,  # Entries kept in each process
+            'LOCAL_TIMEOUT': 5,  # Seconds a process may serve a value without asking the shared tier
+        }
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_CACHE_URL,
+        'TIMEOUT': 3600,
+        'KEY_PREFIX': 'fetchvideo',
+    } if REDIS_CACHE_URL else {
         'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
         'LOCATION': os.path.join(BASE_DIR, 'cache'),
-        'TIMEOUT': 3600,  # 1 hour
+        'TIMEOUT': 3600,
         'OPTIONS': {
-            'MAX_ENTRIES': 1000,
+            'MAX_ENTRIES': 10000,
         }
     }
 }
@@ -151,3 +171,117 @@ SESSION_ENGINE = 'django.contrib.sessions.backends.db'
 SESSION_COOKIE_AGE = 3600  # 1 hour
 SESSION_SAVE_EVERY_REQUEST = True
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
+
+# Download job queue
+# 'thread' runs downloads in an in-process pool (local development),
+# 'celery' sends them to Celery workers through Redis (production)
+DOWNLOAD_JOB_BACKEND = os.environ.get('DOWNLOAD_JOB_BACKEND', 'thread')
+DOWNLOAD_JOB_WORKERS = int(os.environ.get('DOWNLOAD_JOB_WORKERS', 4))
+DOWNLOAD_JOB_MAX_PENDING = 40  # Reject new jobs once this many are queued/running
+DOWNLOAD_JOB_TIMEOUT = 3600  # Job records expire after 1 hour
+
+# Celery configuration
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1  # Downloads are long, don't hoard them
+CELERY_TASK_ACKS_LATE = True
+
+# Identical downloads (same video and quality) are only processed once at a time.
+# The worker holding a download's lock refreshes it while it works; a lock not
+# refreshed for this long (in seconds) is considered abandoned by a crashed worker.
+SINGLE_FLIGHT_LOCK_TIMEOUT = 300
+SINGLE_FLIGHT_WAIT_TIMEOUT = 3600  # Seconds a worker waits for an identical download in another process
+
+# Shared store for merged videos (one copy per video/stream combination for all sessions)
+ARTIFACT_STORE_ROOT = os.path.join(MEDIA_ROOT, 'store')
+ARTIFACT_STORE_MAX_BYTES = 10 * 1024 ** 3  # 10 GB, least recently used files are evicted first (by the cleanup reaper)
+ARTIFACT_WORK_DIR_MAX_AGE = 3600  # Scratch dirs in store/.work/ not written to for this long are removed by the reaper
+
+# Video file delivery
+DOWNLOAD_CHUNK_SIZE = 256 * 1024  # Bytes read per chunk when streaming a download
+# Let the front-end server send files: 'X-Accel-Redirect' (nginx) or 'X-Sendfile' (Apache/lighttpd).
+# For nginx, DOWNLOAD_OFFLOAD_PREFIX must be an internal location aliased to MEDIA_ROOT.
+DOWNLOAD_OFFLOAD_HEADER = os.environ.get('DOWNLOAD_OFFLOAD_HEADER') or None
+DOWNLOAD_OFFLOAD_PREFIX = '/protected-media/'
+
+# Segmented stream downloads (parallel byte ranges per stream)
+DOWNLOAD_SEGMENTED = True
+DOWNLOAD_SEGMENT_SIZE = 8 * 1024 * 1024  # 8 MB per range request
+DOWNLOAD_SEGMENT_CONCURRENCY = 4  # Parallel connections per stream
+DOWNLOAD_SEGMENT_RETRIES = 3  # Retries per failed range
+
+# FFmpeg executable: the bundled build on Windows, the one on PATH elsewhere
+FFMPEG_PATH = os.environ.get('FFMPEG_PATH') or (
+    os.path.join(BASE_DIR, 'ffmpeg', 'bin', 'ffmpeg.exe') if os.name == 'nt' else 'ffmpeg'
+)
+
+# Background threads that extract stream manifests while the detail page renders
+MANIFEST_PREFETCH_WORKERS = 4
+STREAM_OPTIONS_POLL_INTERVAL = 1  # Seconds the detail page waits before asking for pending options again
+
+# Job progress push (Server-Sent Events with long-poll fallback)
+# 'memory' only works with DOWNLOAD_JOB_BACKEND = 'thread'; use 'redis' with Celery
+PROGRESS_PUBSUB_BACKEND = os.environ.get('PROGRESS_PUBSUB_BACKEND', 'memory')
+PROGRESS_PUBSUB_REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/1')
+PROGRESS_SSE_HEARTBEAT = 15  # Seconds between keep-alive comments on idle streams
+PROGRESS_SSE_MAX_DURATION = 3600  # Seconds an SSE stream stays open; the browser then reconnects with Last-Event-ID
+PROGRESS_LONG_POLL_TIMEOUT = 25  # Seconds a long-poll request waits for new events
+
+# Background cleanup reaper (cleanup_scheduler.py / cleanup_sessions command)
+CLEANUP_TIME_BUDGET = 30  # Seconds of work per cleanup cycle
+CLEANUP_BATCH_SIZE = 200  # Sessions or cache entries handled per batch
+CLEANUP_LOCK_TIMEOUT = 300  # Seconds before a crashed reaper's lock expires
+CLEANUP_RMTREE_WORKERS = 4  # Session directories removed in parallel
+
+# Batch downloads
+BATCH_MAX_VIDEOS = 10  # Videos accepted per batch request
+BATCH_DEFAULT_QUALITY = '720p'  # Used when a batch item doesn't name a quality
+BATCH_METADATA_WORKERS = 4  # Video details fetched in parallel per batch
+DOWNLOAD_PER_HOST_CONCURRENCY = 8  # Stream transfers per host and process
+PLAYLIST_MAX_VIDEOS = 500  # Entries ingested per playlist or channel
+PLAYLIST_METADATA_WORKERS = 4  # Playlist videos extracted in parallel
+PLAYLIST_BATCH_POLL_INTERVAL = 5  # Seconds between checks for a finished playlist chunk
+PLAYLIST_HEARTBEAT_INTERVAL = 30  # Seconds between heartbeats of a running playlist ingest
+PLAYLIST_STALL_TIMEOUT = 300  # Running ingests without a heartbeat for this long are marked failed
+PLAYLIST_QUEUE_TIMEOUT = 3600  # Queued ingests not picked up for this long are marked failed
+PLAYLIST_BATCH_TIMEOUT = 3600  # Seconds an ingest waits for a chunk's downloads before moving on
+
+# View and download counters are buffered and flushed in batches
+COUNTER_BACKEND = os.environ.get('COUNTER_BACKEND', 'memory')  # 'memory' or 'redis'
+COUNTER_REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/1')
+COUNTER_FLUSH_INTERVAL = 10  # Seconds between counter flushes
+
+# Processing logs and download history are written in batches
+HISTORY_BUFFER_SIZE = 200  # Buffered records that trigger an immediate flush
+HISTORY_FLUSH_INTERVAL = 10  # Seconds between history flushes
+
+# Prometheus metrics at /metrics
+METRICS_DIR = os.environ.get('METRICS_DIR')  # Shared snapshot directory for multi-process servers
+METRICS_WRITE_INTERVAL = 5  # Seconds between snapshot writes of each process
+METRICS_DISK_USAGE_TTL = 60  # Seconds MEDIA_ROOT usage is cached between scrapes
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']  # Clients allowed to scrape; empty allows everyone
+
+# Bulk video details (/api/videos/)
+VIDEO_DETAILS_MAX_IDS = 50  # Video IDs accepted per request
+VIDEO_DETAILS_WORKERS = 4  # Videos extracted from YouTube in parallel
+
+# Failed YouTube extractions
+NEGATIVE_CACHE_TTLS = {  # Seconds a failed extraction is not retried, per error class
+    'unavailable': 600,  # Private, removed, members only, ...
+    'throttled': 60,  # Rate limiting and bot checks
+    'error': 30,  # Network and parse errors
+}
+YOUTUBE_BREAKER_FAILURE_THRESHOLD = 5  # Consecutive failures that open the circuit breaker
+YOUTUBE_BREAKER_BASE_BACKOFF = 30  # Seconds the breaker stays open after the first trip
+YOUTUBE_BREAKER_MAX_BACKOFF = 900  # Upper bound of the doubling backoff
+
+# Outbound HTTP connection pooling (YouTube, googlevideo)
+HTTP_POOL_HOSTS = 16  # Hosts with a pool of keep-alive connections
+HTTP_POOL_MAXSIZE = DOWNLOAD_SEGMENT_CONCURRENCY * 4  # Connections kept per host
+HTTP_CONNECT_TIMEOUT = 5  # Seconds to establish a connection
+HTTP_READ_TIMEOUT = 30  # Seconds to wait for data on an open connection
+HTTP_POOL_PYTUBEFIX = True  # Route pytubefix's requests through the pool
+
+# YouTube player JS cache
+PLAYER_CACHE_DIR = os.environ.get('PLAYER_CACHE_DIR')  # Directory shared by the workers; None uses the shared cache
+PLAYER_CACHE_WARM = True  # Load the latest cached player at startup